@@ -1,8 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from backend.catalog import refresh_product_infos
 from backend.models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken
+    Contact, ConfirmEmailToken, ImportJob, OutgoingEmail, PriceListSource
 
 
 @admin.register(User)
@@ -48,7 +49,16 @@ class ParameterAdmin(admin.ModelAdmin):
 
 @admin.register(ProductParameter)
 class ProductParameterAdmin(admin.ModelAdmin):
-    pass
+    """Панель параметров: после удаления пересобирает записи каталога их предложений"""
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_product_infos(ProductInfo.objects.filter(id=obj.product_info_id))
+
+    def delete_queryset(self, request, queryset):
+        product_info_ids = list(queryset.values_list('product_info_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        refresh_product_infos(ProductInfo.objects.filter(id__in=product_info_ids))
 
 
 @admin.register(Order)
@@ -66,6 +76,22 @@ class ContactAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'url', 'mode', 'state', 'processed', 'created_at',)
+
+
+@admin.register(PriceListSource)
+class PriceListSourceAdmin(admin.ModelAdmin):
+    list_display = ('user', 'url', 'format', 'etag', 'last_modified', 'updated_at',)
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'state', 'attempts', 'next_attempt_at', 'sent_at',)
+    list_filter = ('state',)
+
+
 @admin.register(ConfirmEmailToken)
 class ConfirmEmailTokenAdmin(admin.ModelAdmin):
     list_display = ('user', 'key', 'created_at',)
\ No newline at end of file
@@ -6,5 +6,6 @@ class BackendConfig(AppConfig):
     name = 'backend'
 
     def ready(self):
-        """Импортируем сигналы"""
+        """Импортируем сигналы и проверки настроек"""
+        import backend.checks
         import backend.signals
\ No newline at end of file
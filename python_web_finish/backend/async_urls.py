@@ -0,0 +1,15 @@
+from django.urls import path
+
+from backend.async_views import AsyncProductInfoView, AsyncCategoryView, AsyncShopView, AsyncOrderView, \
+    AsyncPartnerUpdate
+
+app_name = 'backend-async'
+
+# адреса совпадают с backend.urls; под ASGI эти маршруты проверяются первыми (netology_pd_diplom.asgi_urls)
+urlpatterns = [
+    path('partner/update', AsyncPartnerUpdate.as_view(), name='partner-update'),
+    path('categories', AsyncCategoryView.as_view(), name='categories'),
+    path('shops', AsyncShopView.as_view(), name='shops'),
+    path('products', AsyncProductInfoView.as_view(), name='products'),
+    path('order', AsyncOrderView.as_view(), name='order'),
+]
@@ -0,0 +1,183 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.renderers import JSONRenderer
+
+from backend.cache import catalog_cache, catalog_scope, not_modified
+from backend.catalog import afill_quantities
+from backend.directory import adirectory_etag, aget_directory
+from backend.fast_serializers import ORDER_VALUES, serialize_catalog_entries, serialize_orders
+from backend.models import Order, order_total_sum
+from backend.pagination import KeysetPagination
+from backend.renderers import UJSONRenderer
+from backend.tasks import import_price_list_task
+from backend.views import ProductInfoView, CategoryView, ShopView, OrderView, PartnerUpdate
+
+# Асинхронные варианты самых нагруженных представлений для ASGI (netology_pd_diplom.asgi). Пока
+# представление ждет базу, кэш или загрузку прайс-листа, процесс обслуживает другие запросы.
+# Ответы совпадают с ответами представлений backend.views, остальные методы обрабатывают они же.
+
+
+class AsyncAPIView(View):
+    """Асинхронное представление с синхронным представлением DRF для остальных методов.
+
+    Аутентификация, права, выбор реплики, согласование формата и ответы об ошибках берутся
+    из представления sync_view, поэтому совпадают с ответами синхронных представлений.
+
+    Attributes:
+    - sync_view: Класс представления DRF с тем же адресом.
+    - renderer: Рендерер JSON-ответов.
+    """
+    sync_view = None
+    renderer = JSONRenderer()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # как и представления DRF, не проверяет CSRF: клиенты авторизуются токеном
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        if method == 'options' or not hasattr(self, method):
+            return await sync_to_async(self.sync_view.as_view())(request, *args, **kwargs)
+
+        # то же, что делает APIView.dispatch до вызова обработчика
+        self.view = view = self.sync_view()
+        view.args, view.kwargs = args, kwargs
+        request = view.initialize_request(request, *args, **kwargs)
+        view.request, view.headers = request, view.default_response_headers
+        try:
+            await sync_to_async(view.initial)(request, *args, **kwargs)
+            return await getattr(self, method)(request, *args, **kwargs)
+        except Exception as error:
+            response = view.finalize_response(request, await sync_to_async(view.handle_exception)(error),
+                                              *args, **kwargs)
+            return await sync_to_async(response.render)()
+
+    def render(self, data, **kwargs):
+        return HttpResponse(self.renderer.render(data), content_type='application/json', **kwargs)
+
+
+class AsyncProductInfoView(AsyncAPIView):
+    """Асинхронный вариант ProductInfoView"""
+    sync_view = ProductInfoView
+    renderer = UJSONRenderer()
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Retrieve the product information based on the specified filters.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - HttpResponse: A keyset-paginated page of the product information.
+        """
+        params = ProductInfoView.cache_params(request.query_params)
+        cache_key, etag = await catalog_cache.akey(catalog_scope(params.get('shop_id')),
+                                                   dict(params, host=request.get_host()))
+        if not_modified(request, etag):
+            return HttpResponse(status=304, headers={'ETag': etag})
+
+        data = await catalog_cache.aget(cache_key)
+        if data is None:
+            try:
+                queryset = ProductInfoView.catalog_queryset(request.query_params)
+            except ValueError:
+                return JsonResponse({'Status': False, 'Errors': 'Неправильно указан фильтр attr'}, status=400)
+
+            paginator = KeysetPagination(ordering=('product_info_id',))
+            page = await paginator.apaginate_queryset(queryset, request)
+            data = paginator.get_paginated_response(serialize_catalog_entries(page)).data
+            await catalog_cache.aset(cache_key, data)
+        else:
+            await afill_quantities(data['results'])
+
+        return self.render(data, headers={'ETag': etag})
+
+
+class AsyncDirectoryView(AsyncAPIView):
+    """Асинхронный вариант DirectoryView"""
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Retrieve a page of the precomputed directory.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - HttpResponse: A page of the directory with its ETag.
+        """
+        view = self.view
+        params = view.get_directory_params(request)
+        etag = await adirectory_etag(view.directory, page=request.query_params.get('page', ''),
+                                     host=request.get_host(), **params)
+        if not_modified(request, etag):
+            return HttpResponse(status=304, headers={'ETag': etag})
+
+        paginator = view.pagination_class()
+        page = paginator.paginate_queryset(await aget_directory(view.directory, **params), request)
+        return self.render(paginator.get_paginated_response(page).data, headers={'ETag': etag})
+
+
+class AsyncCategoryView(AsyncDirectoryView):
+    """Асинхронный вариант CategoryView"""
+    sync_view = CategoryView
+
+
+class AsyncShopView(AsyncDirectoryView):
+    """Асинхронный вариант ShopView"""
+    sync_view = ShopView
+
+
+class AsyncOrderView(AsyncAPIView):
+    """Асинхронный вариант OrderView.get; размещение и изменение заказов идут в OrderView"""
+    sync_view = OrderView
+    renderer = UJSONRenderer()
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Retrieve the details of user orders.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - HttpResponse: A keyset-paginated page of the user orders.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        orders = Order.objects.filter(user_id=request.user.id).exclude(state='basket').annotate(
+            total_sum=order_total_sum())
+        paginator = KeysetPagination(ordering=('-dt', '-id'))
+        page = await paginator.apaginate_queryset(orders.values(*ORDER_VALUES), request)
+        return self.render(paginator.get_paginated_response(await sync_to_async(serialize_orders)(page)).data)
+
+
+class AsyncPartnerUpdate(AsyncAPIView):
+    """Асинхронный вариант PartnerUpdate"""
+    sync_view = PartnerUpdate
+
+    async def post(self, request, *args, **kwargs):
+        """
+        Queue an import of the partner price list.
+
+        Without a Celery broker the task runs eagerly: the download and the import then run
+        in the thread of this request while the event loop keeps serving other requests.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - JsonResponse: The response indicating the status of the operation and any errors.
+        """
+        job, error = PartnerUpdate.check_request(request.user, request.data)
+        if error:
+            return error
+
+        await job.asave()
+        await sync_to_async(import_price_list_task.delay)(job.id)
+        return JsonResponse({'Status': True, 'Job': job.id})
@@ -0,0 +1,86 @@
+import re
+
+from django.db.models import Q
+
+from backend.models import ProductParameter
+
+# Нормализация значений параметров: из строки вроде "3.8 GHz" извлекаются число и единица измерения.
+# Единицы одной величины приводятся к общей (МГц -> ГГц, МБ -> ГБ), чтобы значения разных магазинов
+# можно было сравнивать. Результат хранится в ProductParameter.value_num и unit с индексом (parameter, value_num).
+
+# длина поля ProductParameter.unit
+UNIT_MAX_LENGTH = 10
+
+NUMBER_RE = re.compile(r'^\s*([-+]?\d+(?:[.,]\d+)?)\s*(\D*?)\s*$')
+
+# единица -> (общая единица, множитель)
+UNITS = {
+    'hz': ('ghz', 1e-9), 'khz': ('ghz', 1e-6), 'mhz': ('ghz', 1e-3), 'ghz': ('ghz', 1),
+    'гц': ('ghz', 1e-9), 'кгц': ('ghz', 1e-6), 'мгц': ('ghz', 1e-3), 'ггц': ('ghz', 1),
+    'kb': ('gb', 1 / 1024 ** 2), 'mb': ('gb', 1 / 1024), 'gb': ('gb', 1), 'tb': ('gb', 1024),
+    'кб': ('gb', 1 / 1024 ** 2), 'мб': ('gb', 1 / 1024), 'гб': ('gb', 1), 'тб': ('gb', 1024),
+    'w': ('w', 1), 'вт': ('w', 1), 'kw': ('w', 1000), 'квт': ('w', 1000),
+}
+
+
+def normalize_value(value):
+    """
+    Extract the number and the unit of a parameter value.
+
+    Args:
+    - value (str): The value as written in the price list, e.g. "3.8 GHz" or "8".
+
+    Returns:
+    - tuple: The number in the common unit and the common unit, or (None, '') if the value is not numeric.
+    """
+    match = NUMBER_RE.match(str(value))
+    if not match:
+        return None, ''
+    number, unit = float(match.group(1).replace(',', '.')), match.group(2).lower()
+    if len(unit) > UNIT_MAX_LENGTH:
+        # длинный хвост - это уже не единица измерения, а текст
+        return None, ''
+    if unit in UNITS:
+        unit, scale = UNITS[unit]
+        number = round(number * scale, 9)
+    return number, unit
+
+
+def parse_attribute_filter(spec):
+    """
+    Parse an attribute filter 'name:min..max' into a condition on ProductInfo IDs.
+
+    Either bound may be omitted ('cores:8..'), a single value means equality ('cores:8'). Bounds may have units,
+    they are normalized like the stored values: 'frequency:3.5..4 GHz' and 'frequency:3500 MHz..4 GHz' are equal.
+
+    Args:
+    - spec (str): The filter.
+
+    Returns:
+    - Q: The condition on 'product_info_id' of catalog entries.
+
+    Raises:
+    - ValueError: If the filter is malformed.
+    """
+    name, _, bounds = spec.partition(':')
+    if not name or not bounds:
+        raise ValueError(spec)
+    low, separator, high = bounds.partition('..')
+    if not separator:
+        high = low
+
+    # граница без единицы берет единицу другой границы: '3.5..4 GHz'
+    unit_hint = next((normalize_value(bound)[1] for bound in (low, high) if normalize_value(bound)[1]), '')
+    query = Q(parameter__name=name)
+    for bound, lookup in ((low, 'gte'), (high, 'lte')):
+        if not bound.strip():
+            continue
+        number, unit = normalize_value(bound)
+        if number is None:
+            raise ValueError(spec)
+        if not unit and unit_hint:
+            number, unit = normalize_value(f'{bound} {unit_hint}')
+        query &= Q(**{f'value_num__{lookup}': number})
+        if unit:
+            query &= Q(unit=unit)
+    return Q(product_info_id__in=ProductParameter.objects.filter(query).values('product_info_id'))
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from backend.models import User
+
+# поля пользователя, которые хранятся в кэше; из них для каждого запроса собирается новый объект User,
+# поэтому изменения request.user в одном запросе не попадают в другие. Пароль и профиль в кэш не попадают,
+# остальные поля User отложены: представления, которым они нужны, читают пользователя из базы
+USER_FIELDS = ('id', 'email', 'is_active', 'type')
+
+
+class TokenCache:
+    """Двухуровневый кэш токенов: ограниченный LRU в памяти процесса и необязательный общий кэш.
+
+    Записи LRU живут не дольше timeout секунд: отзыв токена в другом процессе удаляет запись
+    из общего кэша сразу, а из LRU этого процесса - по истечении timeout.
+
+    Attributes:
+    - size: Максимальное число записей LRU.
+    - timeout: Время жизни записи LRU.
+    - shared_alias: Алиас общего кэша из settings.CACHES или None.
+    - shared_timeout: Время жизни записи общего кэша.
+    """
+
+    def __init__(self, size, timeout, shared_alias=None, shared_timeout=None):
+        self.size = size
+        self.timeout = timeout
+        self.shared_alias = shared_alias
+        self.shared_timeout = shared_timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    @staticmethod
+    def shared_key(key):
+        return f'auth-token:{key}'
+
+    def get(self, key):
+        """
+        Return the cached token entry.
+
+        Args:
+        - key (str): The token key.
+
+        Returns:
+        - tuple: The creation time of the token and the user field values, or None.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.counters['local_hits'] += 1
+                return entry[1]
+
+        value = self.shared.get(self.shared_key(key)) if self.shared else None
+        with self.lock:
+            if value is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['shared_hits'] += 1
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+        if self.shared:
+            self.shared.set(self.shared_key(key), value, timeout=self.shared_timeout)
+
+    def invalidate(self, keys):
+        """Удаляет токены из обоих уровней кэша"""
+        keys = list(keys)
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        if self.shared and keys:
+            self.shared.delete_many([self.shared_key(key) for key in keys])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.counters = dict.fromkeys(self.counters, 0)
+
+    def stats(self):
+        """
+        Return the counters of the process-local cache.
+
+        Returns:
+        - dict: The hits of both tiers, the misses, the hit ratio and the LRU size.
+        """
+        with self.lock:
+            stats = dict(self.counters, size=len(self.entries))
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TIMEOUT,
+                         settings.AUTH_TOKEN_SHARED_CACHE, settings.AUTH_TOKEN_SHARED_CACHE_TIMEOUT)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который берет токен и пользователя из token_cache.
+
+    Запрос к базе (join Token и User) выполняется только при промахе кэша. Кэшируются только
+    активные пользователи; смена токена и сохранение пользователя удаляют записи (backend.signals).
+    """
+
+    def authenticate_credentials(self, key):
+        value = token_cache.get(key)
+        if value is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed('User inactive or deleted.')
+            value = (token.created, tuple(getattr(token.user, name) for name in USER_FIELDS))
+            token_cache.set(key, value)
+
+        created, user_values = value
+        user = User.from_db('default', USER_FIELDS, user_values)
+        return user, Token(key=key, user=user, created=created)
@@ -0,0 +1,150 @@
+from django.db import connection, transaction
+from django.db.models import Case, When, Value
+from ujson import loads as load_json
+
+from backend.models import OrderItem, ProductInfo
+
+# Пакетное изменение корзины: все позиции проверяются до записи, запись идет несколькими
+# массовыми запросами в одной транзакции, поэтому ошибка в любой позиции не оставляет частичных изменений.
+
+
+def parse_items(value):
+    """Возвращает список позиций из JSON-строки формы или уже разобранного тела запроса"""
+    if isinstance(value, (str, bytes)):
+        value = load_json(value)
+    if not isinstance(value, list):
+        raise ValueError('Неверный формат запроса')
+    return value
+
+
+def clean_quantities(items, key):
+    """
+    Check a list of {key: int, 'quantity': int} items.
+
+    Args:
+    - items (list): The items from the request.
+    - key (str): The name of the item key, 'product_info' or 'id'.
+
+    Returns:
+    - dict: The quantities by key, a repeated key keeps its last quantity.
+    """
+    quantities = {}
+    for item in items:
+        if not isinstance(item, dict) or type(item.get(key)) is not int or type(item.get('quantity')) is not int \
+                or item['quantity'] < 1:
+            raise ValueError(f'Неверная позиция: {item}')
+        quantities[item[key]] = item['quantity']
+    return quantities
+
+
+def clean_ids(ids):
+    """Проверяет список id позиций"""
+    if any(type(item_id) is not int for item_id in ids):
+        raise ValueError('Неверный список позиций')
+    return set(ids)
+
+
+def check_product_infos(product_info_ids):
+    """Проверяет одним запросом, что все товары существуют"""
+    missing = set(product_info_ids) - set(ProductInfo.objects.filter(
+        id__in=product_info_ids).values_list('id', flat=True)) if product_info_ids else set()
+    if missing:
+        raise ValueError(f'Товары не найдены: {", ".join(map(str, sorted(missing)))}')
+
+
+def add_items(basket_id, quantities):
+    """
+    Insert new basket items with one INSERT, failing on items already in the basket.
+
+    Args:
+    - basket_id (int): The ID of the basket order.
+    - quantities (dict): The quantities by product info ID.
+
+    Returns:
+    - int: The number of created items.
+    """
+    check_product_infos(quantities)
+    OrderItem.objects.bulk_create([
+        OrderItem(order_id=basket_id, product_info_id=product_info_id, quantity=quantity)
+        for product_info_id, quantity in quantities.items()])
+    return len(quantities)
+
+
+def upsert_items(basket_id, quantities):
+    """
+    Insert basket items or set the quantity of the existing ones.
+
+    Uses INSERT ... ON CONFLICT on unique_order_item where the database supports it.
+    The product infos must be checked beforehand with check_product_infos.
+
+    Args:
+    - basket_id (int): The ID of the basket order.
+    - quantities (dict): The quantities by product info ID.
+
+    Returns:
+    - int: The number of written items.
+    """
+    items = [OrderItem(order_id=basket_id, product_info_id=product_info_id, quantity=quantity)
+             for product_info_id, quantity in quantities.items()]
+    if connection.features.supports_update_conflicts_with_target:
+        OrderItem.objects.bulk_create(items, update_conflicts=True, unique_fields=['order', 'product_info'],
+                                      update_fields=['quantity'])
+    else:
+        OrderItem.objects.filter(order_id=basket_id, product_info_id__in=quantities).delete()
+        OrderItem.objects.bulk_create(items)
+    return len(items)
+
+
+def update_items(basket_id, quantities):
+    """
+    Set the quantities of basket items with one UPDATE.
+
+    Args:
+    - basket_id (int): The ID of the basket order.
+    - quantities (dict): The quantities by order item ID.
+
+    Returns:
+    - int: The number of updated items.
+    """
+    if not quantities:
+        return 0
+    return OrderItem.objects.filter(order_id=basket_id, id__in=quantities).update(quantity=Case(
+        *[When(id=item_id, then=Value(quantity)) for item_id, quantity in quantities.items()]))
+
+
+def delete_items(basket_id, item_ids):
+    """Удаляет позиции корзины одним запросом и возвращает их число"""
+    if not item_ids:
+        return 0
+    return OrderItem.objects.filter(order_id=basket_id, id__in=item_ids).delete()[0]
+
+
+def change_basket(basket_id, upsert=(), update=(), delete=()):
+    """
+    Upsert, update and delete basket items in one transaction.
+
+    Every item is validated before the first write, so an error leaves the basket unchanged.
+
+    Args:
+    - basket_id (int): The ID of the basket order.
+    - upsert (list): {'product_info': int, 'quantity': int} items to add or set.
+    - update (list): {'id': int, 'quantity': int} items to change.
+    - delete (list): The IDs of the items to remove.
+
+    Returns:
+    - dict: The numbers of upserted, updated and deleted items.
+
+    Raises:
+    - ValueError: If an item is invalid or a product info does not exist.
+    """
+    upsert = clean_quantities(upsert, 'product_info')
+    update = clean_quantities(update, 'id')
+    delete = clean_ids(delete)
+    check_product_infos(upsert)
+
+    with transaction.atomic():
+        return {
+            'deleted': delete_items(basket_id, delete),
+            'upserted': upsert_items(basket_id, upsert) if upsert else 0,
+            'updated': update_items(basket_id, update),
+        }
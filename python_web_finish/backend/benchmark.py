@@ -0,0 +1,358 @@
+import json
+import random
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from backend.authentication import token_cache
+from backend.importer import PriceListImporter
+from backend.models import User, Order, OrderItem, ProductInfo, Contact, ImportJob, Shop
+from backend.parsers import iter_records
+
+CATEGORIES = ('Процессоры', 'Материнские платы', 'Видеокарты', 'Память', 'Накопители', 'Блоки питания')
+PARAMETERS = {
+    'socket': ('LGA1200', 'LGA1700', 'AM4', 'AM5'),
+    'cores': ('4', '6', '8', '12', '16'),
+    'frequency': ('3.2 GHz', '3.6 GHz', '3.8 GHz', '4.2 GHz'),
+    'memory': ('8 GB', '16 GB', '32 GB'),
+    'color': ('black', 'white', 'silver'),
+}
+
+
+def synthetic_price_list(shop_name, goods_count, parameters_count=4, seed=0):
+    """
+    Build a synthetic price list in the format of data/shop1.yaml.
+
+    Goods are generated lazily, so large price lists do not have to fit in memory.
+
+    Args:
+    - shop_name (str): The name of the shop.
+    - goods_count (int): The number of goods.
+    - parameters_count (int): The number of parameters per good.
+    - seed (int): The seed of the random values.
+
+    Returns:
+    - dict: The price list with 'shop', 'categories' and 'goods' keys.
+    """
+    names = list(PARAMETERS)[:parameters_count]
+
+    def goods():
+        rnd = random.Random(seed)
+        for index in range(1, goods_count + 1):
+            price = rnd.randint(1000, 100000)
+            yield {
+                'id': index,
+                'category': index % len(CATEGORIES) + 1,
+                'name': f'Товар {index}',
+                'model': f'M-{index}',
+                'price': price,
+                'price_rrc': price + rnd.randint(0, 5000),
+                'quantity': rnd.randint(0, 100),
+                'parameters': {name: rnd.choice(PARAMETERS[name]) for name in names},
+            }
+
+    return {
+        'shop': shop_name,
+        'categories': [{'id': index, 'name': name} for index, name in enumerate(CATEGORIES, 1)],
+        'goods': goods(),
+    }
+
+
+def create_users(count, user_type='buyer'):
+    """
+    Create active users with a common password in one query.
+
+    Args:
+    - count (int): The number of users.
+    - user_type (str): 'buyer' or 'shop'.
+
+    Returns:
+    - list: The created users.
+    """
+    prefix = uuid.uuid4().hex[:8]
+    password = make_password('benchmark')
+    User.objects.bulk_create([
+        User(email=f'{user_type}-{prefix}-{index}@example.com', username=f'{user_type}-{prefix}-{index}',
+             password=password, type=user_type, is_active=True)
+        for index in range(count)])
+    return list(User.objects.filter(email__startswith=f'{user_type}-{prefix}-').order_by('id'))
+
+
+def generate_catalog(shops=1, goods_per_shop=1000, parameters_count=4):
+    """
+    Create shop users and import a synthetic price list for each of them.
+
+    Args:
+    - shops (int): The number of shops.
+    - goods_per_shop (int): The number of goods in each price list.
+    - parameters_count (int): The number of parameters per good.
+
+    Returns:
+    - list: The shop users.
+    """
+    users = create_users(shops, user_type='shop')
+    for index, user in enumerate(users):
+        data = synthetic_price_list(f'Shop {user.id}', goods_per_shop, parameters_count, seed=index)
+        PriceListImporter(user.id).run(iter_records(data))
+    return users
+
+
+def generate_orders(users, orders_per_user=10, items_per_order=5, state='new', seed=0):
+    """
+    Create orders of random product infos for the given users.
+
+    Args:
+    - users (list): The buyers.
+    - orders_per_user (int): The number of orders of each user.
+    - items_per_order (int): The number of items in each order.
+    - state (str): The state of the orders.
+    - seed (int): The seed of the random values.
+
+    Returns:
+    - int: The number of created orders.
+    """
+    rnd = random.Random(seed)
+    product_info_ids = list(ProductInfo.objects.values_list('id', flat=True))
+    orders = Order.objects.bulk_create(
+        [Order(user_id=user.id, state=state) for user in users for _ in range(orders_per_user)])
+    order_ids = Order.objects.filter(user_id__in=[user.id for user in users], state=state).values_list(
+        'id', flat=True) if orders and orders[0].pk is None else [order.pk for order in orders]
+
+    OrderItem.objects.bulk_create(
+        [OrderItem(order_id=order_id, product_info_id=product_info_id, quantity=rnd.randint(1, 5))
+         for order_id in order_ids
+         for product_info_id in rnd.sample(product_info_ids, min(items_per_order, len(product_info_ids)))],
+        batch_size=1000)
+    return len(orders)
+
+
+def prepare_benchmark(shops=1, products=10000, buyers=10, orders_per_buyer=10, items_per_order=5):
+    """
+    Generate the data the endpoint benchmarks run against.
+
+    Args:
+    - shops (int): The number of shops, the products are split between them.
+    - products (int): The total number of product infos.
+    - buyers (int): The number of buyers with orders.
+    - orders_per_buyer (int): The number of placed orders of each buyer.
+    - items_per_order (int): The number of items in each order and in the basket.
+
+    Returns:
+    - dict: The users, tokens and IDs the benchmark cases refer to.
+    """
+    partners = generate_catalog(shops=shops, goods_per_shop=max(products // shops, 1))
+    users = create_users(buyers)
+    generate_orders(users, orders_per_user=orders_per_buyer, items_per_order=items_per_order)
+    buyer = users[0]
+    generate_orders([buyer], orders_per_user=1, items_per_order=items_per_order, state='basket')
+    Contact.objects.create(user=buyer, city='Москва', street='Тверская', house='1', phone='+70000000000')
+    partner = partners[0]
+    job = ImportJob.objects.create(user=partner, url='http://example.com/shop.yaml', state='done')
+    product_info_ids = list(ProductInfo.objects.filter(shop__user=partner).order_by('id').values_list(
+        'id', flat=True)[:50])
+
+    return {
+        'scale': {'shops': shops, 'products': products, 'buyers': buyers, 'orders_per_buyer': orders_per_buyer,
+                  'items_per_order': items_per_order},
+        'buyer': buyer,
+        'partner': partner,
+        'tokens': {user.id: Token.objects.get_or_create(user=user)[0].key for user in (buyer, partner)},
+        'shop_id': Shop.objects.get(user=partner).id,
+        'contact_id': Contact.objects.filter(user=buyer).values_list('id', flat=True).first(),
+        'job_id': job.id,
+        'product_info_ids': product_info_ids,
+    }
+
+
+def endpoint_cases(context):
+    """
+    Describe the benchmarked requests with their query budgets.
+
+    The budgets are for a cold cache and must not depend on the amount of data; a request over its budget
+    usually means an N+1 query.
+
+    Args:
+    - context (dict): The data from prepare_benchmark.
+
+    Requests that change data get a function of the run number as data: it prepares the state the request needs
+    (a basket with goods in stock, an order to confirm, a contact to delete) before the request is timed, so
+    every run does the same work.
+
+    Returns:
+    - list: (name, method, path, data, user, max queries) tuples; data may be a function of the run number.
+    """
+    buyer, partner = context['buyer'], context['partner']
+    product_info_ids = context['product_info_ids']
+    upsert = [{'product_info': product_info_id, 'quantity': 1} for product_info_id in product_info_ids]
+
+    def checkout(run):
+        basket = basket_items(buyer.id, ProductInfo.objects.filter(shop__user=partner, quantity__gt=0).order_by(
+            'id').values_list('id', flat=True)[:5], replace=True)[0]
+        return {'id': str(basket), 'contact': str(context['contact_id'])}
+
+    def basket_add(run):
+        basket_items(buyer.id, product_info_ids[-5:], create=False)
+        return {'items': json.dumps([{'product_info': product_info_id, 'quantity': 1}
+                                     for product_info_id in product_info_ids[-5:]])}
+
+    def basket_update(run):
+        item_ids = basket_items(buyer.id, product_info_ids[-5:])[1]
+        return {'items': json.dumps([{'id': item_id, 'quantity': run + 2} for item_id in item_ids])}
+
+    def basket_delete(run):
+        return {'items': ','.join(map(str, basket_items(buyer.id, product_info_ids[-5:])[1]))}
+
+    def order_to_confirm(run):
+        order = Order.objects.create(user_id=buyer.id, state='new')
+        OrderItem.objects.bulk_create([OrderItem(order_id=order.id, product_info_id=product_info_id, quantity=1)
+                                       for product_info_id in product_info_ids[:5]])
+        return {'orders': [order.id], 'state': 'confirmed'}
+
+    def contact_to_delete(run):
+        contact = Contact.objects.create(user=buyer, city='Казань', street='Баумана', phone='+70000000002')
+        return {'items': str(contact.id)}
+    return [
+        ('categories', 'get', reverse('backend:categories'), {}, None, 1),
+        ('categories of shop', 'get', reverse('backend:categories'), {'shop_id': context['shop_id']}, None, 1),
+        ('shops', 'get', reverse('backend:shops'), {}, None, 1),
+        ('products', 'get', reverse('backend:products'), {}, None, 1),
+        ('products of category', 'get', reverse('backend:products'), {'category_id': 1}, None, 1),
+        ('products by attribute', 'get', reverse('backend:products'), {'attr': 'cores:8..'}, None, 1),
+        ('products search', 'get', reverse('backend:products-search'), {'q': 'товар 1'}, None, 4),
+        ('basket', 'get', reverse('backend:basket'), {}, buyer, 5),
+        ('basket batch', 'post', reverse('backend:basket-batch'), {'upsert': upsert}, buyer, 6),
+        ('orders', 'get', reverse('backend:order'), {}, buyer, 5),
+        ('user details', 'get', reverse('backend:user-details'), {}, buyer, 3),
+        ('user contacts', 'get', reverse('backend:user-contact'), {}, buyer, 2),
+        ('user login', 'post', reverse('backend:user-login'), {'email': buyer.email, 'password': 'benchmark'},
+         None, 2),
+        ('user register', 'post', reverse('backend:user-register'), lambda run: {
+            'first_name': 'Иван', 'last_name': 'Иванов', 'email': f'register-{uuid.uuid4().hex}@example.com',
+            'password': 'Benchmark-password-1', 'company': 'ООО', 'position': 'Менеджер'}, None, 9),
+        ('partner state', 'get', reverse('backend:partner-state'), {}, partner, 2),
+        ('partner orders', 'get', reverse('backend:partner-orders'), {}, partner, 5),
+        ('partner order items', 'get', reverse('backend:partner-order-items'), {}, partner, 4),
+        ('partner update status', 'get', reverse('backend:partner-update-status', args=[context['job_id']]), {},
+         partner, 2),
+        ('basket add', 'post', reverse('backend:basket'), basket_add, buyer, 6),
+        ('basket update', 'put', reverse('backend:basket'), basket_update, buyer, 3),
+        ('basket delete', 'delete', reverse('backend:basket'), basket_delete, buyer, 3),
+        ('order checkout', 'post', reverse('backend:order'), checkout, buyer, 9),
+        ('partner state change', 'post', reverse('backend:partner-state'), {'state': 'on'}, partner, 4),
+        ('partner order state', 'post', reverse('backend:partner-order-state'), order_to_confirm, partner, 10),
+        ('contact add', 'post', reverse('backend:user-contact'), {
+            'city': 'Москва', 'street': 'Тверская', 'house': '2', 'phone': '+70000000001'}, buyer, 3),
+        ('contact update', 'put', reverse('backend:user-contact'), lambda run: {
+            'id': str(context['contact_id']), 'city': f'Город {run}'}, buyer, 3),
+        ('contact delete', 'delete', reverse('backend:user-contact'), contact_to_delete, buyer, 4),
+    ]
+
+
+def basket_items(user_id, product_info_ids, create=True, replace=False):
+    """
+    Put fresh items of product infos into the basket of a user for the benchmark cases that change the basket.
+
+    Args:
+    - user_id (int): The ID of the buyer.
+    - product_info_ids (iterable): The IDs of the product infos.
+    - create (bool): Only remove the product infos from the basket if False.
+    - replace (bool): Remove the other items of the basket too.
+
+    Returns:
+    - tuple: The ID of the basket and the IDs of the created items.
+    """
+    product_info_ids = list(product_info_ids)
+    basket = Order.objects.get_or_create(user_id=user_id, state='basket')[0]
+    items = OrderItem.objects.filter(order_id=basket.id)
+    (items if replace else items.filter(product_info_id__in=product_info_ids)).delete()
+    if not create:
+        return basket.id, []
+    OrderItem.objects.bulk_create([OrderItem(order_id=basket.id, product_info_id=product_info_id, quantity=1)
+                                   for product_info_id in product_info_ids])
+    return basket.id, list(items.filter(product_info_id__in=product_info_ids).values_list('id', flat=True))
+
+
+def clear_caches():
+    """Очищает кэши ответов и токенов, чтобы запрос шел по холодному пути"""
+    for alias in {'default', settings.CATALOG_CACHE}:
+        caches[alias].clear()
+    token_cache.clear()
+
+
+def case_client(context, user):
+    """Возвращает тестовый клиент, авторизованный токеном пользователя сценария (или анонимный)"""
+    client = APIClient()
+    if user is not None:
+        client.credentials(HTTP_AUTHORIZATION=f'Token {context["tokens"][user.id]}')
+    return client
+
+
+def case_data(data, run=0):
+    """Возвращает данные запроса сценария из endpoint_cases; функция готовит их для запуска run"""
+    return data(run) if callable(data) else data
+
+
+def send_case(client, method, path, data):
+    """Отправляет запрос сценария с данными из case_data"""
+    if method == 'get':
+        return client.get(path, data)
+    # списки и объекты передаются в JSON, остальное - формой, как ее ждут старые представления
+    structured = any(isinstance(value, (list, dict)) for value in data.values())
+    return getattr(client, method)(path, data, format='json' if structured else 'multipart')
+
+
+def run_endpoint_benchmarks(context, repeat=5, warm=False):
+    """
+    Time every benchmark case through the test client and count its queries.
+
+    Args:
+    - context (dict): The data from prepare_benchmark.
+    - repeat (int): The number of runs of each case.
+    - warm (bool): Keep the caches between runs instead of clearing them before each run.
+
+    Returns:
+    - list: A result per case with timings in milliseconds, the most queries of a run, the budget and whether
+      the response succeeded and stayed within the budget.
+    """
+    results = []
+    for name, method, path, data, user, max_queries in endpoint_cases(context):
+        client = case_client(context, user)
+        timings, queries, errors = [], 0, []
+        for run in range(repeat):
+            if not warm or run == 0:
+                clear_caches()
+            payload = case_data(data, run)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = send_case(client, method, path, payload)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured))
+            # ошибки старые представления возвращают со статусом 200 и 'Status': False
+            body = response.json() if response.get('Content-Type') == 'application/json' else None
+            if response.status_code >= 400 or (isinstance(body, dict) and body.get('Status') is False):
+                errors.append(f'{response.status_code} {response.content[:200].decode(errors="replace")}')
+
+        timings.sort()
+        results.append({
+            'endpoint': name,
+            'method': method.upper(),
+            'path': path,
+            'runs': repeat,
+            'median_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            'max_ms': round(timings[-1], 3),
+            'queries': queries,
+            'max_queries': max_queries,
+            'errors': errors,
+            'ok': not errors and queries <= max_queries,
+        })
+    return results
@@ -0,0 +1,128 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from backend.routers import stick_to_primary
+
+
+class GenerationCache:
+    """Кэш ответов, сбрасываемый увеличением поколения.
+
+    Ключ записи включает текущее поколение ее области (scope), поэтому после bump() старые записи
+    больше не находятся и просто вытесняются бэкендом кэша. Хранилище задается алиасом из settings.CACHES;
+    поколения меняют и воркеры Celery, поэтому кэш должен быть общим для процессов (backend.checks).
+
+    Attributes:
+    - alias: Алиас кэша из settings.CACHES.
+    - prefix: Префикс ключей.
+    """
+
+    def __init__(self, alias, prefix):
+        self.alias = alias
+        self.prefix = prefix
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def generation(self, scope):
+        """
+        Return the current generation of a scope.
+
+        A missing counter starts from the current time, so an evicted counter never brings back old entries.
+
+        Args:
+        - scope (str): The cache scope.
+
+        Returns:
+        - int: The generation.
+        """
+        return self.backend.get_or_set(f'{self.prefix}:generation:{scope}', time.time_ns, timeout=None)
+
+    def bump(self, *scopes):
+        """Увеличивает поколение областей, делая их записи недоступными"""
+        for scope in scopes:
+            key = f'{self.prefix}:generation:{scope}'
+            try:
+                self.backend.incr(key)
+            except ValueError:
+                self.backend.set(key, time.time_ns(), timeout=None)
+        # пока реплики не догнали запись, новые записи кэша строятся по default
+        stick_to_primary(self.prefix)
+
+    def key(self, scope, params):
+        """
+        Build the cache key and the ETag of an entry.
+
+        Args:
+        - scope (str): The cache scope.
+        - params (dict): The normalized request parameters.
+
+        Returns:
+        - tuple: The cache key and the ETag.
+        """
+        return self._key(scope, self.generation(scope), params)
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value):
+        self.backend.set(key, value, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+    # асинхронные варианты для представлений backend.async_views
+
+    async def ageneration(self, scope):
+        return await self.backend.aget_or_set(f'{self.prefix}:generation:{scope}', time.time_ns, timeout=None)
+
+    async def akey(self, scope, params):
+        return self._key(scope, await self.ageneration(scope), params)
+
+    async def aget(self, key):
+        return await self.backend.aget(key)
+
+    async def aset(self, key, value):
+        await self.backend.aset(key, value, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+    def _key(self, scope, generation, params):
+        raw = '&'.join(f'{name}={params[name]}' for name in sorted(params))
+        digest = hashlib.sha1(f'{scope}:{generation}?{raw}'.encode()).hexdigest()
+        return f'{self.prefix}:{digest}', f'"{digest}"'
+
+
+catalog_cache = GenerationCache(settings.CATALOG_CACHE, 'catalog')
+
+
+def catalog_scope(shop_id=None):
+    """Возвращает область кэша каталога: общий каталог или каталог одного магазина"""
+    return f'shop:{shop_id}' if shop_id else 'all'
+
+
+def invalidate_catalog(shop_id):
+    """
+    Invalidate the cached catalog responses of a shop after the current transaction commits.
+
+    Args:
+    - shop_id (int): The ID of the changed shop.
+    """
+    transaction.on_commit(lambda: catalog_cache.bump(catalog_scope(), catalog_scope(shop_id)))
+
+
+directory_cache = GenerationCache(settings.CATALOG_CACHE, 'directory')
+
+# справочники (категории и магазины) меняются редко и сбрасываются все сразу
+DIRECTORY_SCOPE = 'all'
+
+
+def invalidate_directories():
+    """Сбрасывает закэшированные справочники категорий и магазинов после фиксации текущей транзакции"""
+    transaction.on_commit(lambda: directory_cache.bump(DIRECTORY_SCOPE))
+
+
+def not_modified(request, etag):
+    """Проверяет, есть ли etag в заголовке If-None-Match запроса"""
+    if_none_match = request.headers.get('If-None-Match', '')
+    return etag in {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')} or \
+        if_none_match.strip() == '*'
@@ -0,0 +1,126 @@
+from django.db.models import OuterRef, Subquery
+
+from backend.cache import invalidate_catalog, invalidate_directories
+from backend.models import CatalogEntry, ProductInfo, ProductParameter, Shop
+from backend.search import search_document
+
+# сколько записей каталога пересобираем за один проход
+BATCH_SIZE = 1000
+
+ENTRY_FIELDS = ('shop', 'shop_state', 'category', 'category_name', 'product_name', 'model', 'quantity', 'price',
+                'price_rrc', 'parameters', 'search_text')
+
+
+def refresh_catalog(product_info_ids):
+    """
+    Rebuild the catalog entries of the given product infos.
+
+    Args:
+    - product_info_ids (iterable): The IDs of the changed product infos.
+    """
+    product_info_ids = list(product_info_ids)
+    for start in range(0, len(product_info_ids), BATCH_SIZE):
+        _refresh(ProductInfo.objects.filter(id__in=product_info_ids[start:start + BATCH_SIZE]))
+
+
+def refresh_shop_catalog(shop_id):
+    """
+    Rebuild all catalog entries of a shop.
+
+    Args:
+    - shop_id (int): The ID of the shop.
+    """
+    refresh_catalog(ProductInfo.objects.filter(shop_id=shop_id).values_list('id', flat=True))
+
+
+def refresh_product_infos(product_infos):
+    """
+    Rebuild the catalog entries of product infos after a change of their product, category or parameters and
+    invalidate the cached catalog of their shops.
+
+    Args:
+    - product_infos (QuerySet): The changed product infos.
+    """
+    rows = list(product_infos.values_list('id', 'shop_id'))
+    refresh_catalog([product_info_id for product_info_id, _ in rows])
+    for shop_id in {shop_id for _, shop_id in rows}:
+        invalidate_catalog(shop_id)
+
+
+def rebuild_catalog():
+    """Пересобирает каталог целиком"""
+    for shop_id in Shop.objects.values_list('id', flat=True):
+        refresh_shop_catalog(shop_id)
+
+
+def refresh_shop_state(user_id):
+    """
+    Copy the shop state of a partner into its catalog entries with one UPDATE and invalidate the cached catalog
+    and directories.
+
+    Args:
+    - user_id (int): The ID of the shop owner.
+    """
+    for shop_id, state in Shop.objects.filter(user_id=user_id).values_list('id', 'state'):
+        CatalogEntry.objects.filter(shop_id=shop_id).update(shop_state=state)
+        invalidate_catalog(shop_id)
+    invalidate_directories()
+
+
+def refresh_quantities(product_info_ids):
+    """
+    Copy the stock of product infos into their catalog entries with one UPDATE.
+
+    Args:
+    - product_info_ids (iterable): The IDs of the product infos with changed quantities.
+    """
+    CatalogEntry.objects.filter(product_info_id__in=product_info_ids).update(quantity=Subquery(
+        ProductInfo.objects.filter(id=OuterRef('product_info_id')).values('quantity')[:1]))
+
+
+def fill_quantities(entries):
+    """
+    Put the current stock into serialized catalog entries.
+
+    The stock changes with every order, so cached catalog responses and their ETags do not depend on it
+    and it is read on every request with one query by the primary key.
+
+    Args:
+    - entries (list): The entries of serialize_catalog_entries, changed in place.
+    """
+    if entries:
+        quantities = dict(CatalogEntry.objects.filter(product_info_id__in=[entry['id'] for entry in entries])
+                          .values_list('product_info_id', 'quantity'))
+        for entry in entries:
+            entry['quantity'] = quantities.get(entry['id'], 0)
+
+
+async def afill_quantities(entries):
+    """Асинхронный вариант fill_quantities"""
+    if entries:
+        quantities = {product_info_id: quantity async for product_info_id, quantity in CatalogEntry.objects.filter(
+            product_info_id__in=[entry['id'] for entry in entries]).values_list('product_info_id', 'quantity')}
+        for entry in entries:
+            entry['quantity'] = quantities.get(entry['id'], 0)
+
+
+def _refresh(queryset):
+    """Пересобирает записи каталога для предложений из queryset"""
+    rows = list(queryset.values('id', 'shop_id', 'shop__state', 'product__name', 'product__category_id',
+                                'product__category__name', 'model', 'quantity', 'price', 'price_rrc'))
+    if not rows:
+        return
+
+    parameters = {row['id']: [] for row in rows}
+    for product_info_id, name, value in ProductParameter.objects.filter(
+            product_info_id__in=parameters).order_by('id').values_list('product_info_id', 'parameter__name', 'value'):
+        parameters[product_info_id].append({'parameter': name, 'value': value})
+
+    CatalogEntry.objects.bulk_create(
+        [CatalogEntry(product_info_id=row['id'], shop_id=row['shop_id'], shop_state=row['shop__state'],
+                      category_id=row['product__category_id'], category_name=row['product__category__name'],
+                      product_name=row['product__name'], model=row['model'], quantity=row['quantity'],
+                      price=row['price'], price_rrc=row['price_rrc'], parameters=parameters[row['id']],
+                      search_text=search_document(row['product__name'], row['model'], parameters[row['id']]))
+         for row in rows],
+        update_conflicts=True, unique_fields=['product_info'], update_fields=ENTRY_FIELDS)
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Проверки настроек, без которых веб-процессы и воркеры Celery работают с разными данными.
+
+# кэши, которые видит только создавший их процесс
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def is_process_local(alias):
+    """Проверяет, что кэш alias живет в памяти одного процесса"""
+    return settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches)
+def check_worker_caches(app_configs, **kwargs):
+    """
+    Check that the caches written by Celery tasks are shared with the web processes.
+
+    Without CELERY_TASK_ALWAYS_EAGER the tasks run in a worker process: the import task publishes its progress
+    through the default cache and bumps the generations of CATALOG_CACHE, so with a process-local cache
+    PartnerUpdate would never see the progress and the web processes would keep serving the old catalog.
+
+    Returns:
+    - list: The errors.
+    """
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        return []
+    hint = ('Set CACHE_BACKEND and CACHE_LOCATION to a shared cache such as Redis '
+            '(or CELERY_TASK_ALWAYS_EAGER=True for development without a worker).')
+    errors = []
+    if is_process_local('default'):
+        errors.append(Error('The default cache is process-local, but Celery tasks run in a worker.',
+                            hint=hint, id='backend.E001'))
+    if settings.CATALOG_CACHE != 'default' and is_process_local(settings.CATALOG_CACHE):
+        errors.append(Error(f'CATALOG_CACHE "{settings.CATALOG_CACHE}" is process-local, but Celery tasks run '
+                            'in a worker.', hint=hint, id='backend.E002'))
+    return errors
+
+
+@register(Tags.caches)
+def check_replica_cache(app_configs, **kwargs):
+    """
+    Check that the marks sending reads to the primary after a write are seen by all web processes.
+
+    stick_to_primary keeps the marks in the default cache: with a process-local cache a request served
+    by another process would read from a lagging replica.
+
+    Returns:
+    - list: The errors.
+    """
+    if not settings.DATABASE_REPLICAS or not is_process_local('default'):
+        return []
+    return [Error(
+        'The default cache is process-local, but DATABASE_REPLICAS are configured.',
+        hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared cache such as Redis.',
+        id='backend.E003')]
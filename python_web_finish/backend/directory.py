@@ -0,0 +1,75 @@
+from asgiref.sync import sync_to_async
+
+from backend.cache import DIRECTORY_SCOPE, directory_cache
+from backend.models import Category, Shop
+from backend.serializers import CategorySerializer, ShopSerializer
+
+# Справочники хранятся в directory_cache уже сериализованными списками и пересобираются только
+# после сброса (импорт прайс-листа, смена статуса магазина, правка категорий и магазинов).
+
+
+def build_categories(shop_id=None):
+    """Сериализует все категории или категории одного магазина"""
+    queryset = Category.objects.all()
+    if shop_id:
+        queryset = queryset.filter(shops__id=shop_id)
+    return list(CategorySerializer(queryset, many=True).data)
+
+
+def build_shops():
+    """Сериализует магазины, принимающие заказы"""
+    return list(ShopSerializer(Shop.objects.filter(state=True), many=True).data)
+
+
+BUILDERS = {
+    'categories': build_categories,
+    'shops': build_shops,
+}
+
+
+def directory_etag(name, **params):
+    """
+    Return the ETag of a directory response without reading the directory.
+
+    Args:
+    - name (str): 'categories' or 'shops'.
+    - params: The directory and response parameters, e.g. shop_id and page.
+
+    Returns:
+    - str: The ETag, it changes only when the directories are invalidated.
+    """
+    return directory_cache.key(DIRECTORY_SCOPE, dict(params, directory=name, response=True))[1]
+
+
+def get_directory(name, **params):
+    """
+    Return a serialized directory, building and caching it on a miss.
+
+    Args:
+    - name (str): 'categories' or 'shops'.
+    - params: The arguments of the directory builder.
+
+    Returns:
+    - list: The serialized directory.
+    """
+    key, _ = directory_cache.key(DIRECTORY_SCOPE, dict(params, directory=name))
+    data = directory_cache.get(key)
+    if data is None:
+        data = BUILDERS[name](**params)
+        directory_cache.set(key, data)
+    return data
+
+
+async def adirectory_etag(name, **params):
+    """Асинхронный вариант directory_etag"""
+    return (await directory_cache.akey(DIRECTORY_SCOPE, dict(params, directory=name, response=True)))[1]
+
+
+async def aget_directory(name, **params):
+    """Асинхронный вариант get_directory: справочник собирается в потоке запроса, только если его нет в кэше"""
+    key, _ = await directory_cache.akey(DIRECTORY_SCOPE, dict(params, directory=name))
+    data = await directory_cache.aget(key)
+    if data is None:
+        data = await sync_to_async(BUILDERS[name])(**params)
+        await directory_cache.aset(key, data)
+    return data
@@ -0,0 +1,83 @@
+import json
+import re
+from contextlib import contextmanager
+
+from django.db import connection
+
+# Поиск полных просмотров таблиц в планах запросов: EXPLAIN (FORMAT JSON) в PostgreSQL
+# и EXPLAIN QUERY PLAN в SQLite. Используется командой explain_endpoints.
+
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+# базы, планы которых умеет разбирать full_scans
+EXPLAINED_VENDORS = ('postgresql', 'sqlite')
+# Django обращается к таблицам подзапросов по псевдонимам: "backend_orderitem" U0
+TABLE_ALIAS = re.compile(r'"(\w+)" (?:AS )?([A-Z]\d+)\b')
+
+
+@contextmanager
+def capture_statements(using=connection):
+    """Собирает (SQL, параметры) запросов, для которых можно построить план, без повторов SQL"""
+    statements = {}
+
+    def wrapper(execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            statements.setdefault(sql, params)
+        return execute(sql, params, many, context)
+
+    with using.execute_wrapper(wrapper):
+        yield statements
+
+
+def full_scans(sql, params, using=connection):
+    """
+    Find the tables a statement reads completely according to its plan.
+
+    Args:
+    - sql (str): The SQL with placeholders.
+    - params (tuple): The parameters of the statement.
+    - using (BaseDatabaseWrapper): The connection to explain the statement on.
+
+    Returns:
+    - list: (table, plan step) tuples of the sequential scans.
+
+    Raises:
+    - ValueError: If the plans of the database are not supported.
+    """
+    if using.vendor not in EXPLAINED_VENDORS:
+        raise ValueError(f'Планы запросов {using.vendor} не поддерживаются')
+    with using.cursor() as cursor:
+        if using.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            return list(_postgresql_scans(json.loads(plan) if isinstance(plan, str) else plan))
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        aliases = {alias: table for table, alias in TABLE_ALIAS.findall(sql)}
+        return [(aliases.get(detail.split()[1], detail.split()[1]), detail)
+                for *_, detail in cursor.fetchall() if _is_sqlite_scan(detail)]
+
+
+def _postgresql_scans(nodes):
+    for node in nodes:
+        plan = node.get('Plan', node)
+        if plan.get('Node Type') == 'Seq Scan':
+            yield plan['Relation Name'], f'Seq Scan on {plan["Relation Name"]}'
+        yield from _postgresql_scans(plan.get('Plans', ()))
+
+
+def _is_sqlite_scan(detail):
+    # "SCAN t" - аналог Seq Scan; "SCAN t USING INDEX i" обходит индекс по порядку ORDER BY (обычно с LIMIT),
+    # "SEARCH t ..." ищет по ключу; "SCAN (subquery-1)", "SCAN CONSTANT ROW" и полнотекстовый индекс
+    # "SCAN t VIRTUAL TABLE ..." - не таблицы
+    words = detail.split()
+    return (len(words) > 1 and words[0] == 'SCAN' and not words[1].startswith('(') and words[1] != 'CONSTANT'
+            and 'USING' not in words and 'VIRTUAL' not in words)
+
+
+def table_sizes(tables, using=connection):
+    """Возвращает число строк в каждой таблице"""
+    sizes = {}
+    with using.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f'SELECT COUNT(*) FROM {using.ops.quote_name(table)}')
+            sizes[table] = cursor.fetchone()[0]
+    return sizes
@@ -0,0 +1,126 @@
+from rest_framework.fields import DateTimeField
+
+from backend.models import Contact, OrderItem, ProductInfo, ProductParameter
+
+# Сериализация без ModelSerializer: словари строятся прямо из строк .values() и совпадают
+# с выводом ProductInfoSerializer и OrderSerializer поле в поле.
+
+# поля CatalogEntry, которые нужны serialize_catalog_entries
+CATALOG_ENTRY_VALUES = ('product_info_id', 'model', 'product_name', 'category_name', 'shop_id', 'quantity', 'price',
+                        'price_rrc', 'parameters')
+
+# поля Order, которые нужны serialize_orders (total_sum - аннотация)
+ORDER_VALUES = ('id', 'state', 'dt', 'total_sum', 'contact_id')
+
+# поля OrderItem, которые нужны serialize_order_items (state и dt - аннотации из заказа)
+ORDER_ITEM_VALUES = ('id', 'order_id', 'state', 'dt', 'product_info_id', 'quantity')
+
+CONTACT_FIELDS = ('id', 'city', 'street', 'house', 'structure', 'building', 'apartment', 'phone')
+
+# тот же формат даты, что и у DateTimeField в OrderSerializer
+datetime_field = DateTimeField()
+
+
+def serialize_catalog_entries(rows):
+    """
+    Serialize CatalogEntry rows like ProductInfoSerializer.
+
+    Args:
+    - rows (iterable): The CatalogEntry .values() rows with CATALOG_ENTRY_VALUES.
+
+    Returns:
+    - list: The serialized product infos.
+    """
+    return [{
+        'id': row['product_info_id'],
+        'model': row['model'],
+        'product': {'name': row['product_name'], 'category': row['category_name']},
+        'shop': row['shop_id'],
+        'quantity': row['quantity'],
+        'price': row['price'],
+        'price_rrc': row['price_rrc'],
+        'product_parameters': row['parameters'],
+    } for row in rows]
+
+
+def serialize_product_infos(product_info_ids):
+    """
+    Serialize product infos like ProductInfoSerializer with two queries.
+
+    Args:
+    - product_info_ids (iterable): The IDs of the product infos.
+
+    Returns:
+    - dict: The serialized product infos by ID.
+    """
+    product_infos = {
+        row['id']: {
+            'id': row['id'],
+            'model': row['model'],
+            'product': {'name': row['product__name'], 'category': row['product__category__name']},
+            'shop': row['shop_id'],
+            'quantity': row['quantity'],
+            'price': row['price'],
+            'price_rrc': row['price_rrc'],
+            'product_parameters': [],
+        } for row in ProductInfo.objects.filter(id__in=product_info_ids).values(
+            'id', 'model', 'product__name', 'product__category__name', 'shop_id', 'quantity', 'price', 'price_rrc')}
+
+    parameters = ProductParameter.objects.filter(product_info_id__in=product_infos).order_by('id')
+    for product_info_id, name, value in parameters.values_list('product_info_id', 'parameter__name', 'value'):
+        product_infos[product_info_id]['product_parameters'].append({'parameter': name, 'value': value})
+    return product_infos
+
+
+def serialize_orders(rows):
+    """
+    Serialize orders like OrderSerializer with at most four queries, whatever the number of orders.
+
+    Args:
+    - rows (list): The Order .values() rows with ORDER_VALUES.
+
+    Returns:
+    - list: The serialized orders.
+    """
+    items = {row['id']: [] for row in rows}
+    item_rows = list(OrderItem.objects.filter(order_id__in=items).order_by('id').values(
+        'id', 'order_id', 'product_info_id', 'quantity'))
+    product_infos = serialize_product_infos({row['product_info_id'] for row in item_rows}) if item_rows else {}
+    for row in item_rows:
+        items[row['order_id']].append(
+            {'id': row['id'], 'product_info': product_infos[row['product_info_id']], 'quantity': row['quantity']})
+
+    contact_ids = {row['contact_id'] for row in rows if row['contact_id'] is not None}
+    contacts = {
+        contact['id']: contact
+        for contact in Contact.objects.filter(id__in=contact_ids).values(*CONTACT_FIELDS)} if contact_ids else {}
+
+    return [{
+        'id': row['id'],
+        'ordered_items': items[row['id']],
+        'state': row['state'],
+        'dt': datetime_field.to_representation(row['dt']),
+        'total_sum': int(row['total_sum']) if row['total_sum'] is not None else None,
+        'contact': contacts.get(row['contact_id']),
+    } for row in rows]
+
+
+def serialize_order_items(rows):
+    """
+    Serialize order lines of a partner feed with one more query for the product infos.
+
+    Args:
+    - rows (list): The OrderItem .values() rows with ORDER_ITEM_VALUES.
+
+    Returns:
+    - list: The serialized order lines.
+    """
+    product_infos = serialize_product_infos({row['product_info_id'] for row in rows}) if rows else {}
+    return [{
+        'id': row['id'],
+        'order': row['order_id'],
+        'state': row['state'],
+        'dt': datetime_field.to_representation(row['dt']),
+        'product_info': product_infos[row['product_info_id']],
+        'quantity': row['quantity'],
+    } for row in rows]
@@ -0,0 +1,118 @@
+import hashlib
+import tempfile
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from requests import HTTPError, Session
+from requests.adapters import HTTPAdapter
+
+from backend.metrics import record_fetch
+
+# Загрузка прайс-листов партнеров через общую сессию requests: повторные загрузки с того же хоста
+# переиспользуют соединение (без нового TCP и TLS), таймауты и предельный размер из настроек PRICE_LIST_*.
+
+# размер блока при скачивании прайс-листа
+CHUNK_SIZE = 64 * 1024
+
+
+class PriceListTooLarge(ValueError):
+    """Прайс-лист больше PRICE_LIST_MAX_BYTES"""
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Возвращает сессию с пулом соединений, общую для потоков процесса"""
+    global _session
+    # сессия создается при первой загрузке, а не при импорте модуля: иначе воркеры Celery
+    # унаследовали бы после fork сокеты родительского процесса
+    with _session_lock:
+        if _session is None:
+            session = Session()
+            # сессия общая для всех партнеров, поэтому cookie одного не должны уходить другому
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(pool_connections=settings.PRICE_LIST_POOL_SIZE,
+                                  pool_maxsize=settings.PRICE_LIST_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def fetch_price_list(url, etag='', last_modified=''):
+    """
+    Download a price list into a temporary file without keeping it in memory.
+
+    With the validators of the previous download the request is conditional: if the server answers
+    304 Not Modified, nothing is downloaded. The download fails on a connection or read timeout, after
+    PRICE_LIST_FETCH_DEADLINE seconds in total or when the content exceeds PRICE_LIST_MAX_BYTES.
+
+    Args:
+    - url (str): The price list URL.
+    - etag (str): The ETag of the previous download.
+    - last_modified (str): The Last-Modified of the previous download.
+
+    Returns:
+    - dict: 'file' - the temporary file positioned at its start or None if the price list is not modified,
+      'content_type', the 'etag' and 'last_modified' validators and 'content_hash' - the SHA-256 of the content.
+    """
+    # requests распаковывает gzip и deflate сам, лимит размера считается по распакованным данным
+    headers = {'Accept-Encoding': 'gzip, deflate' if settings.PRICE_LIST_COMPRESSION else 'identity'}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    started = time.perf_counter()
+    result, size = '', 0
+    try:
+        with get_session().get(url, stream=True, headers=headers, timeout=(
+                settings.PRICE_LIST_CONNECT_TIMEOUT, settings.PRICE_LIST_READ_TIMEOUT)) as response:
+            result = str(response.status_code)
+            download = {
+                'file': None,
+                'content_type': response.headers.get('Content-Type', ''),
+                'etag': response.headers.get('ETag', ''),
+                'last_modified': response.headers.get('Last-Modified', ''),
+                'content_hash': '',
+            }
+            if response.status_code == 304:
+                # 304 может не повторять валидаторы, тогда остаются прежние
+                download.update(etag=download['etag'] or etag, last_modified=download['last_modified'] or last_modified)
+                return download
+
+            response.raise_for_status()
+            if int(response.headers.get('Content-Length') or 0) > settings.PRICE_LIST_MAX_BYTES:
+                raise PriceListTooLarge(f'Прайс-лист больше {settings.PRICE_LIST_MAX_BYTES} байт')
+
+            digest = hashlib.sha256()
+            file = tempfile.TemporaryFile()
+            try:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > settings.PRICE_LIST_MAX_BYTES:
+                        raise PriceListTooLarge(f'Прайс-лист больше {settings.PRICE_LIST_MAX_BYTES} байт')
+                    # таймаут чтения ограничивает паузу между блоками, а не всю загрузку
+                    if time.perf_counter() - started > settings.PRICE_LIST_FETCH_DEADLINE:
+                        raise TimeoutError(
+                            f'Прайс-лист не загрузился за {settings.PRICE_LIST_FETCH_DEADLINE:g} секунд')
+                    digest.update(chunk)
+                    file.write(chunk)
+            except Exception:
+                file.close()
+                raise
+            file.seek(0)
+            download.update(file=file, content_hash=digest.hexdigest())
+            return download
+    except Exception as error:
+        # ответ с ошибкой учитывается по статусу, прерванная загрузка - по типу исключения
+        if not isinstance(error, HTTPError):
+            result = type(error).__name__
+        raise
+    finally:
+        record_fetch(urlsplit(url).hostname or '', result, time.perf_counter() - started, size)
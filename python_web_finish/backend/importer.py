@@ -0,0 +1,317 @@
+import time
+from itertools import islice
+
+from django.db import connection, transaction
+
+from backend.attributes import normalize_value
+from backend.cache import invalidate_catalog, invalidate_directories
+from backend.catalog import refresh_catalog, refresh_quantities
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from backend.parsers import iter_records
+
+# сколько товаров записываем за один проход
+BATCH_SIZE = 1000
+
+
+def chunked(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не больше size"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class QueryCounter:
+    """Обертка для connection.execute_wrapper, считающая выполненные SQL-запросы"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class PriceListImporter:
+    """Импорт прайс-листа магазина набором set-based запросов.
+
+    Записи прайс-листа приходят потоком (см. backend.parsers) и обрабатываются пачками по batch_size:
+    продукты, параметры и предложения каждой пачки находятся одним запросом на таблицу и записываются
+    через bulk_create/bulk_update, весь импорт идет в одной транзакции.
+
+    Режимы:
+    - sync: сравнивает прайс-лист с сохраненными предложениями по ключу unique_product_info
+      (product, shop, external_id) и записывает только добавленные, измененные и удаленные строки.
+    - replace: удаляет все предложения магазина и создает их заново.
+
+    Предложения, на которые ссылаются позиции заказов, не удаляются (удаление каскадом стерло бы
+    позиции), а остаются с нулевым количеством.
+
+    Attributes:
+    - user_id: ID пользователя-владельца магазина.
+    - mode: Режим импорта.
+    - batch_size: Размер пачки товаров.
+    - progress: Необязательная функция, получающая число обработанных товаров после каждой пачки.
+    - stats: Статистика импорта (количество строк, запросов, время и скорость).
+    """
+    MODES = ('sync', 'replace')
+    FIELDS = ('model', 'price', 'price_rrc', 'quantity')
+
+    def __init__(self, user_id, mode='sync', batch_size=BATCH_SIZE, progress=None):
+        if mode not in self.MODES:
+            raise ValueError(f'Неизвестный режим импорта: {mode}')
+        self.user_id = user_id
+        self.mode = mode
+        self.batch_size = batch_size
+        self.progress = progress
+        self.shop = None
+        self.seen = set()
+        self.stats = {'goods': 0, 'parameters': 0, 'created': 0, 'updated': 0, 'deleted': 0, 'zeroed': 0,
+                      'unchanged': 0, 'writes': 0, 'queries': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+
+    def run(self, records):
+        """
+        Import a price list.
+
+        Categories and goods are written in batches as they arrive, so the records may come from a streaming parser.
+
+        Args:
+        - records (iterable): The (kind, value) records from backend.parsers, the shop record must come first.
+
+        Returns:
+        - dict: The import statistics.
+        """
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter), transaction.atomic():
+            categories, goods = [], []
+            for kind, value in records:
+                if kind == 'shop':
+                    if self.shop is None:
+                        self.set_shop(value)
+                    continue
+                if self.shop is None:
+                    raise ValueError('Магазин должен быть указан в начале прайс-листа')
+
+                if kind == 'category':
+                    categories.append(value)
+                elif kind == 'good':
+                    goods.append(value)
+                if len(categories) >= self.batch_size or len(goods) >= self.batch_size:
+                    self._flush(categories, goods)
+
+            if self.shop is None:
+                raise ValueError('В прайс-листе не указан магазин')
+            self._flush(categories, goods)
+            self.finish()
+            invalidate_catalog(self.shop.id)
+            invalidate_directories()
+
+        seconds = time.perf_counter() - started
+        rows = self.stats['goods'] + self.stats['parameters']
+        self.stats.update({
+            'queries': counter.count,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds, 1) if seconds else 0.0,
+        })
+        return self.stats
+
+    def _flush(self, categories, goods):
+        """Записывает накопленные категории и товары и очищает буферы"""
+        if categories:
+            self.add_categories(categories)
+            categories.clear()
+        if goods:
+            self.add_goods(goods)
+            goods.clear()
+            if self.progress:
+                self.progress(self.stats['goods'])
+
+    def set_shop(self, name):
+        """Находит или создает магазин, в режиме replace удаляет его старые предложения"""
+        self.shop, _ = Shop.objects.get_or_create(name=name, user_id=self.user_id)
+        if self.mode == 'replace':
+            self._remove(ProductInfo.objects.filter(shop_id=self.shop.id))
+
+    def add_categories(self, categories):
+        """Создает недостающие категории и привязывает их к магазину"""
+        names = {category['id']: category['name'] for category in categories}
+        if not names:
+            return
+
+        existing = set(Category.objects.filter(id__in=names).values_list('id', flat=True))
+        Category.objects.bulk_create(
+            [Category(id=category_id, name=name) for category_id, name in names.items() if category_id not in existing])
+
+        through = Category.shops.through
+        through.objects.bulk_create(
+            [through(category_id=category_id, shop_id=self.shop.id) for category_id in names], ignore_conflicts=True)
+
+    def add_goods(self, goods):
+        """
+        Write one batch of goods, touching only the rows that differ from the stored ones.
+
+        Args:
+        - goods (list): The goods of the price list.
+        """
+        products = self._resolve_products({(item['name'], item['category']) for item in goods})
+        parameters = self._resolve_parameters({name for item in goods for name in item['parameters']})
+        keyed = {(products[(item['name'], item['category'])], item['id']): item for item in goods}
+
+        stored = self._stored_product_infos({item['id'] for item in goods})
+        stored_ids = [stored[key]['id'] for key in keyed if key in stored]
+        to_create, to_update = [], []
+        for key, item in keyed.items():
+            values = {field: item[field] for field in self.FIELDS}
+            if key not in stored:
+                to_create.append(ProductInfo(product_id=key[0], external_id=key[1], shop_id=self.shop.id, **values))
+            elif any(stored[key][field] != value for field, value in values.items()):
+                to_update.append(ProductInfo(id=stored[key]['id'], **values))
+
+        ProductInfo.objects.bulk_create(to_create)
+        ProductInfo.objects.bulk_update(to_update, self.FIELDS)
+        if to_create:
+            stored = self._stored_product_infos({item['id'] for item in goods})
+
+        product_info_ids = {key: stored[key]['id'] for key in keyed}
+        changed = {product_info_ids[(item.product_id, item.external_id)] for item in to_create}
+        changed.update(item.id for item in to_update)
+        changed |= self._sync_parameters(
+            {(product_info_ids[key], parameters[name]): str(value)
+             for key, item in keyed.items() for name, value in item['parameters'].items()},
+            stored_ids)
+        self.seen.update(product_info_ids.values())
+        refresh_catalog(changed)
+
+        self.stats['goods'] += len(goods)
+        self.stats['parameters'] += sum(len(item['parameters']) for item in goods)
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        self.stats['unchanged'] += len(keyed) - len(to_create) - len(to_update)
+        self.stats['writes'] += len(to_create) + len(to_update)
+
+    def finish(self):
+        """Удаляет предложения магазина, которых больше нет в прайс-листе"""
+        if self.mode != 'sync':
+            return
+
+        # устаревшие предложения отбираются в базе: по отрезкам ID между пачками встреченных предложений
+        offers = ProductInfo.objects.filter(shop_id=self.shop.id)
+        lower = None
+        for batch in chunked(sorted(self.seen), self.batch_size):
+            stale = offers.filter(id__lte=batch[-1]).exclude(id__in=batch)
+            self._remove(stale if lower is None else stale.filter(id__gt=lower))
+            lower = batch[-1]
+        self._remove(offers if lower is None else offers.filter(id__gt=lower))
+
+    def _remove(self, offers):
+        """
+        Delete the offers of the shop, zeroing the stock of those referenced by order items instead.
+
+        Args:
+        - offers (QuerySet): The offers to remove.
+        """
+        zeroed = list(offers.filter(ordered_items__isnull=False).exclude(quantity=0).values_list(
+            'id', flat=True).distinct())
+        if zeroed:
+            ProductInfo.objects.filter(id__in=zeroed).update(quantity=0)
+            refresh_quantities(zeroed)
+        deleted = offers.filter(ordered_items__isnull=True).delete()[1].get(ProductInfo._meta.label, 0)
+
+        self.stats['deleted'] += deleted
+        self.stats['zeroed'] += len(zeroed)
+        self.stats['writes'] += deleted + len(zeroed)
+
+    def _stored_product_infos(self, external_ids):
+        """Возвращает сохраненные предложения магазина по ключу (ID продукта, внешний ID)"""
+        return {
+            (row['product_id'], row['external_id']): row
+            for row in ProductInfo.objects.filter(shop_id=self.shop.id, external_id__in=external_ids).values(
+                'id', 'product_id', 'external_id', *self.FIELDS)}
+
+    def _sync_parameters(self, wanted, stored_ids):
+        """
+        Bring the parameters of a batch to the wanted state.
+
+        Args:
+        - wanted (dict): The wanted values keyed by (product info ID, parameter ID).
+        - stored_ids (list): The IDs of product infos that existed before this batch.
+
+        Returns:
+        - set: The IDs of product infos whose parameters were changed.
+        """
+        stored = {
+            (product_info_id, parameter_id): (product_parameter_id, value)
+            for product_parameter_id, product_info_id, parameter_id, value in ProductParameter.objects.filter(
+                product_info_id__in=stored_ids).values_list('id', 'product_info_id', 'parameter_id', 'value')
+        } if stored_ids else {}
+
+        to_create, to_update = [], []
+        for (product_info_id, parameter_id), value in wanted.items():
+            if (product_info_id, parameter_id) not in stored:
+                value_num, unit = normalize_value(value)
+                to_create.append(ProductParameter(product_info_id=product_info_id, parameter_id=parameter_id,
+                                                  value=value, value_num=value_num, unit=unit))
+            elif stored[(product_info_id, parameter_id)][1] != value:
+                value_num, unit = normalize_value(value)
+                to_update.append(ProductParameter(id=stored[(product_info_id, parameter_id)][0],
+                                                  product_info_id=product_info_id, value=value, value_num=value_num,
+                                                  unit=unit))
+        to_delete = {key: product_parameter_id for key, (product_parameter_id, _) in stored.items()
+                     if key not in wanted}
+
+        ProductParameter.objects.bulk_create(to_create)
+        ProductParameter.objects.bulk_update(to_update, ['value', 'value_num', 'unit'])
+        if to_delete:
+            ProductParameter.objects.filter(id__in=to_delete.values()).delete()
+        self.stats['writes'] += len(to_create) + len(to_update) + len(to_delete)
+        return {item.product_info_id for item in to_create + to_update} | {key[0] for key in to_delete}
+
+    @staticmethod
+    def _resolve_products(keys):
+        """Возвращает словарь (название, ID категории) -> ID продукта, создавая недостающие продукты"""
+
+        def lookup():
+            return {
+                (name, category_id): product_id
+                for product_id, name, category_id in Product.objects.filter(
+                    name__in={name for name, _ in keys}).values_list('id', 'name', 'category_id')}
+
+        products = lookup()
+        missing = keys - products.keys()
+        if missing:
+            Product.objects.bulk_create([Product(name=name, category_id=category_id) for name, category_id in missing])
+            products = lookup()
+        return products
+
+    @staticmethod
+    def _resolve_parameters(names):
+        """Возвращает словарь название -> ID параметра, создавая недостающие параметры"""
+
+        def lookup():
+            return dict(Parameter.objects.filter(name__in=names).values_list('name', 'id'))
+
+        parameters = lookup()
+        missing = names - parameters.keys()
+        if missing:
+            Parameter.objects.bulk_create([Parameter(name=name) for name in missing])
+            parameters = lookup()
+        return parameters
+
+
+def import_price_list(user_id, data, mode='sync', batch_size=BATCH_SIZE):
+    """
+    Import a parsed price list for the shop of the given user.
+
+    Args:
+    - user_id (int): The ID of the shop owner.
+    - data (dict): The price list with 'shop', 'categories' and 'goods' keys.
+    - mode (str): 'sync' to write only the differences, 'replace' to recreate all offers.
+    - batch_size (int): The number of goods written per batch.
+
+    Returns:
+    - dict: The import statistics.
+    """
+    return PriceListImporter(user_id, mode=mode, batch_size=batch_size).run(iter_records(data))
@@ -0,0 +1,171 @@
+import asyncio
+import io
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from backend.benchmark import prepare_benchmark
+from backend.models import Product, User
+from netology_pd_diplom.asgi import ASGIApplication
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of concurrent requests to the WSGI and the ASGI (async views) applications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Product infos to generate')
+        parser.add_argument('--orders', type=int, default=50, help='Placed orders of the benchmark buyer')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per endpoint and application')
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight at once')
+        parser.add_argument('--wsgi-threads', type=int, default=4,
+                            help='Threads of the WSGI worker, like gunicorn --threads')
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help='Milliseconds added to every query to imitate a database over the network')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        # в отличие от bench_endpoints, данные фиксируются: потоки ASGI работают со своими соединениями
+        # и не видят незафиксированную транзакцию; после замеров данные удаляются
+        context = prepare_benchmark(products=options['products'], buyers=1, orders_per_buyer=options['orders'])
+        latency = options['db_latency'] / 1000
+
+        def delay(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_delay(sender, connection, **kwargs):
+            connection.execute_wrappers.append(delay)
+
+        if latency:
+            connection_created.connect(add_delay)
+            for connection in connections.all():
+                connection.execute_wrappers.append(delay)
+        try:
+            # выборка SQL медленных запросов под нагрузкой засыпала бы вывод журналом
+            with override_settings(ALLOWED_HOSTS=['*'], METRICS_SLOW_SAMPLE_RATE=0):
+                results = self.run_cases(context, options)
+        finally:
+            connection_created.disconnect(add_delay)
+            for connection in connections.all():
+                if delay in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(delay)
+            User.objects.filter(id__in=[context['buyer'].id, context['partner'].id]).delete()
+            Product.objects.filter(name__startswith='Товар ', product_infos__isnull=True).delete()
+
+        for result in results:
+            self.stdout.write(
+                f'{result["endpoint"]:<10} WSGI {result["wsgi"]["rps"]:8.1f} req/s '
+                f'p95 {result["wsgi"]["p95_ms"]:8.2f} ms   ASGI {result["asgi"]["rps"]:8.1f} req/s '
+                f'p95 {result["asgi"]["p95_ms"]:8.2f} ms   x{result["asgi"]["rps"] / result["wsgi"]["rps"]:.2f}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'options': {name: options[name] for name in (
+                    'products', 'orders', 'requests', 'concurrency', 'wsgi_threads', 'db_latency')},
+                    'database': connections['default'].vendor, 'results': results}, file, indent=2)
+
+    def run_cases(self, context, options):
+        token = context['tokens'][context['buyer'].id]
+        cases = [
+            ('products', reverse('backend:products'), {'limit': 20}, None),
+            ('categories', reverse('backend:categories'), {}, None),
+            ('shops', reverse('backend:shops'), {}, None),
+            ('orders', reverse('backend:order'), {'limit': 20}, token),
+        ]
+        wsgi, asgi = WSGIHandler(), ASGIApplication()
+        results = []
+        for name, path, params, token in cases:
+            headers = [('Authorization', f'Token {token}')] if token else []
+            query = urlencode(params)
+            results.append({
+                'endpoint': name,
+                'wsgi': self.run_wsgi(wsgi, path, query, headers, options['requests'], options['wsgi_threads']),
+                'asgi': asyncio.run(self.run_asgi(asgi, path, query, headers, options['requests'],
+                                                  options['concurrency'])),
+            })
+        return results
+
+    @staticmethod
+    def summary(timings, elapsed):
+        timings.sort()
+        return {
+            'rps': round(len(timings) / elapsed, 1),
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        }
+
+    def run_wsgi(self, app, path, query, headers, requests, threads):
+        """Выполняет запросы в пуле потоков, как воркер WSGI-сервера с несколькими потоками"""
+        def request(_):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'testserver', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.multithread': True,
+                'wsgi.multiprocess': False, 'wsgi.run_once': False,
+                **{f'HTTP_{name.upper()}': value for name, value in headers},
+            }
+            statuses = []
+            started = time.perf_counter()
+            result = app(environ, lambda status, response_headers: statuses.append(status))
+            b''.join(result)
+            result.close()
+            assert statuses[0].startswith('200'), statuses[0]
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            timings = list(executor.map(request, range(requests)))
+        return self.summary(timings, time.perf_counter() - started)
+
+    async def run_asgi(self, app, path, query, headers, requests, concurrency):
+        """Выполняет запросы в одном цикле событий, не больше concurrency одновременно"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+                'headers': [(b'host', b'testserver')] + [(name.lower().encode(), value.encode())
+                                                          for name, value in headers],
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            sent = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # клиент не отключается, обработчик сам отменит ожидание после ответа
+                await asyncio.Future()
+
+            async def send(message):
+                sent.append(message)
+
+            async with semaphore:
+                started = time.perf_counter()
+                await app(scope, receive, send)
+                assert sent[0]['status'] == 200, sent[0]['status']
+                return time.perf_counter() - started
+
+        # как в asgi.py: соединения потоков запросов не переиспользуются
+        max_age = {alias: connections.settings[alias]['CONN_MAX_AGE'] for alias in connections}
+        for alias in connections:
+            connections.settings[alias]['CONN_MAX_AGE'] = 0
+        try:
+            started = time.perf_counter()
+            timings = await asyncio.gather(*[request() for _ in range(requests)])
+            return self.summary(list(timings), time.perf_counter() - started)
+        finally:
+            for alias, value in max_age.items():
+                connections.settings[alias]['CONN_MAX_AGE'] = value
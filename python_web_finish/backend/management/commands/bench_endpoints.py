@@ -0,0 +1,79 @@
+import json
+import platform
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from backend.benchmark import prepare_benchmark, run_endpoint_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Time the API endpoints on generated data, check their query budgets and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Product infos to generate')
+        parser.add_argument('--shops', type=int, default=1, help='Shops to split the products between')
+        parser.add_argument('--buyers', type=int, default=10, help='Buyers with orders')
+        parser.add_argument('--orders-per-buyer', type=int, default=10, help='Placed orders of each buyer')
+        parser.add_argument('--items-per-order', type=int, default=5, help='Items in each order')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each endpoint')
+        parser.add_argument('--warm', action='store_true', help='Keep the caches between runs')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Show the change of median times against a previous results file')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        # данные создаются в транзакции и откатываются после замеров; тестовый клиент ходит на testserver
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            context = prepare_benchmark(shops=options['shops'], products=options['products'],
+                                        buyers=options['buyers'], orders_per_buyer=options['orders_per_buyer'],
+                                        items_per_order=options['items_per_order'])
+            prepared = time.perf_counter() - started
+            results = run_endpoint_benchmarks(context, repeat=options['repeat'], warm=options['warm'])
+            transaction.set_rollback(True)
+
+        report = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'revision': self.revision(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'scale': context['scale'],
+            'warm': options['warm'],
+            'prepare_seconds': round(prepared, 3),
+            'results': results,
+        }
+        previous = self.load(options['compare']) if options['compare'] else {}
+
+        for result in results:
+            line = (f'{result["endpoint"]:<24} median {result["median_ms"]:9.2f} ms  p95 {result["p95_ms"]:9.2f} ms  '
+                    f'queries {result["queries"]:>3}/{result["max_queries"]:<3}')
+            if result['endpoint'] in previous:
+                line += f'  x{result["median_ms"] / previous[result["endpoint"]]:.2f} vs previous'
+            if not result['ok']:
+                line += '  FAILED ' + '; '.join(result['errors'][:1])
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+        failed = [result['endpoint'] for result in results if not result['ok']]
+        if failed:
+            raise CommandError(f'Over the query budget or failed: {", ".join(failed)}')
+
+    @staticmethod
+    def load(path):
+        """Возвращает медианы времени из файла результатов предыдущего запуска"""
+        with open(path, encoding='utf-8') as file:
+            return {result['endpoint']: result['median_ms'] for result in json.load(file)['results']}
+
+    @staticmethod
+    def revision():
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,83 @@
+import queue
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.benchmark import create_users, generate_catalog
+from backend.models import Contact, Order, OrderItem, ProductInfo, User
+from backend.stock import InsufficientStock, place_order
+
+
+class Command(BaseCommand):
+    help = 'Place orders for one product from many threads and check that the stock is never oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent buyers')
+        parser.add_argument('--orders', type=int, default=500, help='Orders to place')
+        parser.add_argument('--stock', type=int, default=300, help='Initial stock of the product')
+        parser.add_argument('--quantity', type=int, default=1, help='Quantity of the product in each order')
+
+    def handle(self, *args, **options):
+        # потокам нужны зафиксированные данные, поэтому они создаются вне транзакции и удаляются в конце
+        shops = generate_catalog(shops=1, goods_per_shop=1)
+        buyers = create_users(options['orders'])
+        try:
+            placed, rejected, seconds, stock = self.run(shops[0].id, buyers, options)
+        finally:
+            User.objects.filter(id__in=[user.id for user in shops + buyers]).delete()
+
+        oversold = max(0, placed * options['quantity'] - options['stock'])
+        self.stdout.write(
+            f'{options["threads"]} threads on {connection.vendor}: {placed} placed, {rejected} rejected '
+            f'in {seconds:.2f} s, {(placed + rejected) / seconds:.0f} orders/s; '
+            f'stock left {stock}, oversold {oversold}')
+        if oversold or stock != options['stock'] - placed * options['quantity']:
+            raise CommandError('Stock is inconsistent')
+
+    @staticmethod
+    def run(shop_user_id, buyers, options):
+        product_info = ProductInfo.objects.get(shop__user_id=shop_user_id)
+        ProductInfo.objects.filter(id=product_info.id).update(quantity=options['stock'])
+
+        contacts = Contact.objects.bulk_create(
+            [Contact(user_id=buyer.id, city='Москва', street='Тверская', phone='+70000000000') for buyer in buyers])
+        orders = Order.objects.bulk_create([Order(user_id=buyer.id, state='basket') for buyer in buyers])
+        if orders and orders[0].pk is None:
+            orders = list(Order.objects.filter(user_id__in=[buyer.id for buyer in buyers]).order_by('user_id'))
+        if contacts and contacts[0].pk is None:
+            contacts = list(Contact.objects.filter(user_id__in=[buyer.id for buyer in buyers]).order_by('user_id'))
+        OrderItem.objects.bulk_create([OrderItem(order_id=order.id, product_info_id=product_info.id,
+                                                 quantity=options['quantity']) for order in orders])
+
+        tasks = queue.SimpleQueue()
+        for order, contact in zip(orders, contacts):
+            tasks.put((order, contact))
+        results = []
+
+        def buyer():
+            # у каждого потока свое соединение с базой, оно закрывается, когда заказы кончились
+            try:
+                while True:
+                    try:
+                        order, contact = tasks.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        results.append(place_order(order.user_id, order.id, contact.id))
+                    except InsufficientStock:
+                        results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        placed = sum(results)
+        return placed, len(results) - placed, seconds, ProductInfo.objects.get(id=product_info.id).quantity
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from backend.benchmark import create_users, generate_catalog, generate_orders
+from backend.fast_serializers import CATALOG_ENTRY_VALUES, ORDER_VALUES, serialize_catalog_entries, \
+    serialize_orders
+from backend.models import CatalogEntry, Order, ProductInfo, order_total_sum
+from backend.renderers import UJSONRenderer
+from backend.serializers import OrderSerializer, ProductInfoSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-row cost of DRF serializers and the fast serialization path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Rows per response')
+        parser.add_argument('--items-per-order', type=int, default=10, help='Items in each generated order')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs of each path, the best one is reported')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        # синтетические данные создаются в транзакции и откатываются после замеров
+        with transaction.atomic():
+            generate_catalog(shops=1, goods_per_shop=rows)
+            buyer = create_users(1)[0]
+            generate_orders([buyer], orders_per_user=max(rows // options['items_per_order'], 1),
+                            items_per_order=options['items_per_order'])
+
+            orders = Order.objects.filter(user_id=buyer.id).annotate(total_sum=order_total_sum()).order_by('-id')
+
+            self.compare('products', rows, options['repeat'],
+                         lambda: JSONRenderer().render(self.serialize_in_chunks(
+                             ProductInfoSerializer, ProductInfo.objects.select_related('product__category')
+                             .prefetch_related('product_parameters__parameter').order_by('id'))),
+                         lambda: UJSONRenderer().render(serialize_catalog_entries(
+                             CatalogEntry.objects.order_by('product_info_id').values(*CATALOG_ENTRY_VALUES))))
+            self.compare('orders', rows, options['repeat'],
+                         lambda: JSONRenderer().render(self.serialize_in_chunks(
+                             OrderSerializer, orders.prefetch_related(
+                                 'ordered_items__product_info__product__category',
+                                 'ordered_items__product_info__product_parameters__parameter').select_related(
+                                 'contact'), chunk_size=max(1000 // options['items_per_order'], 1))),
+                         lambda: UJSONRenderer().render(serialize_orders(list(orders.values(*ORDER_VALUES)))))
+            transaction.set_rollback(True)
+
+    def compare(self, name, rows, repeat, drf, fast):
+        """Замеряет оба пути и выводит стоимость одной строки в микросекундах"""
+        drf_seconds, drf_body = self.measure(drf, repeat)
+        fast_seconds, fast_body = self.measure(fast, repeat)
+        self.stdout.write(
+            f'{name}: {rows} rows, DRF {drf_seconds / rows * 1e6:.1f} us/row, '
+            f'fast {fast_seconds / rows * 1e6:.1f} us/row, x{drf_seconds / fast_seconds:.1f}, '
+            f'identical output: {drf_body == fast_body}')
+
+    @staticmethod
+    def serialize_in_chunks(serializer_class, queryset, chunk_size=1000):
+        """Сериализует queryset частями: prefetch_related на SQLite не выдерживает десятков тысяч строк сразу"""
+        data = []
+        ids = list(queryset.values_list('id', flat=True))
+        for start in range(0, len(ids), chunk_size):
+            data += serializer_class(queryset.filter(id__in=ids[start:start + chunk_size]), many=True).data
+        return data
+
+    @staticmethod
+    def measure(func, repeat):
+        best, body = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from backend.benchmark import case_client, case_data, clear_caches, endpoint_cases, prepare_benchmark, send_case
+from backend.explain import EXPLAINED_VENDORS, capture_statements, full_scans, table_sizes
+
+
+class Command(BaseCommand):
+    help = 'Replay the endpoint benchmark, explain its queries and report full scans of large tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Product infos to generate')
+        parser.add_argument('--shops', type=int, default=1, help='Shops to split the products between')
+        parser.add_argument('--buyers', type=int, default=10, help='Buyers with orders')
+        parser.add_argument('--orders-per-buyer', type=int, default=10, help='Placed orders of each buyer')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Report full scans only of tables with at least this many rows')
+        parser.add_argument('--strict', action='store_true', help='Fail if any full scan is reported')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAINED_VENDORS:
+            raise CommandError(f'Query plans of {connection.vendor} are not supported, '
+                               f'use one of: {", ".join(EXPLAINED_VENDORS)}')
+        findings = []
+        # как и bench_endpoints, данные создаются в транзакции и откатываются
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            context = prepare_benchmark(shops=options['shops'], products=options['products'],
+                                        buyers=options['buyers'], orders_per_buyer=options['orders_per_buyer'])
+            # планировщику нужна статистика по сгенерированным данным
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            for name, method, path, data, user, _ in endpoint_cases(context):
+                clear_caches()
+                data = case_data(data)
+                with capture_statements() as statements:
+                    send_case(case_client(context, user), method, path, data)
+                for sql, params in statements.items():
+                    findings += [(name, table, detail, sql) for table, detail in full_scans(sql, params)]
+
+            sizes = table_sizes({table for _, table, _, _ in findings})
+            transaction.set_rollback(True)
+
+        findings = [(name, table, detail, sql) for name, table, detail, sql in findings
+                    if sizes[table] >= options['min_rows']]
+        for name, table, detail, sql in findings:
+            self.stdout.write(f'{name:<24} {table} ({sizes[table]} rows): {detail}\n    {sql[:300]}')
+        self.stdout.write(f'{len(findings)} full scans of tables with at least {options["min_rows"]} rows')
+
+        if findings and options['strict']:
+            raise CommandError(f'Full scans in: {", ".join(sorted({name for name, *_ in findings}))}')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from backend.catalog import rebuild_catalog
+from backend.models import CatalogEntry
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized product catalog used by /products'
+
+    def handle(self, *args, **options):
+        rebuild_catalog()
+        self.stdout.write(
+            self.style.SUCCESS(f'Catalog rebuilt: {CatalogEntry.objects.count()} entries')
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from backend.outbox import dispatch_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send the due emails of the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails per batch')
+
+    def handle(self, *args, **options):
+        stats = dispatch_outbox(batch_size=options['batch_size'])
+        self.stdout.write(f'sent {stats["sent"]}, retried {stats["retried"]}, failed {stats["failed"]}')
@@ -0,0 +1,293 @@
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from backend.authentication import token_cache
+
+# Метрики запросов в памяти процесса в текстовом формате Prometheus. Каждый процесс веб-сервера
+# отдает свои значения, суммирует их Prometheus.
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+FETCH_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=''):
+    labels = ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    if extra:
+        labels = f'{labels},{extra}' if labels else extra
+    return f'{{{labels}}}' if labels else ''
+
+
+class CounterMetric:
+    """Счетчик Prometheus с метками"""
+
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, label_values=(), amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in sorted(self.values.items()):
+            yield f'{self.name}{format_labels(self.labels, label_values)} {value}'
+
+
+class HistogramMetric:
+    """Гистограмма Prometheus с метками; счетчики корзин хранятся без накопления и суммируются при выводе"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets, labels=()):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        self.values = {}
+
+    def observe(self, label_values, value):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for label_values, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = format_labels(self.labels, label_values, f'le="{bound}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {round(total, 6)}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+    """Набор метрик с общей блокировкой"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for metric in self.metrics:
+                lines += [f'# HELP {metric.name} {metric.description}', f'# TYPE {metric.name} {metric.kind}']
+                lines += metric.samples()
+        return lines
+
+    def clear(self):
+        with self.lock:
+            for metric in self.metrics:
+                metric.values.clear()
+
+
+registry = Registry()
+requests_total = registry.add(CounterMetric(
+    'http_requests_total', 'Requests by view, method and response status', ('view', 'method', 'status')))
+request_duration = registry.add(HistogramMetric(
+    'http_request_duration_seconds', 'Wall time of requests', DURATION_BUCKETS, ('view', 'method')))
+db_duration = registry.add(HistogramMetric(
+    'db_request_duration_seconds', 'Time spent in database queries per request', DURATION_BUCKETS, ('view',)))
+db_queries = registry.add(HistogramMetric(
+    'db_queries_per_request', 'Database queries per request', QUERY_BUCKETS, ('view',)))
+duplicate_queries = registry.add(CounterMetric(
+    'db_duplicate_queries_total', 'Repeated executions of the same SQL within a request', ('view',)))
+slow_requests = registry.add(CounterMetric(
+    'http_slow_requests_total', 'Requests slower than METRICS_SLOW_REQUEST_MS', ('view',)))
+fetch_duration = registry.add(HistogramMetric(
+    'price_list_fetch_duration_seconds', 'Wall time of price list downloads by host and result', FETCH_BUCKETS,
+    ('host', 'result')))
+fetch_bytes = registry.add(CounterMetric(
+    'price_list_fetch_bytes_total', 'Downloaded price list bytes after decompression', ('host',)))
+
+
+class QueryCollector:
+    """Обертка для connection.execute_wrapper, которая считает запросы к базе во время одного запроса.
+
+    Django передает SQL с плейсхолдерами отдельно от параметров, поэтому одинаковый текст SQL
+    служит отпечатком запроса: многократный повтор отпечатка означает N+1.
+
+    Attributes:
+    - count: Число запросов.
+    - duration: Суммарное время запросов в секундах.
+    - fingerprints: Число выполнений каждого SQL.
+    - statements: Время и SQL первых запросов или None, если SQL не сохраняется. Параметры не хранятся:
+      в них бывают ключи токенов, почта и пароли, которым не место в журнале.
+    """
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.statements = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self.fingerprints[sql] += 1
+            if self.statements is not None and len(self.statements) < settings.METRICS_SLOW_SQL_LIMIT:
+                self.statements.append((elapsed, sql))
+
+    @property
+    def duplicates(self):
+        """Число повторных выполнений уже выполненного SQL"""
+        return sum(count - 1 for count in self.fingerprints.values() if count > 1)
+
+
+def record_request(view, method, status, elapsed, collector):
+    """
+    Add a finished request to the metrics and log it if it is slow or repeats a query too often.
+
+    Args:
+    - view (str): The URL name of the view.
+    - method (str): The HTTP method.
+    - status (int): The response status.
+    - elapsed (float): The wall time of the request in seconds.
+    - collector (QueryCollector): The queries of the request.
+    """
+    slow = elapsed * 1000 >= settings.METRICS_SLOW_REQUEST_MS
+    duplicates = collector.duplicates
+    with registry.lock:
+        requests_total.inc((view, method, str(status)))
+        request_duration.observe((view, method), elapsed)
+        db_duration.observe((view,), collector.duration)
+        db_queries.observe((view,), collector.count)
+        if duplicates:
+            duplicate_queries.inc((view,), duplicates)
+        if slow:
+            slow_requests.inc((view,))
+
+    if duplicates:
+        sql, count = collector.fingerprints.most_common(1)[0]
+        if count >= settings.METRICS_N_PLUS_ONE_THRESHOLD:
+            logger.warning('Possible N+1 in %s %s: %d executions of %s', method, view, count, sql)
+    if slow and collector.statements is not None:
+        logger.warning('Slow request %s %s: %.0f ms, %d queries, %.0f ms in database\n%s', method, view,
+                       elapsed * 1000, collector.count, collector.duration * 1000, '\n'.join(
+                           f'{duration * 1000:.1f} ms: {sql}' for duration, sql in collector.statements))
+
+
+def record_fetch(host, result, elapsed, size):
+    """
+    Add a finished price list download to the metrics.
+
+    Args:
+    - host (str): The host of the price list URL.
+    - result (str): The response status or the name of the exception.
+    - elapsed (float): The wall time of the download in seconds.
+    - size (int): The downloaded bytes after decompression.
+    """
+    with registry.lock:
+        fetch_duration.observe((host, result), elapsed)
+        if size:
+            fetch_bytes.inc((host,), size)
+
+
+class InstrumentationMiddleware:
+    """Middleware, которое замеряет время запроса, число и время запросов к базе и собирает их в registry.
+
+    SQL запросов сохраняется только у доли METRICS_SLOW_SAMPLE_RATE запросов, выбранной заранее,
+    чтобы остальные запросы не платили за журнал медленных запросов. Работает и в WSGI, и в ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        collector = QueryCollector(keep_sql=random.random() < settings.METRICS_SLOW_SAMPLE_RATE)
+        started = time.perf_counter()
+        with self.wrap_connections(collector):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, collector)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        collector = QueryCollector(keep_sql=random.random() < settings.METRICS_SLOW_SAMPLE_RATE)
+        started = time.perf_counter()
+        # ORM асинхронных представлений работает в потоке запроса (sync_to_async), и обертки
+        # ставятся на соединения этого потока
+        stack = await sync_to_async(self.wrap_connections)(collector)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.record(request, response, time.perf_counter() - started, collector)
+        return response
+
+    @staticmethod
+    def wrap_connections(collector):
+        """Подключает collector ко всем соединениям текущего потока до закрытия возвращаемого ExitStack"""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(collector))
+        return stack
+
+    @staticmethod
+    def record(request, response, elapsed, collector):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else 'unmatched'
+        record_request(view, request.method, response.status_code, elapsed, collector)
+
+
+def token_cache_samples():
+    """Возвращает счетчики кэша токенов (backend.authentication) в формате Prometheus"""
+    stats = token_cache.stats()
+    return [
+        '# HELP auth_token_cache_lookups_total Token cache lookups by result',
+        '# TYPE auth_token_cache_lookups_total counter',
+        f'auth_token_cache_lookups_total{{result="local_hit"}} {stats["local_hits"]}',
+        f'auth_token_cache_lookups_total{{result="shared_hit"}} {stats["shared_hits"]}',
+        f'auth_token_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+        '# HELP auth_token_cache_entries Entries in the process-local token cache',
+        '# TYPE auth_token_cache_entries gauge',
+        f'auth_token_cache_entries {stats["size"]}',
+    ]
+
+
+def render_metrics():
+    """Возвращает все метрики процесса в текстовом формате Prometheus"""
+    return '\n'.join(registry.render() + token_cache_samples()) + '\n'
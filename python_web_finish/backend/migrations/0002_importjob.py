@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Ссылка на прайс-лист')),
+                ('mode', models.CharField(default='sync', max_length=10, verbose_name='Режим импорта')),
+                ('state', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Ошибка')], default='queued', max_length=10, verbose_name='Статус')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано товаров')),
+                ('stats', models.JSONField(blank=True, default=dict, verbose_name='Статистика импорта')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задача импорта',
+                'verbose_name_plural': 'Список задач импорта',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='format',
+            field=models.CharField(blank=True, max_length=10, verbose_name='Формат прайс-листа'),
+        ),
+    ]
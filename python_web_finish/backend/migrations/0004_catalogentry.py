@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_catalog(apps, schema_editor):
+    """Заполняет каталог из уже импортированных предложений"""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+
+    parameters = {}
+    for product_info_id, name, value in ProductParameter.objects.order_by('id').values_list(
+            'product_info_id', 'parameter__name', 'value').iterator():
+        parameters.setdefault(product_info_id, []).append({'parameter': name, 'value': value})
+
+    CatalogEntry.objects.bulk_create(
+        (CatalogEntry(product_info_id=row['id'], shop_id=row['shop_id'], shop_state=row['shop__state'],
+                      category_id=row['product__category_id'], category_name=row['product__category__name'],
+                      product_name=row['product__name'], model=row['model'], quantity=row['quantity'],
+                      price=row['price'], price_rrc=row['price_rrc'], parameters=parameters.get(row['id'], []))
+         for row in ProductInfo.objects.values(
+            'id', 'shop_id', 'shop__state', 'product__name', 'product__category_id', 'product__category__name',
+            'model', 'quantity', 'price', 'price_rrc').iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_importjob_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='backend.productinfo', verbose_name='Информация о продукте')),
+                ('shop_state', models.BooleanField(default=True, verbose_name='статус получения заказов')),
+                ('category_name', models.CharField(max_length=40, verbose_name='Название категории')),
+                ('product_name', models.CharField(max_length=80, verbose_name='Название продукта')),
+                ('model', models.CharField(blank=True, max_length=80, verbose_name='Модель')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('price_rrc', models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')),
+                ('parameters', models.JSONField(blank=True, default=list, verbose_name='Параметры')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.category', verbose_name='Категория')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Запись каталога',
+                'verbose_name_plural': 'Каталог',
+                'indexes': [models.Index(fields=['shop_state', 'category'], name='catalog_state_category_idx')],
+            },
+        ),
+        migrations.RunPython(fill_catalog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# Полнотекстовый индекс каталога для backend.search: на SQLite - таблица FTS5, которую ведут триггеры
+# на backend_catalogentry, на PostgreSQL - GIN-индекс по tsvector. Другие базы ищут через индекс в памяти.
+
+SQLITE_TEXT = """{row}.product_name || ' ' || {row}.model || ' ' || coalesce(
+    (SELECT group_concat(json_extract(value, '$.value'), ' ') FROM json_each({row}.parameters)), '')"""
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE backend_catalog_search USING fts5(text, tokenize = 'unicode61')",
+    f"""CREATE TRIGGER backend_catalog_search_insert AFTER INSERT ON backend_catalogentry BEGIN
+        INSERT INTO backend_catalog_search (rowid, text) VALUES (NEW.product_info_id, {SQLITE_TEXT.format(row='NEW')});
+    END""",
+    f"""CREATE TRIGGER backend_catalog_search_update AFTER UPDATE OF product_name, model, parameters
+        ON backend_catalogentry BEGIN
+        DELETE FROM backend_catalog_search WHERE rowid = OLD.product_info_id;
+        INSERT INTO backend_catalog_search (rowid, text) VALUES (NEW.product_info_id, {SQLITE_TEXT.format(row='NEW')});
+    END""",
+    """CREATE TRIGGER backend_catalog_search_delete AFTER DELETE ON backend_catalogentry BEGIN
+        DELETE FROM backend_catalog_search WHERE rowid = OLD.product_info_id;
+    END""",
+    f"""INSERT INTO backend_catalog_search (rowid, text)
+        SELECT product_info_id, {SQLITE_TEXT.format(row='backend_catalogentry')} FROM backend_catalogentry""",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS backend_catalog_search_insert',
+    'DROP TRIGGER IF EXISTS backend_catalog_search_update',
+    'DROP TRIGGER IF EXISTS backend_catalog_search_delete',
+    'DROP TABLE IF EXISTS backend_catalog_search',
+]
+
+POSTGRES_FORWARD = [
+    """CREATE INDEX catalog_search_idx ON backend_catalogentry USING gin ((
+        to_tsvector('simple', product_name || ' ' || model) ||
+        jsonb_to_tsvector('simple', parameters, '["string"]')))""",
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS catalog_search_idx',
+]
+
+
+def run(statements):
+    def migrate(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return migrate
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+                             run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD})),
+    ]
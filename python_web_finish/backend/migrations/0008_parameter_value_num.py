@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:18
+
+from django.db import migrations, models
+
+from backend.attributes import normalize_value
+
+
+def fill_value_num(apps, schema_editor):
+    """Нормализует значения уже импортированных параметров"""
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    batch = []
+    for product_parameter in ProductParameter.objects.only('id', 'value').iterator():
+        product_parameter.value_num, product_parameter.unit = normalize_value(product_parameter.value)
+        batch.append(product_parameter)
+        if len(batch) >= 1000:
+            ProductParameter.objects.bulk_update(batch, ['value_num', 'unit'])
+            batch = []
+    ProductParameter.objects.bulk_update(batch, ['value_num', 'unit'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_catalog_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productparameter',
+            name='unit',
+            field=models.CharField(blank=True, max_length=10, verbose_name='Единица измерения'),
+        ),
+        migrations.AddField(
+            model_name='productparameter',
+            name='value_num',
+            field=models.FloatField(blank=True, null=True, verbose_name='Числовое значение'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value_num'], name='parameter_value_num_idx'),
+        ),
+        migrations.RunPython(fill_value_num, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_parameter_value_num'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'state'], name='order_user_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('state', 'basket'), _negated=True), fields=['user', '-dt', '-id'], name='order_user_placed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('state', 'basket'), _negated=True), fields=['-dt', '-id'], name='order_placed_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parameter',
+            index=models.Index(fields=['name'], name='parameter_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'category'], name='product_name_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['state', 'name'], name='shop_state_name_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceListSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Ссылка на прайс-лист')),
+                ('format', models.CharField(max_length=10, verbose_name='Формат прайс-листа')),
+                ('etag', models.CharField(blank=True, max_length=255, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, max_length=64, verbose_name='Last-Modified')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='SHA-256 содержимого')),
+                ('stats', models.JSONField(blank=True, default=dict, verbose_name='Статистика импорта')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='price_list_source', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Источник прайс-листа',
+                'verbose_name_plural': 'Источники прайс-листов',
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:14
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+from backend.search import search_document
+
+# Полнотекстовые индексы из 0007 строились из разных выражений: FTS5 брал значения параметров, а tsvector
+# на PostgreSQL - и названия параметров. Теперь оба индексируют search_text, как и индекс в памяти.
+# SQLite пересоздает таблицу при изменении ее полей, поэтому триггеры удаляются до AddField и создаются после.
+initial = import_module('backend.migrations.0007_catalog_search')
+
+SQLITE_DROP = initial.SQLITE_BACKWARD[:3]
+
+SQLITE_CREATE = [
+    """CREATE TRIGGER backend_catalog_search_insert AFTER INSERT ON backend_catalogentry BEGIN
+        INSERT INTO backend_catalog_search (rowid, text) VALUES (NEW.product_info_id, NEW.search_text);
+    END""",
+    """CREATE TRIGGER backend_catalog_search_update AFTER UPDATE OF search_text ON backend_catalogentry BEGIN
+        DELETE FROM backend_catalog_search WHERE rowid = OLD.product_info_id;
+        INSERT INTO backend_catalog_search (rowid, text) VALUES (NEW.product_info_id, NEW.search_text);
+    END""",
+    """CREATE TRIGGER backend_catalog_search_delete AFTER DELETE ON backend_catalogentry BEGIN
+        DELETE FROM backend_catalog_search WHERE rowid = OLD.product_info_id;
+    END""",
+    'DELETE FROM backend_catalog_search',
+    """INSERT INTO backend_catalog_search (rowid, text)
+        SELECT product_info_id, search_text FROM backend_catalogentry""",
+]
+
+POSTGRES_CREATE = [
+    "CREATE INDEX catalog_search_idx ON backend_catalogentry USING gin (to_tsvector('simple', search_text))",
+]
+
+
+def fill_search_text(apps, schema_editor):
+    """Собирает текст для поиска уже построенных записей каталога"""
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+    batch = []
+    for entry in CatalogEntry.objects.only('product_info_id', 'product_name', 'model', 'parameters').iterator():
+        entry.search_text = search_document(entry.product_name, entry.model, entry.parameters)
+        batch.append(entry)
+        if len(batch) >= 1000:
+            CatalogEntry.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    CatalogEntry.objects.bulk_update(batch, ['search_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_pricelistsource'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            initial.run({'sqlite': SQLITE_DROP, 'postgresql': initial.POSTGRES_BACKWARD}),
+            initial.run({'sqlite': initial.SQLITE_BACKWARD + initial.SQLITE_FORWARD,
+                         'postgresql': initial.POSTGRES_FORWARD})),
+        migrations.AddField(
+            model_name='catalogentry',
+            name='search_text',
+            field=models.TextField(blank=True, default='', verbose_name='Текст для поиска'),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(initial.run({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}),
+                             initial.run({'sqlite': SQLITE_DROP, 'postgresql': initial.POSTGRES_BACKWARD})),
+    ]
@@ -2,6 +2,7 @@ from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
 
@@ -16,6 +17,19 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+IMPORT_JOB_STATE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+)
+
+EMAIL_STATE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('sent', 'Отправлено'),
+    ('failed', 'Ошибка'),
+)
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -105,6 +119,9 @@ class Shop(models.Model):
         verbose_name = 'Магазин'
         verbose_name_plural = "Список магазинов"
         ordering = ('-name',)
+        indexes = [
+            models.Index(fields=['state', 'name'], name='shop_state_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -134,6 +151,9 @@ class Product(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = "Список продуктов"
         ordering = ('-name',)
+        indexes = [
+            models.Index(fields=['name', 'category'], name='product_name_category_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -167,6 +187,9 @@ class Parameter(models.Model):
         verbose_name = 'Имя параметра'
         verbose_name_plural = "Список имен параметров"
         ordering = ('-name',)
+        indexes = [
+            models.Index(fields=['name'], name='parameter_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -179,6 +202,8 @@ class ProductParameter(models.Model):
     parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='product_parameters', blank=True,
                                   on_delete=models.CASCADE)
     value = models.CharField(verbose_name='Значение', max_length=100)
+    value_num = models.FloatField(verbose_name='Числовое значение', null=True, blank=True)
+    unit = models.CharField(verbose_name='Единица измерения', max_length=10, blank=True)
 
     class Meta:
         verbose_name = 'Параметр'
@@ -186,6 +211,35 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
         ]
+        indexes = [
+            models.Index(fields=['parameter', 'value_num'], name='parameter_value_num_idx'),
+        ]
+
+
+class CatalogEntry(models.Model):
+    """Денормализованная запись каталога для чтения без join-ов, обновляется из backend.catalog"""
+    objects = models.manager.Manager()
+    product_info = models.OneToOneField(ProductInfo, verbose_name='Информация о продукте', primary_key=True,
+                                        related_name='catalog_entry', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='catalog_entries', on_delete=models.CASCADE)
+    shop_state = models.BooleanField(verbose_name='статус получения заказов', default=True)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='catalog_entries',
+                                 on_delete=models.CASCADE)
+    category_name = models.CharField(max_length=40, verbose_name='Название категории')
+    product_name = models.CharField(max_length=80, verbose_name='Название продукта')
+    model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    parameters = models.JSONField(verbose_name='Параметры', default=list, blank=True)
+    search_text = models.TextField(verbose_name='Текст для поиска', blank=True, default='')
+
+    class Meta:
+        verbose_name = 'Запись каталога'
+        verbose_name_plural = "Каталог"
+        indexes = [
+            models.Index(fields=['shop_state', 'category'], name='catalog_state_category_idx'),
+        ]
 
 
 class Contact(models.Model):
@@ -220,6 +274,14 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказ"
         ordering = ('-dt',)
+        indexes = [
+            models.Index(fields=['state', 'dt'], name='order_state_dt_idx'),
+            models.Index(fields=['user', 'state'], name='order_user_state_idx'),
+            # списки размещенных заказов покупателя и магазина: state != 'basket' ORDER BY -dt, -id
+            models.Index(fields=['user', '-dt', '-id'], condition=~models.Q(state='basket'),
+                         name='order_user_placed_idx'),
+            models.Index(fields=['-dt', '-id'], condition=~models.Q(state='basket'), name='order_placed_dt_idx'),
+        ]
 
     def __str__(self):
         return str(self.dt)
@@ -239,6 +301,102 @@ class OrderItem(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['order_id', 'product_info'], name='unique_order_item'),
         ]
+        indexes = [
+            models.Index(fields=['product_info', 'order'], name='orderitem_product_order_idx'),
+        ]
+
+
+def order_total_sum(shop_user_id=None):
+    """
+    Build the total sum of an order as a grouped subquery over its own items.
+
+    Unlike Sum() over joins, the subquery does not multiply the order rows and needs no DISTINCT,
+    so listing orders reads only the items of the listed orders via the unique_order_item index.
+
+    Args:
+    - shop_user_id (int): Count only the items of the shop of this user.
+
+    Returns:
+    - Subquery: The expression to annotate Order querysets with.
+    """
+    items = OrderItem.objects.filter(order_id=models.OuterRef('pk'))
+    if shop_user_id is not None:
+        items = items.filter(product_info__shop__user_id=shop_user_id)
+    return models.Subquery(
+        items.order_by().values('order_id').annotate(
+            total=models.Sum(models.F('quantity') * models.F('product_info__price'))).values('total'),
+        output_field=models.IntegerField())
+
+
+class ImportJob(models.Model):
+    objects = models.manager.Manager()
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='import_jobs', blank=True,
+                             on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Ссылка на прайс-лист')
+    mode = models.CharField(verbose_name='Режим импорта', max_length=10, default='sync')
+    format = models.CharField(verbose_name='Формат прайс-листа', max_length=10, blank=True)
+    state = models.CharField(verbose_name='Статус', choices=IMPORT_JOB_STATE_CHOICES, max_length=10,
+                             default='queued')
+    processed = models.PositiveIntegerField(verbose_name='Обработано товаров', default=0)
+    stats = models.JSONField(verbose_name='Статистика импорта', default=dict, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = "Список задач импорта"
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.url} ({self.state})'
+
+
+class PriceListSource(models.Model):
+    """Последний импортированный прайс-лист магазина: по валидаторам HTTP и хешу содержимого
+    задача импорта узнает, что прайс-лист не изменился, и не импортирует его заново"""
+    objects = models.manager.Manager()
+    user = models.OneToOneField(User, verbose_name='Пользователь', related_name='price_list_source',
+                                on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Ссылка на прайс-лист')
+    format = models.CharField(verbose_name='Формат прайс-листа', max_length=10)
+    etag = models.CharField(verbose_name='ETag', max_length=255, blank=True)
+    last_modified = models.CharField(verbose_name='Last-Modified', max_length=64, blank=True)
+    content_hash = models.CharField(verbose_name='SHA-256 содержимого', max_length=64)
+    stats = models.JSONField(verbose_name='Статистика импорта', default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Источник прайс-листа'
+        verbose_name_plural = "Источники прайс-листов"
+
+    def __str__(self):
+        return self.url
+
+
+class OutgoingEmail(models.Model):
+    objects = models.manager.Manager()
+    subject = models.CharField(verbose_name='Тема', max_length=255)
+    body = models.TextField(verbose_name='Текст')
+    from_email = models.CharField(verbose_name='Отправитель', max_length=255, blank=True)
+    to = models.JSONField(verbose_name='Получатели', default=list)
+    state = models.CharField(verbose_name='Статус', choices=EMAIL_STATE_CHOICES, max_length=10, default='queued')
+    attempts = models.PositiveIntegerField(verbose_name='Попыток отправки', default=0)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка', default=timezone.now)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(verbose_name='Отправлено', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = "Очередь исходящих писем"
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['state', 'next_attempt_at'], name='email_state_next_attempt_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} ({self.state})'
 
 
 class ConfirmEmailToken(models.Model):
@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from backend.models import Order, OrderItem
+from backend.stock import release_stock
+
+# Смена статусов заказов магазином: заказы проверяются до записи, затем переводятся одним UPDATE
+# на каждый исходный статус в одной транзакции.
+# Статус общий для всего заказа, поэтому заказ с товарами нескольких магазинов может перевести любой из них,
+# но не отменить: отмена вернула бы на склад и товары других магазинов.
+
+# допустимые переходы: из статуса в перечисленные статусы; корзину переводит в new только оформление заказа
+ORDER_TRANSITIONS = {
+    'new': ('confirmed', 'canceled'),
+    'confirmed': ('assembled', 'canceled'),
+    'assembled': ('sent', 'canceled'),
+    'sent': ('delivered',),
+    'delivered': (),
+    'canceled': (),
+}
+
+# сколько заказов можно перевести одним запросом
+MAX_ORDERS = 5000
+
+
+def clean_order_ids(ids):
+    """Проверяет список id заказов"""
+    if not ids or any(type(order_id) is not int for order_id in ids):
+        raise ValueError('Неверный список заказов')
+    if len(ids) > MAX_ORDERS:
+        raise ValueError(f'Не больше {MAX_ORDERS} заказов за один запрос')
+    return set(ids)
+
+
+def change_order_states(shop_user_id, order_ids, state):
+    """
+    Move orders with items of a shop to a new state.
+
+    The orders are locked and checked first, nothing is written if any of them is not found or cannot move
+    to the state, or if an order with items of other shops is canceled. Then every group of orders in the same state
+    is moved by one UPDATE; the stock of the shop's items of canceled orders is returned.
+
+    Args:
+    - shop_user_id (int): The ID of the shop user.
+    - order_ids (set): The IDs of the orders.
+    - state (str): The new state.
+
+    Returns:
+    - dict: The IDs of the changed orders by the ID of their buyer.
+
+    Raises:
+    - ValueError: If the state is unknown, an order is not found or the transition is not allowed.
+    """
+    if state not in ORDER_TRANSITIONS:
+        raise ValueError(f'Неизвестный статус: {state}')
+
+    with transaction.atomic():
+        orders = list(Order.objects.select_for_update().filter(id__in=order_ids).filter(
+            id__in=OrderItem.objects.filter(product_info__shop__user_id=shop_user_id).values('order_id')).values_list(
+            'id', 'state', 'user_id'))
+
+        missing = order_ids - {order_id for order_id, _, _ in orders}
+        if missing:
+            raise ValueError(f'Заказы не найдены: {", ".join(map(str, sorted(missing)))}')
+        if state == 'canceled':
+            mixed = set(OrderItem.objects.filter(order_id__in=order_ids).exclude(
+                product_info__shop__user_id=shop_user_id).values_list('order_id', flat=True))
+            if mixed:
+                raise ValueError(
+                    f'Нельзя отменить заказы с товарами других магазинов: {", ".join(map(str, sorted(mixed)))}')
+        invalid = sorted(order_id for order_id, source, _ in orders if state not in ORDER_TRANSITIONS.get(source, ()))
+        if invalid:
+            raise ValueError(f'Заказы нельзя перевести в статус {state}: {", ".join(map(str, invalid))}')
+
+        by_source, changes = defaultdict(list), defaultdict(list)
+        for order_id, source, user_id in orders:
+            by_source[source].append(order_id)
+            changes[user_id].append(order_id)
+        for source, ids in by_source.items():
+            Order.objects.filter(id__in=ids, state=source).update(state=state)
+        if state == 'canceled':
+            release_stock(*order_ids, shop_user_id=shop_user_id)
+
+    return dict(changes)
@@ -0,0 +1,134 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from backend.models import OutgoingEmail
+
+# Письма не отправляются в обработчике запроса: сигналы только записывают их в очередь OutgoingEmail,
+# а dispatch_outbox отправляет очередь пачками через одно SMTP-соединение.
+
+
+def queue_email(subject, body, to, from_email=None):
+    """
+    Put an email into the outbox and schedule its delivery after the current transaction commits.
+
+    Args:
+    - subject (str): The subject.
+    - body (str): The text.
+    - to (list): The recipients.
+    - from_email (str): The sender, settings.EMAIL_HOST_USER by default.
+
+    Returns:
+    - OutgoingEmail: The queued email.
+    """
+    email = OutgoingEmail.objects.create(subject=subject, body=body, to=list(to),
+                                         from_email=from_email or settings.EMAIL_HOST_USER)
+    transaction.on_commit(schedule_dispatch)
+    return email
+
+
+def queue_emails(messages, from_email=None):
+    """
+    Put many emails into the outbox with one INSERT, like queue_email.
+
+    Args:
+    - messages (list): (subject, body, recipients) tuples.
+    - from_email (str): The sender, settings.EMAIL_HOST_USER by default.
+
+    Returns:
+    - list: The queued emails.
+    """
+    emails = OutgoingEmail.objects.bulk_create([
+        OutgoingEmail(subject=subject, body=body, to=list(to), from_email=from_email or settings.EMAIL_HOST_USER)
+        for subject, body, to in messages])
+    if emails:
+        transaction.on_commit(schedule_dispatch)
+    return emails
+
+
+def schedule_dispatch():
+    """Ставит задачу отправки очереди писем"""
+    from backend.tasks import send_outbox_task
+    # с CELERY_TASK_ALWAYS_EAGER задача выполнилась бы прямо в обработчике запроса и отправляла бы по SMTP
+    # всю очередь, в том числе чужие письма; тогда очередь отправляет периодическая задача или send_outbox
+    if not send_outbox_task.app.conf.task_always_eager:
+        send_outbox_task.delay()
+
+
+def retry_delay(attempts):
+    """Возвращает паузу перед следующей попыткой: экспоненциально растущую, но не больше часа"""
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), 3600))
+
+
+def claim_batch(batch_size):
+    """
+    Take due emails out of the queue for the time of their delivery.
+
+    The claimed emails get a lease in next_attempt_at, so a parallel dispatcher does not take them again;
+    on databases with row locks the rows are selected with SKIP LOCKED.
+
+    Args:
+    - batch_size (int): The maximum number of emails.
+
+    Returns:
+    - list: The claimed emails.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+            state='queued', next_attempt_at__lte=now).order_by('next_attempt_at', 'id')[:batch_size])
+        OutgoingEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE))
+    return emails
+
+
+def dispatch_outbox(batch_size=None, connection=None):
+    """
+    Send the due emails of the outbox in batches over one connection.
+
+    A failed email is retried with exponential backoff until settings.OUTBOX_MAX_ATTEMPTS attempts.
+    If the connection breaks, it is reopened for the next email.
+
+    Args:
+    - batch_size (int): The number of emails per batch, settings.OUTBOX_BATCH_SIZE by default.
+    - connection: The email backend, a new one from get_connection() by default.
+
+    Returns:
+    - dict: The numbers of sent, retried and failed emails.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    connection = connection or get_connection()
+    stats = {'sent': 0, 'retried': 0, 'failed': 0}
+
+    try:
+        while emails := claim_batch(batch_size):
+            for email in emails:
+                deliver(connection, email)
+                stats['retried' if email.state == 'queued' else email.state] += 1
+            OutgoingEmail.objects.bulk_update(
+                emails, ['state', 'attempts', 'next_attempt_at', 'error', 'sent_at'])
+            if len(emails) < batch_size:
+                break
+    finally:
+        connection.close()
+    return stats
+
+
+def deliver(connection, email):
+    """Отправляет одно письмо через открытое соединение и записывает результат в email"""
+    email.attempts += 1
+    try:
+        connection.open()
+        connection.send_messages([EmailMultiAlternatives(email.subject, email.body, email.from_email, email.to)])
+    except Exception as error:
+        connection.close()
+        email.error = str(error)
+        if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            email.state = 'failed'
+        else:
+            email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    else:
+        email.state, email.sent_at, email.error = 'sent', timezone.now(), ''
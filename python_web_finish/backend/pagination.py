@@ -0,0 +1,120 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from ujson import dumps as dump_json, loads as load_json
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (cursor) пагинация по стабильным индексированным ключам.
+
+    Страница выбирается условием WHERE по значениям ключей последней строки предыдущей страницы,
+    поэтому глубокие страницы стоят столько же, сколько первая. Клиент получает токен продолжения
+    в поле 'cursor' ответа и ссылку на следующую страницу в поле 'next'.
+
+    Attributes:
+    - ordering: Поля сортировки, последним должен идти уникальный ключ.
+    - page_size: Размер страницы по умолчанию.
+    - max_page_size: Максимальный размер страницы, который может запросить клиент.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+    def __init__(self, ordering=('pk',), page_size=None):
+        self.ordering = ordering
+        self.page_size = page_size or api_settings.PAGE_SIZE
+        self.request = None
+        self.next_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return one page of the queryset ordered by the pagination keys.
+
+        Args:
+        - queryset (QuerySet): The queryset to paginate.
+        - request (Request): The DRF request object.
+        - view: The view that paginates the queryset.
+
+        Returns:
+        - list: The rows of the requested page.
+        """
+        queryset, page_size = self._page_query(queryset, request)
+        return self._take_page(list(queryset[:page_size + 1]), page_size)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Асинхронный вариант paginate_queryset для представлений backend.async_views"""
+        queryset, page_size = self._page_query(queryset, request)
+        return self._take_page([row async for row in queryset[:page_size + 1]], page_size)
+
+    def get_paginated_response(self, data):
+        cursor = self.encode_cursor(self.next_position) if self.next_position is not None else None
+        next_url = replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param,
+                                       cursor) if cursor else None
+        return Response({'next': next_url, 'cursor': cursor, 'results': data})
+
+    def get_page_size(self, request):
+        """Возвращает размер страницы с учетом параметра limit"""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        """Возвращает значения ключей из токена продолжения или None для первой страницы"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = load_json(urlsafe_b64decode(cursor.encode() + b'=' * (-len(cursor) % 4)))
+        except ValueError:
+            raise NotFound('Неверный курсор')
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound('Неверный курсор')
+        return position
+
+    @staticmethod
+    def encode_cursor(position):
+        """Кодирует значения ключей в токен продолжения"""
+        return urlsafe_b64encode(dump_json(position).encode()).decode().rstrip('=')
+
+    def _page_query(self, queryset, request):
+        """Возвращает queryset, упорядоченный и ограниченный курсором запроса, и размер страницы"""
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+        return queryset, self.get_page_size(request)
+
+    def _take_page(self, rows, page_size):
+        """Отрезает от строк лишнюю строку-признак следующей страницы и запоминает позицию"""
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_position = [self._value(rows[-1], field.lstrip('-')) for field in self.ordering]
+        else:
+            self.next_position = None
+        return rows
+
+    def _after(self, position):
+        """Строит условие 'строка идет после position' для составного ключа сортировки"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    @staticmethod
+    def _value(row, field):
+        """Достает значение ключа из строки в виде, пригодном для JSON"""
+        value = row[field] if isinstance(row, dict) else getattr(row, field)
+        return value.isoformat() if isinstance(value, datetime) else value
@@ -0,0 +1,192 @@
+import csv
+import io
+
+from ujson import loads as load_json
+from yaml import MappingEndEvent, MappingStartEvent, ScalarEvent, ScalarNode, SequenceEndEvent, SequenceStartEvent
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+FORMATS = ('yaml', 'jsonl', 'csv')
+
+# колонки CSV, которые не являются параметрами товара
+CSV_COLUMNS = ('shop', 'category_id', 'category', 'id', 'name', 'model', 'price', 'price_rrc', 'quantity')
+CSV_INTEGER_COLUMNS = ('category_id', 'id', 'price', 'price_rrc', 'quantity')
+
+
+def detect_format(url, content_type=''):
+    """
+    Guess the price list format from the URL and the Content-Type header.
+
+    Args:
+    - url (str): The price list URL.
+    - content_type (str): The Content-Type header of the response.
+
+    Returns:
+    - str: One of FORMATS, 'yaml' by default.
+    """
+    path = url.split('?', 1)[0].lower()
+    content_type = content_type.lower()
+    if path.endswith(('.jsonl', '.ndjson')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'jsonl'
+    if path.endswith('.csv') or 'text/csv' in content_type:
+        return 'csv'
+    return 'yaml'
+
+
+def iter_records(data):
+    """
+    Turn a parsed price list into import records.
+
+    Records are (kind, value) tuples where kind is 'shop', 'category' or 'good'.
+
+    Args:
+    - data (dict): The price list with 'shop', 'categories' and 'goods' keys.
+
+    Yields:
+    - tuple: The import records.
+    """
+    yield 'shop', data['shop']
+    for category in data['categories']:
+        yield 'category', category
+    for item in data['goods']:
+        yield 'good', item
+
+
+def iter_yaml(stream):
+    """
+    Parse a YAML price list incrementally, one good at a time.
+
+    Only the current good is kept in memory, so the memory use does not depend on the size of the price list.
+
+    Args:
+    - stream: A binary file object with the price list.
+
+    Yields:
+    - tuple: The import records.
+    """
+    loader = SafeLoader(stream)
+    try:
+        loader.get_event()  # StreamStartEvent
+        loader.get_event()  # DocumentStartEvent
+        if not isinstance(loader.get_event(), MappingStartEvent):
+            raise ValueError('Прайс-лист должен быть словарем')
+
+        sections = set()
+        while not loader.check_event(MappingEndEvent):
+            key = _construct(loader)
+            sections.add(key)
+            if key in ('categories', 'goods') and loader.check_event(SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(SequenceEndEvent):
+                    yield ('category' if key == 'categories' else 'good'), _construct(loader)
+                loader.get_event()
+            else:
+                value = _construct(loader)
+                if key == 'shop':
+                    yield 'shop', value
+
+        missing = {'shop', 'goods'} - sections
+        if missing:
+            raise ValueError(f'В прайс-листе нет разделов: {", ".join(sorted(missing))}')
+    finally:
+        loader.dispose()
+
+
+def _construct(loader):
+    """Собирает из событий парсера следующий узел YAML"""
+    event = loader.get_event()
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        constructor = loader.yaml_constructors.get(tag, loader.yaml_constructors[None])
+        return constructor(loader, ScalarNode(tag, event.value, style=event.style))
+    if isinstance(event, SequenceStartEvent):
+        items = []
+        while not loader.check_event(SequenceEndEvent):
+            items.append(_construct(loader))
+        loader.get_event()
+        return items
+    if isinstance(event, MappingStartEvent):
+        mapping = {}
+        while not loader.check_event(MappingEndEvent):
+            key = _construct(loader)
+            mapping[key] = _construct(loader)
+        loader.get_event()
+        return mapping
+    raise ValueError(f'Неподдерживаемый элемент YAML: {event}')
+
+
+def iter_jsonl(stream):
+    """
+    Parse a JSON Lines price list.
+
+    A line with 'shop' and/or 'categories' keys is a header, every other line is a good.
+
+    Args:
+    - stream: A binary file object with the price list.
+
+    Yields:
+    - tuple: The import records.
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        record = load_json(line)
+        if 'shop' in record or 'categories' in record:
+            if 'shop' in record:
+                yield 'shop', record['shop']
+            for category in record.get('categories', ()):
+                yield 'category', category
+        else:
+            yield 'good', record
+
+
+def iter_csv(stream):
+    """
+    Parse a CSV price list.
+
+    Each row is a good with the columns from CSV_COLUMNS, the other non-empty columns are its parameters.
+
+    Args:
+    - stream: A binary file object with the price list.
+
+    Yields:
+    - tuple: The import records.
+    """
+    shop = None
+    categories = set()
+    for row in csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')):
+        for column in CSV_INTEGER_COLUMNS:
+            row[column] = int(row[column])
+        if shop is None:
+            shop = row['shop']
+            yield 'shop', shop
+        if row['category_id'] not in categories:
+            categories.add(row['category_id'])
+            yield 'category', {'id': row['category_id'], 'name': row['category']}
+        yield 'good', {
+            'id': row['id'], 'category': row['category_id'], 'name': row['name'], 'model': row['model'],
+            'price': row['price'], 'price_rrc': row['price_rrc'], 'quantity': row['quantity'],
+            'parameters': {name: value for name, value in row.items() if name not in CSV_COLUMNS and value},
+        }
+
+
+def read_price_list(stream, price_list_format='yaml'):
+    """
+    Parse a price list stream in the given format.
+
+    Args:
+    - stream: A binary file object with the price list.
+    - price_list_format (str): One of FORMATS.
+
+    Returns:
+    - iterator: The import records.
+    """
+    readers = {'yaml': iter_yaml, 'jsonl': iter_jsonl, 'csv': iter_csv}
+    if price_list_format not in readers:
+        raise ValueError(f'Неизвестный формат прайс-листа: {price_list_format}')
+    return readers[price_list_format](stream)
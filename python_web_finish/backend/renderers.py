@@ -0,0 +1,30 @@
+from rest_framework.renderers import JSONRenderer
+from ujson import dumps as dump_json
+
+
+class UJSONRenderer(JSONRenderer):
+    """JSONRenderer на ujson.
+
+    Для компактного вывода без отступов результат побайтно совпадает с JSONRenderer, если в данных нет
+    чисел с плавающей точкой (ujson иначе записывает экспоненту), поэтому рендерер подключается только
+    к представлениям с целочисленными и строковыми данными. Отступы, ASCII-режим и значения, которые ujson
+    не умеет сериализовать (datetime, Decimal и т.п.), обрабатывает JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Render `data` into JSON with ujson, returning a bytestring.
+        """
+        if data is None:
+            return b''
+
+        if self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = dump_json(data, ensure_ascii=False, escape_forward_slashes=False, reject_bytes=True)
+        except (TypeError, OverflowError):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
@@ -0,0 +1,127 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# Чтение с реплик. ReplicaReadMixin (и в асинхронных представлениях backend.async_views) выбирает реплику
+# для GET-запроса представления, ReplicaRouter направляет на нее чтения, а все записи - в default;
+# ReplicaMiddleware сбрасывает выбор после запроса.
+# Вне запросов (задачи, команды) все идет в default.
+
+read_alias = ContextVar('read_alias', default=None)
+
+
+def stick_to_primary(scope):
+    """
+    Send the replica reads of a scope to the primary for settings.REPLICA_STICKY_SECONDS.
+
+    Covers the replication lag after a write, so the writer reads its own changes. The marks are kept
+    in the default cache, which has to be shared between the processes (checked by backend.checks).
+
+    Args:
+    - scope (str): 'user:<id>' for the reads of a user or the name of a cached response scope.
+    """
+    if settings.DATABASE_REPLICAS:
+        cache.set(f'db-sticky:{scope}', True, settings.REPLICA_STICKY_SECONDS)
+
+
+def sticky_keys(user_id=None, scope=None):
+    """Возвращает ключи отметок, закрепляющих чтения пользователя и области кэша за default"""
+    return [f'db-sticky:{name}' for name in (scope, user_id and f'user:{user_id}') if name]
+
+
+def use_replica(user_id=None, scope=None):
+    """
+    Send the reads of the current request to a random replica unless they are sticky.
+
+    Args:
+    - user_id (int): The ID of the authenticated user or None.
+    - scope (str): The GenerationCache prefix the response is cached in or None.
+    """
+    keys = sticky_keys(user_id, scope)
+    if settings.DATABASE_REPLICAS and not (keys and cache.get_many(keys)):
+        read_alias.set(random.choice(settings.DATABASE_REPLICAS))
+
+
+class ReplicaRouter:
+    """Роутер баз данных: чтения по выбору ReplicaReadMixin, записи и миграции - только в default"""
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware:
+    """Middleware, которое ограничивает выбор реплики одним запросом.
+
+    После успешного изменяющего запроса (не GET и не HEAD) чтения пользователя на время
+    REPLICA_STICKY_SECONDS закрепляются за default. Работает и в WSGI, и в ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = read_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        if request.method not in SAFE_METHODS:
+            self.stick(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = read_alias.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        if request.method not in SAFE_METHODS:
+            # пользователь сессии загружается из базы лениво, поэтому проверка идет в потоке
+            await sync_to_async(self.stick)(request, response)
+        return response
+
+    @staticmethod
+    def stick(request, response):
+        # DRF записывает пользователя, определенного по токену, и в исходный запрос
+        user = getattr(request, 'user', None)
+        if response.status_code < 400 and user is not None and user.is_authenticated:
+            stick_to_primary(f'user:{user.id}')
+
+
+class ReplicaReadMixin:
+    """Примесь для APIView: GET и HEAD читают со случайной реплики из settings.DATABASE_REPLICAS.
+
+    Запрос остается на default, если пользователь недавно менял данные или если недавно сбрасывался
+    кэш replica_scope: иначе данные отстающей реплики попадут в новый кэш.
+
+    Attributes:
+    - replica_scope: Префикс GenerationCache, из которого отдаются ответы представления, или None.
+    """
+    replica_scope = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            use_replica(request.user.id, self.replica_scope)
@@ -0,0 +1,181 @@
+import re
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, Count, Max, Min, Q
+from django.db.models.expressions import RawSQL
+
+from backend.cache import catalog_cache, catalog_scope
+from backend.models import CatalogEntry, ProductParameter
+
+# Поиск по каталогу (CatalogEntry): слова запроса ищутся по названию, модели и значениям параметров
+# как префиксы, все слова должны найтись. Индекс зависит от базы: FTS5 на SQLite, tsvector на PostgreSQL,
+# в остальных случаях - инвертированный индекс в памяти процесса. Все три индексируют одно поле
+# CatalogEntry.search_text, которое собирает search_document, поэтому находят одно и то же.
+
+# буквы и цифры без подчеркивания: парсер PostgreSQL и unicode61 в FTS5 делят текст на слова так же
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    """Разбивает текст на слова в нижнем регистре"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def search_document(product_name, model, parameters):
+    """
+    Build the search text of a catalog entry.
+
+    Args:
+    - product_name (str): The name of the product.
+    - model (str): The model.
+    - parameters (list): The {'parameter': name, 'value': value} parameters; only the values are searched.
+
+    Returns:
+    - str: The words of the entry in lower case separated by spaces.
+    """
+    return ' '.join(tokenize(' '.join([product_name, model] + [parameter['value'] for parameter in parameters])))
+
+
+class PythonSearchBackend:
+    """Инвертированный индекс в памяти процесса.
+
+    Индекс строится из всего каталога и пересобирается, когда меняется поколение кэша каталога,
+    то есть после импорта или смены статуса магазина.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.tokens = []
+        self.postings = {}
+
+    def filter(self, queryset, terms):
+        """
+        Filter catalog entries by the search terms.
+
+        Args:
+        - queryset (QuerySet): The CatalogEntry queryset.
+        - terms (list): The search words.
+
+        Returns:
+        - QuerySet: The entries that contain every word.
+        """
+        tokens, postings = self.index()
+        found = None
+        for term in terms:
+            ids = set()
+            position = bisect_left(tokens, term)
+            while position < len(tokens) and tokens[position].startswith(term):
+                ids |= postings[tokens[position]]
+                position += 1
+            found = ids if found is None else found & ids
+        return queryset.filter(product_info_id__in=found or ())
+
+    def index(self):
+        """Возвращает отсортированный список слов и словарь слово -> id предложений, при необходимости пересобирая их"""
+        generation = catalog_cache.generation(catalog_scope())
+        with self.lock:
+            if generation != self.generation:
+                postings = {}
+                for product_info_id, text in CatalogEntry.objects.values_list(
+                        'product_info_id', 'search_text').iterator():
+                    for token in text.split():
+                        postings.setdefault(token, set()).add(product_info_id)
+                self.tokens, self.postings, self.generation = sorted(postings), postings, generation
+            return self.tokens, self.postings
+
+
+class SQLiteSearchBackend:
+    """Поиск по таблице FTS5 backend_catalog_search, которую ведут триггеры (миграции 0007 и 0011)"""
+
+    def filter(self, queryset, terms):
+        query = ' AND '.join(f'"{term}"*' for term in terms)
+        return queryset.filter(product_info_id__in=RawSQL(
+            'SELECT rowid FROM backend_catalog_search WHERE backend_catalog_search MATCH %s', [query]))
+
+
+class PostgresSearchBackend:
+    """Поиск по GIN-индексу catalog_search_idx (миграция 0011), выражение должно совпадать с индексом"""
+
+    def filter(self, queryset, terms):
+        query = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.filter(RawSQL(
+            "to_tsvector('simple', search_text) @@ to_tsquery('simple', %s)", [query], output_field=BooleanField()))
+
+
+BACKENDS = {
+    'python': PythonSearchBackend(),
+    'sqlite': SQLiteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+
+def get_backend():
+    """Возвращает поисковый бэкенд из settings.SEARCH_BACKEND или по типу базы данных"""
+    name = settings.SEARCH_BACKEND
+    if name == 'auto':
+        name = connection.vendor if connection.vendor in BACKENDS else 'python'
+    return BACKENDS[name]
+
+
+def search(q='', category_id=None, shop_id=None, price_min=None, price_max=None, parameters=()):
+    """
+    Build the queryset of the catalog entries matching a search.
+
+    Args:
+    - q (str): The search words.
+    - category_id (int): The category.
+    - shop_id (int): The shop.
+    - price_min (int): The lowest price.
+    - price_max (int): The highest price.
+    - parameters (list): (name, value) pairs the entries must have.
+
+    Returns:
+    - QuerySet: The matching entries of the shops that accept orders.
+    """
+    query = Q(shop_state=True)
+    if category_id:
+        query &= Q(category_id=category_id)
+    if shop_id:
+        query &= Q(shop_id=shop_id)
+    if price_min is not None:
+        query &= Q(price__gte=price_min)
+    if price_max is not None:
+        query &= Q(price__lte=price_max)
+    for name, value in parameters:
+        query &= Q(product_info_id__in=ProductParameter.objects.filter(
+            parameter__name=name, value=value).values('product_info_id'))
+
+    queryset = CatalogEntry.objects.filter(query)
+    terms = tokenize(q)
+    if terms:
+        queryset = get_backend().filter(queryset, terms)
+    return queryset
+
+
+def facets(queryset):
+    """
+    Count the matching entries per category and per parameter value.
+
+    Args:
+    - queryset (QuerySet): The matching catalog entries.
+
+    Returns:
+    - dict: The category and parameter counts and the price range of the entries.
+    """
+    categories = [
+        {'id': row['category_id'], 'name': row['category_name'], 'count': row['count']}
+        for row in queryset.order_by().values('category_id', 'category_name').annotate(
+            count=Count('product_info_id')).order_by('-count', 'category_id')]
+
+    parameters = {}
+    for row in ProductParameter.objects.filter(
+            product_info_id__in=queryset.order_by().values('product_info_id')).values(
+            'parameter__name', 'value').annotate(count=Count('id')).order_by('parameter__name', '-count', 'value'):
+        parameters.setdefault(row['parameter__name'], []).append({'value': row['value'], 'count': row['count']})
+
+    price = queryset.order_by().aggregate(min=Min('price'), max=Max('price'))
+    return {'categories': categories, 'parameters': parameters, 'price': price}
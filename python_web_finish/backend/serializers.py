@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact
+from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact, \
+    ImportJob, CatalogEntry
+from backend.tasks import get_progress
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -61,6 +63,22 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class CatalogEntrySerializer(serializers.ModelSerializer):
+    """Отдает запись каталога в том же виде, что и ProductInfoSerializer"""
+    id = serializers.IntegerField(source='product_info_id')
+    product = serializers.SerializerMethodField()
+    shop = serializers.IntegerField(source='shop_id')
+    product_parameters = serializers.JSONField(source='parameters')
+
+    class Meta:
+        model = CatalogEntry
+        fields = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters',)
+        read_only_fields = fields
+
+    def get_product(self, obj):
+        return {'name': obj.product_name, 'category': obj.category_name}
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
@@ -83,4 +101,16 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact',)
-        read_only_fields = ('id',)
\ No newline at end of file
+        read_only_fields = ('id',)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    processed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'url', 'mode', 'format', 'state', 'processed', 'stats', 'error', 'created_at', 'updated_at',)
+        read_only_fields = fields
+
+    def get_processed(self, obj):
+        return get_progress(obj)
@@ -1,14 +1,20 @@
 from typing import Type
-from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
 from django.dispatch import receiver, Signal
 from django_rest_passwordreset.signals import reset_password_token_created
+from rest_framework.authtoken.models import Token
 
-from backend.models import ConfirmEmailToken, User
+from backend.attributes import normalize_value
+from backend.authentication import token_cache
+from backend.cache import invalidate_catalog, invalidate_directories
+from backend.catalog import refresh_catalog, refresh_product_infos
+from backend.models import ConfirmEmailToken, User, Shop, Category, Product, ProductInfo, ProductParameter, \
+    CatalogEntry, STATE_CHOICES
+from backend.outbox import queue_email, queue_emails
 
 new_user_registered = Signal()
 new_order = Signal()
+order_states_changed = Signal()
 
 
 @receiver(reset_password_token_created)
@@ -22,18 +28,15 @@ def password_reset_token_created(sender, instance, reset_password_token, **kwarg
     :param kwargs:
     :return:
     """
-    # send an e-mail to the user
-    msg = EmailMultiAlternatives(
+    # put an e-mail to the user into the outbox
+    queue_email(
         # title:
         f"Password Reset Token for {reset_password_token.user}",
         # message:
         reset_password_token.key,
-        # from:
-        settings.EMAIL_HOST_USER,
         # to:
         [reset_password_token.user.email]
     )
-    msg.send()
 
 
 @receiver(post_save, sender=User)
@@ -42,20 +45,17 @@ def new_user_registered_signal(sender: Type[User], instance: User, created: bool
     отправляем письмо с подтверждением почты
     """
     if created and not instance.is_active:
-        # send an e-mail to the user
+        # put an e-mail to the user into the outbox
         token, _ = ConfirmEmailToken.objects.get_or_create(user_id=instance.pk)
 
-        msg = EmailMultiAlternatives(
+        queue_email(
             # title:
             f"Password Reset Token for {instance.email}",
             # message:
             token.key,
-            # from:
-            settings.EMAIL_HOST_USER,
             # to:
             [instance.email]
         )
-        msg.send()
 
 
 @receiver(new_order)
@@ -63,17 +63,110 @@ def new_order_signal(user_id, **kwargs):
     """
     отправляем письмо при изменении статуса заказа
     """
-    # send an e-mail to the user
+    # put an e-mail to the user into the outbox
     user = User.objects.get(id=user_id)
 
-    msg = EmailMultiAlternatives(
+    queue_email(
         # title:
         f"Обновление статуса заказа",
         # message:
         'Заказ сформирован',
-        # from:
-        settings.EMAIL_HOST_USER,
         # to:
         [user.email]
     )
-    msg.send()
\ No newline at end of file
+
+
+@receiver(order_states_changed)
+def order_states_changed_signal(changes, state, **kwargs):
+    """
+    отправляем каждому покупателю одно письмо о смене статуса всех его заказов
+    """
+    emails = dict(User.objects.filter(id__in=changes).values_list('id', 'email'))
+    queue_emails([
+        ("Обновление статуса заказа",
+         f'Заказы {", ".join(map(str, sorted(order_ids)))}: {dict(STATE_CHOICES)[state]}',
+         [emails[user_id]])
+        for user_id, order_ids in changes.items()])
+
+
+@receiver(post_save, sender=Shop)
+def shop_saved_signal(sender: Type[Shop], instance: Shop, **kwargs):
+    """
+    обновляем статус магазина в каталоге при сохранении магазина
+    """
+    CatalogEntry.objects.filter(shop_id=instance.id).update(shop_state=instance.state)
+    invalidate_catalog(instance.id)
+    invalidate_directories()
+
+
+@receiver(post_delete, sender=Shop)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Category.shops.through)
+def directory_changed_signal(sender, **kwargs):
+    """
+    сбрасываем справочники категорий и магазинов при их изменении (например, из админки)
+    """
+    invalidate_directories()
+
+
+@receiver(post_save, sender=ProductInfo)
+def product_info_saved_signal(sender: Type[ProductInfo], instance: ProductInfo, **kwargs):
+    """
+    пересобираем запись каталога при сохранении предложения (например, из админки)
+    """
+    refresh_catalog([instance.id])
+    invalidate_catalog(instance.shop_id)
+
+
+@receiver(post_save, sender=Category)
+def category_saved_signal(sender: Type[Category], instance: Category, created: bool, **kwargs):
+    """
+    пересобираем каталог товаров категории при ее переименовании (например, из админки)
+    """
+    if not created:
+        refresh_product_infos(ProductInfo.objects.filter(product__category_id=instance.id))
+
+
+@receiver(post_save, sender=Product)
+def product_saved_signal(sender: Type[Product], instance: Product, created: bool, **kwargs):
+    """
+    пересобираем каталог предложений товара при изменении его названия или категории
+    """
+    if not created:
+        refresh_product_infos(ProductInfo.objects.filter(product_id=instance.id))
+
+
+# удаление параметра обрабатывает админка (ProductParameterAdmin): получатель post_delete отключил бы быстрое
+# каскадное удаление параметров, и импорт в режиме replace загружал бы их все в память
+@receiver(post_save, sender=ProductParameter)
+def product_parameter_saved_signal(sender: Type[ProductParameter], instance: ProductParameter, **kwargs):
+    """
+    пересобираем запись каталога при изменении параметра предложения
+    """
+    refresh_product_infos(ProductInfo.objects.filter(id=instance.product_info_id))
+
+
+@receiver(pre_save, sender=ProductParameter)
+def product_parameter_saving_signal(sender: Type[ProductParameter], instance: ProductParameter, **kwargs):
+    """
+    нормализуем значение параметра при сохранении (например, из админки); импорт делает это сам
+    """
+    instance.value_num, instance.unit = normalize_value(instance.value)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted_signal(sender: Type[Token], instance: Token, **kwargs):
+    """
+    удаляем отозванный токен из кэша авторизации
+    """
+    token_cache.invalidate([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved_signal(sender: Type[User], instance: User, created: bool, **kwargs):
+    """
+    удаляем токены пользователя из кэша авторизации, чтобы запросы видели новые данные и статус
+    """
+    if not created:
+        token_cache.invalidate(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from backend.catalog import refresh_quantities
+from backend.models import Order, OrderItem, ProductInfo
+
+# Резервирование остатков: все позиции заказа списываются одним условным UPDATE
+# (quantity = quantity - n WHERE quantity >= n). Строка, на которую не хватает товара, не обновляется,
+# и тогда вся транзакция откатывается. Блокировки строк держатся только на время этого UPDATE.
+# Кэш каталога при этом не сбрасывается: остатки не входят в кэшированные ответы (backend.catalog.fill_quantities).
+
+# сколько товаров возвращается на склад одним UPDATE
+RELEASE_BATCH_SIZE = 1000
+
+
+class InsufficientStock(ValueError):
+    """Не хватает товара хотя бы для одной позиции заказа
+
+    Attributes:
+    - product_info_ids: Товары, которых не хватило.
+    """
+
+    def __init__(self, product_info_ids):
+        self.product_info_ids = sorted(product_info_ids)
+        super().__init__(f'Недостаточно товара: {", ".join(map(str, self.product_info_ids))}')
+
+
+def _change_stock(lines, sign):
+    """
+    Add sign * quantity to the stock of every line with one UPDATE.
+
+    Args:
+    - lines (dict): The ordered quantities by product info ID.
+    - sign (int): -1 to reserve, 1 to release.
+
+    Returns:
+    - int: The number of updated product infos.
+    """
+    condition = Q()
+    for product_info_id, quantity in lines.items():
+        condition |= Q(id=product_info_id, quantity__gte=quantity) if sign < 0 else Q(id=product_info_id)
+    return ProductInfo.objects.filter(condition).update(quantity=Case(*[
+        When(id=product_info_id, then=F('quantity') + sign * quantity) for product_info_id, quantity in lines.items()]))
+
+
+def _order_lines(order_ids, shop_user_id=None):
+    """Возвращает заказанное количество по товарам (сумму по всем заказам)"""
+    items = OrderItem.objects.filter(order_id__in=order_ids)
+    if shop_user_id is not None:
+        items = items.filter(product_info__shop__user_id=shop_user_id)
+    lines = {}
+    for product_info_id, quantity in items.values_list('product_info_id', 'quantity'):
+        lines[product_info_id] = lines.get(product_info_id, 0) + quantity
+    return lines
+
+
+def reserve_stock(order_id):
+    """
+    Decrement the stock of every line of an order, or of none of them.
+
+    Must run inside a transaction: on InsufficientStock the caller's transaction is rolled back.
+
+    Args:
+    - order_id (int): The ID of the order.
+
+    Raises:
+    - InsufficientStock: If any line exceeds the stock of its product info.
+    """
+    lines = _order_lines([order_id])
+    if not lines:
+        return
+    if _change_stock(lines, -1) != len(lines):
+        # остатки читаются только для текста ошибки, списание все равно откатывается
+        available = dict(ProductInfo.objects.filter(id__in=lines).values_list('id', 'quantity'))
+        raise InsufficientStock(product_info_id for product_info_id, quantity in lines.items()
+                                if available.get(product_info_id, 0) < quantity)
+    refresh_quantities(lines)
+
+
+def release_stock(*order_ids, shop_user_id=None):
+    """
+    Return the reserved stock of orders.
+
+    The quantities of all orders are summed per product info and returned by one UPDATE per
+    RELEASE_BATCH_SIZE product infos.
+
+    Args:
+    - order_ids (int): The IDs of the orders.
+    - shop_user_id (int): The ID of a shop user to return only the items of its shops, or None for all items.
+    """
+    lines = _order_lines(order_ids, shop_user_id)
+    items = list(lines.items())
+    for start in range(0, len(items), RELEASE_BATCH_SIZE):
+        _change_stock(dict(items[start:start + RELEASE_BATCH_SIZE]), 1)
+    if lines:
+        refresh_quantities(lines)
+
+
+def place_order(user_id, order_id, contact_id):
+    """
+    Turn a basket into a new order and reserve its stock in one transaction.
+
+    Args:
+    - user_id (int): The ID of the buyer.
+    - order_id (int): The ID of the basket order.
+    - contact_id (int): The ID of the delivery contact.
+
+    Returns:
+    - bool: False if the user has no such basket.
+
+    Raises:
+    - InsufficientStock: If any line exceeds the stock, the basket stays unchanged.
+    """
+    with transaction.atomic():
+        # смена статуса идет первой: она блокирует заказ от повторного оформления в параллельном запросе
+        if not Order.objects.filter(user_id=user_id, id=order_id, state='basket').update(
+                contact_id=contact_id, state='new'):
+            return False
+        reserve_stock(order_id)
+    return True
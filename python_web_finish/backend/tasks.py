@@ -0,0 +1,117 @@
+from celery import shared_task
+from django.core.cache import cache
+
+from backend.fetcher import fetch_price_list
+from backend.importer import PriceListImporter
+from backend.models import ImportJob, PriceListSource
+from backend.outbox import dispatch_outbox
+from backend.parsers import detect_format, read_price_list
+
+
+def progress_key(job_id):
+    """Ключ кэша с прогрессом задачи импорта"""
+    return f'import-job:{job_id}:processed'
+
+
+def get_progress(job):
+    """
+    Return the number of goods processed by an import job.
+
+    While the job is running its rows are not committed yet, so the worker publishes the progress through the cache
+    shared with the web processes (see backend.checks).
+
+    Args:
+    - job (ImportJob): The import job.
+
+    Returns:
+    - int: The number of processed goods.
+    """
+    if job.state == 'running':
+        return cache.get(progress_key(job.id), job.processed)
+    return job.processed
+
+
+@shared_task
+def import_price_list_task(job_id):
+    """
+    Download and import the price list of an import job.
+
+    The price list is streamed into a temporary file and parsed incrementally in the job format
+    or, if it is not set, in the format detected from the URL and Content-Type.
+
+    In the sync mode a price list that did not change since the last import of the shop is not imported again:
+    the job gets the statistics of that import with a 'skipped' key.
+
+    Args:
+    - job_id (int): The ID of the import job.
+    """
+    job = ImportJob.objects.get(id=job_id)
+    job.state = 'running'
+    job.save(update_fields=['state', 'updated_at'])
+
+    def progress(processed):
+        cache.set(progress_key(job.id), processed)
+
+    try:
+        stats = import_changed_price_list(job, progress)
+    except Exception as error:
+        job.state, job.error = 'failed', str(error)
+    else:
+        job.state, job.processed, job.stats = 'done', stats['goods'], stats
+    finally:
+        job.save(update_fields=['state', 'processed', 'stats', 'error', 'updated_at'])
+        cache.delete(progress_key(job.id))
+
+
+def import_changed_price_list(job, progress=None):
+    """
+    Import the price list of a job unless it is the same as the last imported price list of the shop.
+
+    The request is conditional if the URL is the same as last time (ETag/Last-Modified); otherwise
+    the downloaded content is compared with the last import by its SHA-256.
+
+    Args:
+    - job (ImportJob): The import job.
+    - progress (callable): The progress callback of PriceListImporter.
+
+    Returns:
+    - dict: The statistics of the import or of the last import with 'skipped': 'not_modified' or 'unchanged'.
+    """
+    # режим replace пересоздает предложения и запрашивается явно, поэтому всегда импортирует;
+    # без магазина (удален вместе с предложениями) сравнивать не с чем
+    source = PriceListSource.objects.filter(user_id=job.user_id, user__shop__isnull=False).first() \
+        if job.mode == 'sync' else None
+    validators = {'etag': source.etag, 'last_modified': source.last_modified} if source and source.url == job.url \
+        else {}
+    download = fetch_price_list(job.url, **validators)
+
+    if download['file'] is None:
+        stats = dict(source.stats, skipped='not_modified')
+        price_list_format, content_hash = source.format, source.content_hash
+    else:
+        with download['file'] as file:
+            price_list_format = job.format or detect_format(job.url, download['content_type'])
+            content_hash = download['content_hash']
+            if source and (source.format, source.content_hash) == (price_list_format, content_hash):
+                stats = dict(source.stats, skipped='unchanged')
+            else:
+                stats = PriceListImporter(job.user_id, mode=job.mode, progress=progress).run(
+                    read_price_list(file, price_list_format))
+
+    PriceListSource.objects.update_or_create(user_id=job.user_id, defaults={
+        'url': job.url, 'format': price_list_format, 'etag': download['etag'],
+        'last_modified': download['last_modified'], 'content_hash': content_hash,
+        'stats': {key: value for key, value in stats.items() if key != 'skipped'},
+    })
+    return stats
+
+
+@shared_task
+def send_outbox_task():
+    """
+    Send the due emails of the outbox.
+
+    Returns:
+    - dict: The numbers of sent, retried and failed emails.
+    """
+    return dispatch_outbox()
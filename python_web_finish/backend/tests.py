@@ -1 +1,1349 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from gzip import compress as gzip_compress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from smtplib import SMTPRecipientsRefused
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib import admin
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from yaml import load as load_yaml, Loader
+
+from backend.admin import ProductParameterAdmin
+from backend.attributes import normalize_value
+from backend.authentication import TokenCache, token_cache
+from backend.benchmark import prepare_benchmark, run_endpoint_benchmarks
+from backend.checks import check_replica_cache, check_worker_caches
+from backend.explain import capture_statements, full_scans
+from backend.fast_serializers import CATALOG_ENTRY_VALUES, ORDER_VALUES, serialize_catalog_entries, \
+    serialize_orders
+from backend.fetcher import PriceListTooLarge, fetch_price_list
+from backend.importer import PriceListImporter, import_price_list
+from backend.metrics import InstrumentationMiddleware, registry, render_metrics
+from backend.catalog import rebuild_catalog, refresh_quantities
+from backend.models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, ImportJob, \
+    CatalogEntry, Order, OrderItem, Contact, OutgoingEmail, PriceListSource, order_total_sum
+from backend.outbox import dispatch_outbox, queue_email
+from backend.parsers import detect_format, iter_records, read_price_list
+from backend.renderers import UJSONRenderer
+from backend.search import BACKENDS as SEARCH_BACKENDS
+from backend.serializers import ProductInfoSerializer, OrderSerializer
+from backend.signals import new_order
+from backend.stock import release_stock
+
+SHOP1_YAML = os.path.join(settings.BASE_DIR, 'data', 'shop1.yaml')
+
+
+def load_shop1():
+    """Загружает тестовый прайс-лист data/shop1.yaml"""
+    with open(SHOP1_YAML, 'rb') as file:
+        return load_yaml(file, Loader=Loader)
+
+
+def make_price_list(goods_count, shop='Shop1'):
+    """Генерирует прайс-лист с goods_count товарами"""
+    return {
+        'shop': shop,
+        'categories': [{'id': 1, 'name': 'Процессоры'}, {'id': 2, 'name': 'Видеокарты'}],
+        'goods': [{'id': index, 'category': index % 2 + 1, 'name': f'Товар {index}', 'model': f'M{index}',
+                   'price': 100 + index, 'price_rrc': 200 + index, 'quantity': 10,
+                   'parameters': {'cores': str(index % 16), 'color': 'black'}}
+                  for index in range(1, goods_count + 1)],
+    }
+
+
+class PriceListServer:
+    """Локальный HTTP-сервер, отдающий прайс-листы для тестов.
+
+    С etags=True отвечает на условные запросы, с gzip=True сжимает ответы для клиентов, которые это принимают,
+    delay - пауза в секундах перед ответом.
+    """
+
+    def __init__(self, files=None, etags=False, gzip=False, delay=0):
+        self.files = dict(files or {})
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                if self.path not in server.files:
+                    self.send_error(404)
+                    return
+                time.sleep(delay)
+                body, content_type = server.files[self.path]
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                if etags and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if etags:
+                    self.send_header('ETag', etag)
+                if gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip_compress(body)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.httpd.server_port}{path}'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class BackendTestMixin:
+    """Пользователь-магазин, API-клиент и помощники для тестов"""
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.partner = User.objects.create_user(email='shop@example.com', password='password', type='shop',
+                                                is_active=True)
+        self.client = self.make_client(self.partner)
+
+    @staticmethod
+    def make_client(user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+        return client
+
+    def make_buyer(self, email='buyer@example.com'):
+        return User.objects.create_user(email=email, password='password', type='buyer', is_active=True)
+
+    @staticmethod
+    def make_order(user, items, state='new'):
+        """Создает заказ с позициями items: список пар (ProductInfo, количество)"""
+        order = Order.objects.create(user=user, state=state)
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, product_info=product_info, quantity=quantity) for product_info, quantity in items])
+        return order
+
+
+class BackendTestCase(BackendTestMixin, TestCase):
+    """Базовый класс тестов с пользователем-магазином и API-клиентом"""
+
+
+class PriceListImportTests(BackendTestCase):
+
+    def test_import_shop1(self):
+        data = load_shop1()
+        stats = import_price_list(self.partner.id, data)
+
+        shop = Shop.objects.get(user=self.partner)
+        self.assertEqual(shop.name, data['shop'])
+        self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), len(data['goods']))
+        self.assertEqual(set(Category.objects.filter(shops=shop).values_list('id', flat=True)),
+                         {category['id'] for category in data['categories']})
+        self.assertEqual(stats['goods'], len(data['goods']))
+        self.assertEqual(stats['parameters'], sum(len(item['parameters']) for item in data['goods']))
+
+        product_info = ProductInfo.objects.get(shop=shop, external_id=1)
+        self.assertEqual(product_info.product.name, 'Intel Core i7-10700K')
+        self.assertEqual(
+            dict(product_info.product_parameters.values_list('parameter__name', 'value')),
+            {'socket': 'LGA1200', 'cores': '8', 'threads': '16', 'frequency': '3.8 GHz'})
+
+    def test_query_count_does_not_grow_with_goods(self):
+        small = import_price_list(self.partner.id, make_price_list(10), batch_size=500)
+        large = import_price_list(self.partner.id, make_price_list(400), batch_size=500)
+
+        self.assertEqual(large['goods'], 400)
+        self.assertLessEqual(large['queries'], small['queries'] + 5)
+        self.assertEqual(Product.objects.count(), 400)
+        self.assertEqual(Parameter.objects.count(), 2)
+        self.assertEqual(ProductParameter.objects.count(), 800)
+
+
+class PriceListSyncTests(BackendTestCase):
+
+    def test_sync_writes_only_differences(self):
+        data = make_price_list(100)
+        first = import_price_list(self.partner.id, data)
+        ids = dict(ProductInfo.objects.values_list('external_id', 'id'))
+
+        data['goods'][0]['price'] += 1
+        data['goods'][1]['parameters']['color'] = 'white'
+        removed = data['goods'].pop()
+        data['goods'].append(dict(removed, id=1000))
+        stats = import_price_list(self.partner.id, data)
+
+        self.assertEqual(first['created'], 100)
+        self.assertEqual((stats['created'], stats['updated'], stats['deleted'], stats['unchanged']), (1, 1, 1, 98))
+        self.assertEqual(stats['writes'], 3 + 1 + 2)
+        self.assertEqual(ProductInfo.objects.get(external_id=1).id, ids[1])
+        self.assertEqual(ProductInfo.objects.get(external_id=1).price, data['goods'][0]['price'])
+        self.assertEqual(ProductParameter.objects.get(product_info__external_id=2, parameter__name='color').value,
+                         'white')
+        self.assertFalse(ProductInfo.objects.filter(external_id=removed['id']).exists())
+
+    def test_sync_keeps_ordered_offers(self):
+        data = make_price_list(10)
+        import_price_list(self.partner.id, data)
+        ordered = ProductInfo.objects.get(external_id=1)
+        order = self.make_order(self.make_buyer(), [(ordered, 2)], state='confirmed')
+
+        # без первых двух и пятого товара; устаревшие предложения ищутся по отрезкам между пачками
+        data['goods'] = data['goods'][2:4] + data['goods'][5:]
+        stats = import_price_list(self.partner.id, data, batch_size=3)
+
+        self.assertEqual((stats['deleted'], stats['zeroed'], stats['writes']), (2, 1, 3))
+        self.assertEqual(list(order.ordered_items.values_list('product_info_id', 'quantity')), [(ordered.id, 2)])
+        self.assertEqual(ProductInfo.objects.get(id=ordered.id).quantity, 0)
+        self.assertEqual(CatalogEntry.objects.get(product_info_id=ordered.id).quantity, 0)
+        self.assertFalse(ProductInfo.objects.filter(external_id__in=[2, 5]).exists())
+        self.assertEqual(ProductInfo.objects.count(), 8)
+
+    def test_replace_mode_recreates_offers(self):
+        data = make_price_list(10)
+        import_price_list(self.partner.id, data)
+        ids = set(ProductInfo.objects.values_list('id', flat=True))
+
+        stats = import_price_list(self.partner.id, data, mode='replace')
+
+        self.assertEqual((stats['created'], stats['deleted']), (10, 10))
+        self.assertFalse(ids & set(ProductInfo.objects.values_list('id', flat=True)))
+
+
+class PartnerUpdateJobTests(BackendTestCase):
+
+    def post_price_list(self, url, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('backend:partner-update'), {'url': url, **data})
+
+    def test_import_job_runs_and_reports_status(self):
+        with open(SHOP1_YAML, 'rb') as file, PriceListServer({'/shop1.yaml': (file.read(), 'text/yaml')}) as server:
+            response = self.post_price_list(server.url('/shop1.yaml'))
+        self.assertTrue(response.json()['Status'])
+
+        status = self.client.get(reverse('backend:partner-update-status', args=[response.json()['Job']])).json()
+        goods_count = len(load_shop1()['goods'])
+        self.assertEqual(status['state'], 'done')
+        self.assertEqual(status['processed'], goods_count)
+        self.assertEqual(status['stats']['created'], goods_count)
+        self.assertEqual(ProductInfo.objects.count(), goods_count)
+
+    def test_failed_import_job(self):
+        with PriceListServer({'/shop1.yaml': (b'shop: Shop1', 'text/yaml')}) as server:
+            job_id = self.post_price_list(server.url('/shop1.yaml')).json()['Job']
+            missing_id = self.post_price_list(server.url('/missing.yaml')).json()['Job']
+
+        job = ImportJob.objects.get(id=job_id)
+        self.assertEqual(job.state, 'failed')
+        self.assertIn('goods', job.error)
+        self.assertIn('404', ImportJob.objects.get(id=missing_id).error)
+
+    def test_unknown_mode_format_and_foreign_job(self):
+        self.assertFalse(self.post_price_list('http://example.com/shop1.yaml', mode='merge').json()['Status'])
+        self.assertFalse(self.post_price_list('http://example.com/shop1.yaml', format='xml').json()['Status'])
+
+        other = User.objects.create_user(email='other@example.com', password='password', type='shop')
+        job = ImportJob.objects.create(user=other, url='http://example.com/other.yaml')
+        response = self.client.get(reverse('backend:partner-update-status', args=[job.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class PriceListDedupTests(BackendTestCase):
+
+    def post_price_list(self, url, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            job_id = self.client.post(reverse('backend:partner-update'), {'url': url, **data}).json()['Job']
+        return ImportJob.objects.get(id=job_id)
+
+    def price_list(self, goods_count):
+        return json.dumps(make_price_list(goods_count)).encode(), 'application/json'
+
+    def test_not_modified_price_list_is_not_downloaded(self):
+        with PriceListServer({'/shop.yaml': self.price_list(10)}, etags=True) as server:
+            first = self.post_price_list(server.url('/shop.yaml'))
+            second = self.post_price_list(server.url('/shop.yaml'))
+
+        self.assertEqual((first.state, first.stats['created']), ('done', 10))
+        self.assertEqual(server.requests[1][1]['If-None-Match'], PriceListSource.objects.get().etag)
+        self.assertEqual((second.state, second.processed, second.stats['skipped']), ('done', 10, 'not_modified'))
+        self.assertEqual(second.stats['created'], 10)
+
+    def test_same_content_is_not_imported_again(self):
+        with PriceListServer({'/a.yaml': self.price_list(10), '/b.yaml': self.price_list(10)}) as server:
+            self.post_price_list(server.url('/a.yaml'))
+            ProductInfo.objects.update(price=1)
+            same = self.post_price_list(server.url('/b.yaml'))
+            replaced = self.post_price_list(server.url('/b.yaml'), mode='replace')
+            server.files['/b.yaml'] = self.price_list(12)
+            changed = self.post_price_list(server.url('/b.yaml'))
+
+        self.assertNotIn('If-None-Match', server.requests[1][1])
+        self.assertEqual(same.stats['skipped'], 'unchanged')
+        self.assertNotIn('skipped', replaced.stats)
+        self.assertEqual(replaced.stats['created'], 10)
+        self.assertEqual((changed.stats['created'], changed.stats['unchanged']), (2, 10))
+        self.assertEqual(PriceListSource.objects.get().stats['goods'], 12)
+
+
+class PriceListFetcherTests(BackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def test_compressed_download_is_limited_after_decompression(self):
+        body = json.dumps(make_price_list(50)).encode()
+        with PriceListServer({'/shop.yaml': (body, 'text/yaml')}, gzip=True) as server:
+            download = fetch_price_list(server.url('/shop.yaml'))
+            with override_settings(PRICE_LIST_MAX_BYTES=len(body) - 1), self.assertRaises(PriceListTooLarge):
+                fetch_price_list(server.url('/shop.yaml'))
+
+        with download['file'] as file:
+            self.assertEqual(file.read(), body)
+        self.assertIn('gzip', server.requests[0][1]['Accept-Encoding'])
+        metrics = render_metrics()
+        self.assertIn('price_list_fetch_duration_seconds_count{host="127.0.0.1",result="200"} 1', metrics)
+        self.assertIn('price_list_fetch_duration_seconds_count{host="127.0.0.1",result="PriceListTooLarge"} 1',
+                      metrics)
+        self.assertIn(f'price_list_fetch_bytes_total{{host="127.0.0.1"}} {len(body) * 2}', metrics)
+
+    def test_response_without_etag_drops_previous_validators(self):
+        with PriceListServer({'/shop.yaml': (b'shop: Shop1', 'text/yaml')}) as server:
+            download = fetch_price_list(server.url('/shop.yaml'), etag='"old"', last_modified='yesterday')
+        download['file'].close()
+
+        self.assertEqual(server.requests[0][1]['If-None-Match'], '"old"')
+        self.assertEqual((download['etag'], download['last_modified']), ('', ''))
+
+    @override_settings(PRICE_LIST_READ_TIMEOUT=0.2)
+    def test_slow_server_fails_the_job(self):
+        with PriceListServer({'/shop.yaml': (b'shop: Shop1', 'text/yaml')}, delay=1) as server:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('backend:partner-update'), {'url': server.url('/shop.yaml')})
+
+        self.assertEqual(ImportJob.objects.get(id=response.json()['Job']).state, 'failed')
+        self.assertIn('result="ReadTimeout"', render_metrics())
+
+
+class PriceListParserTests(BackendTestCase):
+
+    def test_streaming_yaml_matches_full_load(self):
+        with open(SHOP1_YAML, 'rb') as file:
+            self.assertEqual(list(read_price_list(file)), list(iter_records(load_shop1())))
+
+    def test_jsonl_and_csv_formats(self):
+        jsonl = (b'{"shop": "Shop1", "categories": [{"id": 1, "name": "CPU"}]}\n'
+                 b'{"id": 5, "category": 1, "name": "Ryzen", "model": "R5", "price": 10, "price_rrc": 12, '
+                 b'"quantity": 3, "parameters": {"cores": "6"}}\n')
+        csv = ('shop,category_id,category,id,name,model,price,price_rrc,quantity,cores,socket\n'
+               'Shop1,1,CPU,5,Ryzen,R5,10,12,3,6,\n').encode()
+
+        for content, price_list_format in ((jsonl, 'jsonl'), (csv, 'csv')):
+            self.assertEqual(list(read_price_list(io.BytesIO(content), price_list_format)), [
+                ('shop', 'Shop1'),
+                ('category', {'id': 1, 'name': 'CPU'}),
+                ('good', {'id': 5, 'category': 1, 'name': 'Ryzen', 'model': 'R5', 'price': 10, 'price_rrc': 12,
+                          'quantity': 3, 'parameters': {'cores': '6'}}),
+            ])
+
+    def test_detect_format(self):
+        self.assertEqual(detect_format('http://example.com/price.csv?v=1'), 'csv')
+        self.assertEqual(detect_format('http://example.com/price', 'application/x-ndjson'), 'jsonl')
+        self.assertEqual(detect_format('http://example.com/price.yaml'), 'yaml')
+
+    def test_goods_are_written_in_batches(self):
+        processed = []
+        importer = PriceListImporter(self.partner.id, batch_size=30, progress=processed.append)
+        importer.run(iter_records(make_price_list(100)))
+
+        self.assertEqual(processed, [30, 60, 90, 100])
+        self.assertEqual(ProductInfo.objects.count(), 100)
+
+
+class CatalogProjectionTests(BackendTestCase):
+
+    def legacy_products(self, **filters):
+        queryset = ProductInfo.objects.filter(shop__state=True, **filters).select_related(
+            'shop', 'product__category').prefetch_related('product_parameters__parameter').order_by('id')
+        return ProductInfoSerializer(queryset, many=True).data
+
+    def test_products_match_legacy_serializer(self):
+        import_price_list(self.partner.id, load_shop1())
+
+        response = self.client.get(reverse('backend:products'))
+        self.assertEqual(response.json()['results'], self.legacy_products())
+        response = self.client.get(reverse('backend:products'), {'category_id': 2})
+        self.assertEqual(response.json()['results'], self.legacy_products(product__category_id=2))
+
+        shop_id = Shop.objects.get().id
+        with self.assertNumQueries(1):
+            APIClient().get(reverse('backend:products'), {'shop_id': shop_id})
+
+    def test_sync_and_partner_state_refresh_projection(self):
+        data = make_price_list(5)
+        import_price_list(self.partner.id, data)
+        data['goods'][0]['price'] = 1
+        data['goods'][1]['parameters']['color'] = 'white'
+        data['goods'].pop()
+        import_price_list(self.partner.id, data)
+
+        self.assertEqual(CatalogEntry.objects.count(), 4)
+        self.assertEqual(self.client.get(reverse('backend:products')).json()['results'], self.legacy_products())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('backend:partner-state'), {'state': 'off'})
+        self.assertEqual(self.client.get(reverse('backend:products')).json()['results'], [])
+
+    def test_admin_edits_refresh_projection(self):
+        import_price_list(self.partner.id, make_price_list(3))
+        product_info = ProductInfo.objects.select_related('product__category').get(external_id=1)
+        client = APIClient()
+        client.get(reverse('backend:products'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category = product_info.product.category
+            category.name = 'ЦП'
+            category.save()
+            product_info.product.name = 'Новое имя'
+            product_info.product.save()
+            parameter = product_info.product_parameters.get(parameter__name='color')
+            parameter.value = 'white'
+            parameter.save()
+            ProductParameterAdmin(ProductParameter, admin.site).delete_model(
+                None, product_info.product_parameters.get(parameter__name='cores'))
+
+        self.assertEqual(client.get(reverse('backend:products')).json()['results'], self.legacy_products())
+        entry = CatalogEntry.objects.get(product_info=product_info)
+        self.assertEqual((entry.category_name, entry.product_name), ('ЦП', 'Новое имя'))
+        self.assertEqual(entry.parameters, [{'parameter': 'color', 'value': 'white'}])
+
+    def test_rebuild_catalog(self):
+        import_price_list(self.partner.id, load_shop1())
+        CatalogEntry.objects.all().delete()
+
+        rebuild_catalog()
+
+        self.assertEqual(self.client.get(reverse('backend:products')).json()['results'], self.legacy_products())
+
+
+class KeysetPaginationTests(BackendTestCase):
+
+    def walk(self, client, url, **params):
+        """Обходит все страницы списка и возвращает результаты и число страниц"""
+        results, pages, cursor = [], 0, None
+        while True:
+            response = client.get(url, dict(params, **({'cursor': cursor} if cursor else {}))).json()
+            results += response['results']
+            pages += 1
+            cursor = response['cursor']
+            if not cursor:
+                return results, pages
+
+    def test_products_pages(self):
+        import_price_list(self.partner.id, make_price_list(25))
+
+        results, pages = self.walk(APIClient(), reverse('backend:products'), limit=10)
+
+        self.assertEqual(pages, 3)
+        self.assertEqual([item['id'] for item in results],
+                         list(ProductInfo.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_orders_pages_with_equal_dates(self):
+        import_price_list(self.partner.id, make_price_list(3))
+        buyer = self.make_buyer()
+        product_info = ProductInfo.objects.first()
+        orders = [self.make_order(buyer, [(product_info, 1)]) for _ in range(7)]
+        Order.objects.filter(id__in=[order.id for order in orders[:4]]).update(dt=orders[0].dt)
+
+        results, pages = self.walk(self.make_client(buyer), reverse('backend:order'), limit=3)
+        partner_results, _ = self.walk(self.client, reverse('backend:partner-orders'), limit=2)
+
+        expected = list(Order.objects.order_by('-dt', '-id').values_list('id', flat=True))
+        self.assertEqual(pages, 3)
+        self.assertEqual([order['id'] for order in results], expected)
+        self.assertEqual([order['id'] for order in partner_results], expected)
+
+    def test_invalid_cursor(self):
+        response = APIClient().get(reverse('backend:products'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogCacheTests(BackendTestCase):
+
+    def test_cached_until_import_or_state_change(self):
+        data = make_price_list(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(self.partner.id, data)
+        client = APIClient()
+        url = reverse('backend:products')
+
+        shop_id = Shop.objects.get().id
+
+        first = client.get(url, {'shop_id': shop_id})
+        # из базы читаются только остатки
+        with self.assertNumQueries(1):
+            cached = client.get(url, {'shop_id': shop_id})
+        self.assertEqual(cached.json(), first.json())
+
+        data['goods'][0]['price'] = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(self.partner.id, data)
+        self.assertEqual(client.get(url).json()['results'][0]['price'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('backend:partner-state'), {'state': 'off'})
+        self.assertEqual(client.get(url).json()['results'], [])
+
+    def test_etag_returns_not_modified(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(self.partner.id, make_price_list(3))
+        client = APIClient()
+        url = reverse('backend:products')
+        etag = client.get(url, {'category_id': 1}).headers['ETag']
+
+        with self.assertNumQueries(0):
+            response = client.get(url, {'category_id': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(client.get(url, {'category_id': 2}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(self.partner.id, make_price_list(4))
+        self.assertEqual(client.get(url, {'category_id': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FastSerializerTests(BackendTestCase):
+
+    def test_catalog_entries_match_product_info_serializer(self):
+        import_price_list(self.partner.id, load_shop1())
+        expected = JSONRenderer().render(ProductInfoSerializer(ProductInfo.objects.order_by('id'), many=True).data)
+        rows = CatalogEntry.objects.order_by('product_info_id').values(*CATALOG_ENTRY_VALUES)
+        self.assertEqual(UJSONRenderer().render(serialize_catalog_entries(rows)), expected)
+
+    def test_orders_match_order_serializer(self):
+        import_price_list(self.partner.id, load_shop1())
+        buyer = self.make_buyer()
+        contact = Contact.objects.create(user=buyer, city='Москва', street='Тверская', phone='+70000000000')
+        product_infos = list(ProductInfo.objects.order_by('id'))
+        self.make_order(buyer, [(product_infos[0], 2), (product_infos[1], 1)], state='confirmed')
+        self.make_order(buyer, [(product_infos[2], 3)])
+        Order.objects.filter(state='confirmed').update(contact=contact)
+
+        orders = Order.objects.filter(user=buyer).annotate(total_sum=order_total_sum()).order_by('-id')
+        expected = JSONRenderer().render(OrderSerializer(orders, many=True).data)
+        with self.assertNumQueries(5):
+            body = UJSONRenderer().render(serialize_orders(list(orders.values(*ORDER_VALUES))))
+        self.assertEqual(body, expected)
+
+
+class OrderTotalTests(BackendTestCase):
+
+    def test_totals(self):
+        import_price_list(self.partner.id, make_price_list(3))
+        other = User.objects.create_user(email='shop2@example.com', password='password', type='shop', is_active=True)
+        import_price_list(other.id, make_price_list(2, shop='Shop2'))
+        buyer = self.make_buyer()
+        own, foreign = ProductInfo.objects.get(shop__user=self.partner, external_id=1), \
+            ProductInfo.objects.get(shop__user=other, external_id=2)
+        order = self.make_order(buyer, [(own, 2), (foreign, 3)])
+        self.make_order(buyer, [(own, 1)], state='basket')
+        self.make_order(buyer, [])
+
+        orders = self.make_client(buyer).get(reverse('backend:order')).json()['results']
+        basket = self.make_client(buyer).get(reverse('backend:basket')).json()['results']
+        partner_orders = self.client.get(reverse('backend:partner-orders')).json()['results']
+
+        self.assertEqual([item['total_sum'] for item in orders], [None, 2 * 101 + 3 * 102])
+        self.assertEqual(basket[0]['total_sum'], 101)
+        # магазин видит только сумму своих позиций
+        self.assertEqual([(item['id'], item['total_sum']) for item in partner_orders], [(order.id, 2 * 101)])
+
+    def test_listing_does_not_join_items(self):
+        import_price_list(self.partner.id, make_price_list(10))
+        buyer = self.make_buyer()
+        product_infos = list(ProductInfo.objects.all())
+        for _ in range(5):
+            self.make_order(buyer, [(product_info, 1) for product_info in product_infos])
+
+        queryset = Order.objects.filter(user=buyer).annotate(total_sum=order_total_sum())
+        sql = str(queryset.query).upper()
+        self.assertNotIn('DISTINCT', sql)
+        self.assertEqual(queryset.count(), 5)
+        self.assertEqual({order.total_sum for order in queryset}, {sum(range(101, 111))})
+
+
+class PartnerOrderItemsTests(BackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        import_price_list(self.partner.id, make_price_list(3))
+        self.other = User.objects.create_user(email='shop2@example.com', password='password', type='shop',
+                                              is_active=True)
+        import_price_list(self.other.id, make_price_list(3, shop='Shop2'))
+        self.own = ProductInfo.objects.get(shop__user=self.partner, external_id=1)
+        self.foreign = ProductInfo.objects.get(shop__user=self.other, external_id=1)
+        buyer = self.make_buyer()
+        self.old = self.make_order(buyer, [(self.own, 1), (self.foreign, 1)], state='delivered')
+        Order.objects.filter(id=self.old.id).update(dt=datetime(2024, 1, 10, 12, tzinfo=dt_timezone.utc))
+        self.new = self.make_order(buyer, [(self.own, 2), (self.foreign, 2)])
+        self.make_order(buyer, [(self.own, 3)], state='basket')
+
+    def get(self, **params):
+        return self.client.get(reverse('backend:partner-order-items'), params)
+
+    def test_only_own_items(self):
+        results = self.get().json()['results']
+
+        self.assertEqual([(item['order'], item['quantity']) for item in results], [(self.new.id, 2), (self.old.id, 1)])
+        self.assertEqual(results[0]['product_info'],
+                         ProductInfoSerializer(ProductInfo.objects.get(id=self.own.id)).data)
+        self.assertEqual(results[1]['state'], 'delivered')
+
+    def test_filters(self):
+        self.assertEqual([item['order'] for item in self.get(state='delivered,sent').json()['results']],
+                         [self.old.id])
+        self.assertEqual([item['order'] for item in self.get(date_to='2024-01-10').json()['results']],
+                         [self.old.id])
+        self.assertEqual([item['order'] for item in self.get(date_from='2024-01-11').json()['results']],
+                         [self.new.id])
+        self.assertEqual(self.get(date_from='2024-01-10T13:00:00Z', date_to='2024-01-11').json()['results'], [])
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.get(state='basket').status_code, 400)
+        self.assertEqual(self.get(date_from='yesterday').status_code, 400)
+        self.assertEqual(self.make_client(self.make_buyer('other@example.com')).get(
+            reverse('backend:partner-order-items')).status_code, 403)
+
+
+class BasketBatchTests(BackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        import_price_list(self.partner.id, make_price_list(120))
+        self.product_info_ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+        self.buyer = self.make_buyer()
+        self.buyer_client = self.make_client(self.buyer)
+        self.url = reverse('backend:basket-batch')
+
+    def basket(self):
+        return dict(OrderItem.objects.filter(order__user=self.buyer, order__state='basket').values_list(
+            'product_info_id', 'quantity'))
+
+    def test_upsert_update_delete(self):
+        # токен, корзина (SELECT + INSERT), проверка товаров, один INSERT позиций и точки сохранения транзакций
+        with self.assertNumQueries(9):
+            response = self.buyer_client.post(self.url, {'upsert': [
+                {'product_info': product_info_id, 'quantity': 1} for product_info_id in self.product_info_ids[:100]]},
+                format='json')
+        self.assertEqual(response.json(), {'Status': True, 'deleted': 0, 'upserted': 100, 'updated': 0})
+
+        first, second, third = OrderItem.objects.order_by('id')[:3]
+        response = self.buyer_client.post(self.url, {
+            'upsert': [{'product_info': self.product_info_ids[0], 'quantity': 5},
+                       {'product_info': self.product_info_ids[100], 'quantity': 2}],
+            'update': [{'id': second.id, 'quantity': 7}],
+            'delete': [third.id]}, format='json')
+        self.assertEqual(response.json(), {'Status': True, 'deleted': 1, 'upserted': 2, 'updated': 1})
+
+        basket = self.basket()
+        self.assertEqual(len(basket), 100)
+        self.assertEqual((basket[first.product_info_id], basket[second.product_info_id]), (5, 7))
+        self.assertEqual(basket[self.product_info_ids[100]], 2)
+        self.assertNotIn(third.product_info_id, basket)
+
+    def test_invalid_item_writes_nothing(self):
+        self.buyer_client.post(self.url, {'upsert': [{'product_info': self.product_info_ids[0], 'quantity': 1}]},
+                               format='json')
+        item = OrderItem.objects.get()
+
+        response = self.buyer_client.post(self.url, {
+            'delete': [item.id],
+            'upsert': [{'product_info': self.product_info_ids[1], 'quantity': 1},
+                       {'product_info': 10 ** 6, 'quantity': 1}]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.basket(), {self.product_info_ids[0]: 1})
+        self.assertEqual(self.buyer_client.post(self.url, {'update': '[{"id": 1, "quantity": 0}]'}).status_code, 400)
+
+    def test_basket_post_and_put(self):
+        url = reverse('backend:basket')
+        items = [{'product_info': product_info_id, 'quantity': 2} for product_info_id in self.product_info_ids[:50]]
+        response = self.buyer_client.post(url, {'items': json.dumps(items)})
+        self.assertEqual(response.json(), {'Status': True, 'Создано объектов': 50})
+
+        # повторное добавление не меняет корзину
+        response = self.buyer_client.post(url, {'items': json.dumps(items[:1] + [
+            {'product_info': self.product_info_ids[60], 'quantity': 1}])})
+        self.assertFalse(response.json()['Status'])
+        self.assertEqual(len(self.basket()), 50)
+
+        ids = list(OrderItem.objects.order_by('id').values_list('id', flat=True)[:2])
+        response = self.buyer_client.put(url, {'items': json.dumps([{'id': ids[0], 'quantity': 3},
+                                                                    {'id': ids[1], 'quantity': 4}])})
+        self.assertEqual(response.json(), {'Status': True, 'Обновлено объектов': 2})
+        self.assertEqual(list(OrderItem.objects.filter(id__in=ids).order_by('id').values_list('quantity', flat=True)),
+                         [3, 4])
+
+        for items in (['1'], [{'id': ids[0]}], [{'quantity': 2}], [{'id': str(ids[0]), 'quantity': 2}], {'id': 1}):
+            response = self.buyer_client.put(url, {'items': json.dumps(items)})
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.json()['Status'])
+        self.assertEqual(OrderItem.objects.get(id=ids[0]).quantity, 3)
+
+
+class StockReservationTests(BackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        import_price_list(self.partner.id, make_price_list(2))
+        self.first, self.second = ProductInfo.objects.order_by('id')
+        ProductInfo.objects.filter(id=self.first.id).update(quantity=3)
+        refresh_quantities([self.first.id])
+
+    def place(self, items):
+        buyer = self.make_buyer(f'buyer{Order.objects.count()}@example.com')
+        contact = Contact.objects.create(user=buyer, city='Москва', street='Тверская', phone='+70000000000')
+        order = self.make_order(buyer, items, state='basket')
+        response = self.make_client(buyer).post(reverse('backend:order'), {'id': str(order.id), 'contact': contact.id})
+        return order, response
+
+    def quantities(self):
+        return list(ProductInfo.objects.order_by('id').values_list('quantity', flat=True))
+
+    def test_reserve_and_reject(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order, response = self.place([(self.first, 2), (self.second, 4)])
+        self.assertEqual(response.json(), {'Status': True})
+        self.assertEqual(self.quantities(), [1, 6])
+        self.assertEqual(CatalogEntry.objects.get(product_info=self.first).quantity, 1)
+
+        # второй позиции хватает, но первой нет: заказ целиком остается корзиной
+        order, response = self.place([(self.second, 1), (self.first, 2)])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.quantities(), [1, 6])
+        order.refresh_from_db()
+        self.assertEqual(order.state, 'basket')
+
+    def test_order_is_placed_once(self):
+        order, _ = self.place([(self.first, 1)])
+        order.refresh_from_db()
+        response = self.make_client(order.user).post(reverse('backend:order'),
+                                                      {'id': str(order.id), 'contact': order.contact_id})
+        self.assertFalse(response.json()['Status'])
+        self.assertEqual(self.quantities(), [2, 10])
+
+    def test_release(self):
+        order, _ = self.place([(self.first, 3), (self.second, 10)])
+        self.assertEqual(self.quantities(), [0, 0])
+        release_stock(order.id)
+        self.assertEqual(self.quantities(), [3, 10])
+
+    def test_order_keeps_catalog_etag(self):
+        url = reverse('backend:products')
+        first = APIClient().get(url)
+        self.assertEqual(first.json()['results'][0]['quantity'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place([(self.first, 2)])
+        # ответ берется из кэша, но с текущим остатком
+        second = APIClient().get(url)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.json()['results'][0]['quantity'], 1)
+        self.assertEqual(APIClient().get(url, headers={'If-None-Match': first['ETag']}).status_code, 304)
+
+    def test_release_items_of_one_shop(self):
+        other_shop = User.objects.create_user(email='shop2@example.com', password='password', type='shop',
+                                              is_active=True)
+        import_price_list(other_shop.id, make_price_list(1, shop='Shop2'))
+        foreign = ProductInfo.objects.get(shop__user=other_shop)
+        order, _ = self.place([(self.first, 3), (foreign, 4)])
+
+        self.assertEqual(self.quantities(), [0, 10, 6])
+        release_stock(order.id, shop_user_id=self.partner.id)
+        self.assertEqual(self.quantities(), [3, 10, 6])
+
+
+class FlakyEmailBackend(BaseEmailBackend):
+    """Почтовый бэкенд, который не принимает письма для адресов из fail и считает открытые соединения"""
+
+    def __init__(self, fail=(), **kwargs):
+        super().__init__(**kwargs)
+        self.fail = set(fail)
+        self.opened = 0
+        self.is_open = False
+        self.sent = []
+
+    def open(self):
+        if not self.is_open:
+            self.opened += 1
+            self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            if self.fail & set(message.to):
+                raise SMTPRecipientsRefused({address: (550, b'rejected') for address in message.to})
+            self.sent.append(message)
+        return len(email_messages)
+
+
+class PartnerOrderStateTests(BackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        import_price_list(self.partner.id, make_price_list(2))
+        self.first, self.second = ProductInfo.objects.order_by('id')
+        self.buyer, other_buyer = self.make_buyer(), self.make_buyer('other@example.com')
+        self.orders = [self.make_order(self.buyer, [(self.first, 1)]),
+                       self.make_order(self.buyer, [(self.first, 2), (self.second, 1)]),
+                       self.make_order(other_buyer, [(self.second, 3)], state='confirmed')]
+
+    def post_state(self, orders, state, client=None):
+        return (client or self.client).post(reverse('backend:partner-order-state'),
+                                            {'orders': [order.id for order in orders], 'state': state}, format='json')
+
+    def states(self):
+        return list(Order.objects.filter(id__in=[order.id for order in self.orders]).order_by('id').values_list(
+            'state', flat=True))
+
+    def test_cancel_orders_in_different_states(self):
+        quantities = dict(ProductInfo.objects.values_list('id', 'quantity'))
+        with CaptureQueriesContext(connection) as captured, self.captureOnCommitCallbacks(execute=True):
+            response = self.post_state(self.orders, 'canceled')
+
+        self.assertEqual(response.json(), {'Status': True, 'Updated': 3})
+        self.assertEqual(self.states(), ['canceled'] * 3)
+        updates = [query['sql'] for query in captured if query['sql'].startswith('UPDATE "backend_order"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(ProductInfo.objects.get(id=self.first.id).quantity, quantities[self.first.id] + 3)
+        self.assertEqual(ProductInfo.objects.get(id=self.second.id).quantity, quantities[self.second.id] + 4)
+        self.assertEqual(mail.outbox, [])
+        dispatch_outbox()
+        self.assertEqual(sorted((message.to[0], message.body) for message in mail.outbox), [
+            ('buyer@example.com', f'Заказы {self.orders[0].id}, {self.orders[1].id}: Отменен'),
+            ('other@example.com', f'Заказы {self.orders[2].id}: Отменен')])
+
+    def test_invalid_transition_changes_nothing(self):
+        response = self.post_state(self.orders, 'assembled')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'{self.orders[0].id}, {self.orders[1].id}', response.json()['Errors'])
+        self.assertEqual(self.states(), ['new', 'new', 'confirmed'])
+
+        other_shop = User.objects.create_user(email='shop2@example.com', password='password', type='shop',
+                                              is_active=True)
+        response = self.post_state(self.orders[:1], 'confirmed', self.make_client(other_shop))
+        self.assertIn('не найдены', response.json()['Errors'])
+        self.assertEqual(self.post_state(self.orders[:1], 'confirmed', self.make_client(self.buyer)).status_code, 403)
+        self.assertEqual(OutgoingEmail.objects.count(), 0)
+
+    def test_orders_with_items_of_other_shops(self):
+        other_shop = User.objects.create_user(email='shop2@example.com', password='password', type='shop',
+                                              is_active=True)
+        import_price_list(other_shop.id, make_price_list(1, shop='Shop2'))
+        foreign = ProductInfo.objects.get(shop__user=other_shop)
+        mixed = self.make_order(self.buyer, [(self.first, 1), (foreign, 2)])
+        quantities = dict(ProductInfo.objects.values_list('id', 'quantity'))
+
+        response = self.post_state([self.orders[0], mixed], 'canceled')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'других магазинов: {mixed.id}', response.json()['Errors'])
+        self.assertEqual(Order.objects.get(id=mixed.id).state, 'new')
+        self.assertEqual(self.states(), ['new', 'new', 'confirmed'])
+        self.assertEqual(dict(ProductInfo.objects.values_list('id', 'quantity')), quantities)
+
+        # переходы, не меняющие остатков, доступны каждому магазину заказа
+        self.assertTrue(self.post_state([mixed], 'confirmed').json()['Status'])
+        self.assertTrue(self.post_state([mixed], 'assembled', self.make_client(other_shop)).json()['Status'])
+        self.assertEqual(Order.objects.get(id=mixed.id).state, 'assembled')
+
+
+class OutboxTests(BackendTestCase):
+
+    def test_signals_queue_instead_of_sending(self):
+        User.objects.create_user(email='new@example.com', password='password', type='buyer')
+        new_order.send(sender=self.__class__, user_id=self.partner.id)
+
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(list(OutgoingEmail.objects.values_list('to', 'state')),
+                         [(['new@example.com'], 'queued'), (['shop@example.com'], 'queued')])
+
+        self.assertEqual(dispatch_outbox(), {'sent': 2, 'retried': 0, 'failed': 0})
+        self.assertEqual([message.to for message in mail.outbox], [['new@example.com'], ['shop@example.com']])
+        self.assertFalse(OutgoingEmail.objects.exclude(state='sent').exists())
+
+    def test_request_does_not_send_mail(self):
+        queue_email('Тема', 'Текст', ['waiting@example.com'])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(reverse('backend:user-register'), {
+                'first_name': 'Иван', 'last_name': 'Иванов', 'email': 'new@example.com', 'password': 'Sup3r-secret!',
+                'company': 'Компания', 'position': 'Менеджер'})
+
+        self.assertEqual(response.json()['Status'], True)
+        self.assertTrue(callbacks)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutgoingEmail.objects.filter(state='queued').count(), 2)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_batches_over_one_connection_with_retries(self):
+        for index in range(5):
+            queue_email('Тема', 'Текст', [f'user{index}@example.com'])
+        backend = FlakyEmailBackend(fail={'user1@example.com'})
+
+        self.assertEqual(dispatch_outbox(batch_size=2, connection=backend), {'sent': 4, 'retried': 1, 'failed': 0})
+        # соединение открывается заново только после ошибки
+        self.assertEqual(backend.opened, 2)
+        failed = OutgoingEmail.objects.get(to=['user1@example.com'])
+        self.assertEqual((failed.state, failed.attempts), ('queued', 1))
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+
+        # до конца паузы письмо не отправляется повторно
+        self.assertEqual(dispatch_outbox(connection=backend), {'sent': 0, 'retried': 0, 'failed': 0})
+        OutgoingEmail.objects.filter(id=failed.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatch_outbox(connection=backend), {'sent': 0, 'retried': 0, 'failed': 1})
+        failed.refresh_from_db()
+        self.assertEqual((failed.state, failed.attempts), ('failed', 2))
+        self.assertIn('rejected', failed.error)
+
+
+class TokenCacheTests(BackendTestCase):
+
+    def test_cached_after_first_request(self):
+        url = reverse('backend:user-details')
+        # токен и пользователь, затем профиль пользователя с контактами
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(url).json()['email'], 'shop@example.com')
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).json()['email'], 'shop@example.com')
+
+        stats = token_cache.stats()
+        self.assertEqual((stats['misses'], stats['local_hits'], stats['hit_ratio']), (1, 1, 0.5))
+
+    def test_token_rotation_and_deactivation(self):
+        url = reverse('backend:user-details')
+        self.client.get(url)
+
+        Token.objects.filter(user=self.partner).delete()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        client = self.make_client(self.partner)
+        client.get(url)
+        self.partner.is_active = False
+        self.partner.save()
+        self.assertEqual(client.get(url).status_code, 401)
+
+    def test_changes_of_request_user_are_not_shared(self):
+        url = reverse('backend:user-details')
+        self.client.post(url, {'first_name': 'Иван'})
+        self.assertEqual(self.client.get(url).json()['first_name'], 'Иван')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                               'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                          'LOCATION': 'tokens'}})
+    def test_shared_tier(self):
+        shared_cache = TokenCache(10, 30, 'tokens', 300)
+        key = Token.objects.get(user=self.partner).key
+        shared_cache.set(key, 'entry')
+
+        other_process = TokenCache(10, 30, 'tokens', 300)
+        self.assertEqual(other_process.get(key), 'entry')
+        self.assertEqual(other_process.stats()['shared_hits'], 1)
+        shared_cache.invalidate([key])
+        self.assertIsNone(TokenCache(10, 30, 'tokens', 300).get(key))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                               'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                          'LOCATION': 'tokens'}})
+    def test_password_is_not_cached(self):
+        key = Token.objects.get(user=self.partner).key
+        token_cache.shared_alias = 'tokens'
+        try:
+            self.client.get(reverse('backend:user-details'))
+        finally:
+            token_cache.shared_alias = settings.AUTH_TOKEN_SHARED_CACHE
+        created, values = caches['tokens'].get(TokenCache.shared_key(key))
+
+        self.assertEqual(values, (self.partner.id, 'shop@example.com', True, 'shop'))
+        self.assertNotIn(self.partner.password, values)
+
+
+class DirectoryCacheTests(BackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(self.partner.id, make_price_list(3))
+
+    def test_categories_cached_until_import(self):
+        client = APIClient()
+        url = reverse('backend:categories')
+        first = client.get(url)
+        self.assertEqual([category['name'] for category in first.json()['results']], ['Процессоры', 'Видеокарты'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url).json(), first.json())
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=first.headers['ETag']).status_code, 304)
+
+        data = make_price_list(3, shop='Shop2')
+        data['categories'].append({'id': 3, 'name': 'Память'})
+        other = User.objects.create_user(email='shop2@example.com', password='password', type='shop',
+                                         is_active=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(other.id, data)
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=first.headers['ETag'])
+        self.assertEqual(response.json()['count'], 3)
+        shop_id = Shop.objects.get(user=self.partner).id
+        self.assertEqual(client.get(url, {'shop_id': shop_id}).json()['count'], 2)
+        self.assertEqual(client.get(url, {'shop_id': 'x'}).status_code, 400)
+
+    def test_shops_follow_partner_state(self):
+        client = APIClient()
+        url = reverse('backend:shops')
+        self.assertEqual([shop['name'] for shop in client.get(url).json()['results']], ['Shop1'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('backend:partner-state'), {'state': 'off'})
+        self.assertEqual(client.get(url).json()['results'], [])
+
+
+class ProductSearchTests(BackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(self.partner.id, load_shop1())
+
+    def names(self, **params):
+        response = APIClient().get(reverse('backend:products-search'), params)
+        return sorted(item['product']['name'] for item in response.json()['results'])
+
+    @staticmethod
+    def backend_names():
+        """Бэкенды поиска, доступные на тестовой базе: индекс в памяти и полнотекстовый индекс базы"""
+        return ['python'] + ([connection.vendor] if connection.vendor in SEARCH_BACKENDS else [])
+
+    def test_backends_find_the_same(self):
+        expected = {
+            'amd': ['AMD Radeon RX 6800 XT', 'AMD Ryzen 7 5800X'],
+            'AM4': ['AMD Ryzen 7 5800X', 'ASUS ROG Strix B550-F'],
+            'ryz': ['AMD Ryzen 7 5800X'],
+            'amd rx': ['AMD Radeon RX 6800 XT'],
+            'i7-10700k': ['Intel Core i7-10700K'],
+            '3.8 ghz': ['AMD Ryzen 7 5800X', 'Intel Core i7-10700K'],
+            # ищутся только значения параметров, не их названия
+            'socket': [],
+            'нет такого': [],
+        }
+        for name in self.backend_names():
+            with self.subTest(backend=name), override_settings(SEARCH_BACKEND=name):
+                self.assertEqual({q: self.names(q=q) for q in expected}, expected)
+                self.assertEqual(self.names(q='am4', param='socket:AM4', price_max=20000), ['ASUS ROG Strix B550-F'])
+                self.assertEqual(self.names(price_min=75000), ['AMD Radeon RX 6800 XT', 'NVIDIA GeForce RTX 3080'])
+
+    def test_backends_follow_import(self):
+        data = load_shop1()
+        data['goods'][0]['name'] = 'Intel Core i9-10900K'
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(self.partner.id, data)
+
+        for name in self.backend_names():
+            with self.subTest(backend=name), override_settings(SEARCH_BACKEND=name):
+                self.assertEqual(self.names(q='i9'), ['Intel Core i9-10900K'])
+                self.assertEqual(self.names(q='i7 10700k'), ['Intel Core i9-10900K'])
+
+    def test_facets(self):
+        response = APIClient().get(reverse('backend:products-search'), {'category_id': 1})
+        self.assertEqual(response.json()['facets'], {
+            'categories': [{'id': 1, 'name': 'Процессоры', 'count': 2}],
+            'parameters': {
+                'cores': [{'value': '8', 'count': 2}],
+                'frequency': [{'value': '3.8 GHz', 'count': 2}],
+                'socket': [{'value': 'AM4', 'count': 1}, {'value': 'LGA1200', 'count': 1}],
+                'threads': [{'value': '16', 'count': 2}],
+            },
+            'price': {'min': 28000, 'max': 30000},
+        })
+        self.assertEqual(APIClient().get(reverse('backend:products-search'), {'param': 'socket'}).status_code, 400)
+
+
+class AttributeFilterTests(BackendTestCase):
+
+    def test_normalize_value(self):
+        self.assertEqual(normalize_value('3.8 GHz'), (3.8, 'ghz'))
+        self.assertEqual(normalize_value('3800 МГц'), (3.8, 'ghz'))
+        self.assertEqual(normalize_value('8'), (8.0, ''))
+        self.assertEqual(normalize_value('0,5 TB'), (512.0, 'gb'))
+        self.assertEqual(normalize_value('LGA1200'), (None, ''))
+        self.assertEqual(normalize_value('5 лет гарантии от производителя'), (None, ''))
+
+    def test_import_and_admin_save_normalize(self):
+        import_price_list(self.partner.id, load_shop1())
+        self.assertEqual(set(ProductParameter.objects.filter(parameter__name='frequency').values_list(
+            'value_num', 'unit')), {(3.8, 'ghz')})
+
+        product_parameter = ProductParameter.objects.filter(parameter__name='cores').first()
+        product_parameter.value = '12'
+        product_parameter.save()
+        self.assertEqual(ProductParameter.objects.get(id=product_parameter.id).value_num, 12)
+
+    def test_products_filter(self):
+        data = load_shop1()
+        data['goods'][1]['parameters']['frequency'] = '3400 MHz'
+        data['goods'][0]['parameters']['cores'] = '10'
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(self.partner.id, data)
+
+        def names(*attributes):
+            response = APIClient().get(reverse('backend:products'), {'attr': attributes})
+            return sorted(item['product']['name'] for item in response.json()['results'])
+
+        self.assertEqual(names('cores:9..'), ['Intel Core i7-10700K'])
+        self.assertEqual(names('cores:8'), ['AMD Ryzen 7 5800X'])
+        self.assertEqual(names('frequency:3.5..4 GHz'), ['Intel Core i7-10700K'])
+        self.assertEqual(names('frequency:3000 MHz..3.5'), ['AMD Ryzen 7 5800X'])
+        self.assertEqual(names('frequency:..4', 'cores:..8'), ['AMD Ryzen 7 5800X'])
+        self.assertEqual(APIClient().get(reverse('backend:products'), {'attr': 'cores:много'}).status_code, 400)
+
+
+class EndpointBenchmarkTests(BackendTestCase):
+
+    def test_query_budgets_do_not_depend_on_scale(self):
+        counts = []
+        for products in (30, 120):
+            context = prepare_benchmark(products=products, buyers=2, orders_per_buyer=products // 10)
+            results = run_endpoint_benchmarks(context, repeat=1)
+            self.assertEqual([result['endpoint'] for result in results if not result['ok']], [])
+            counts.append({result['endpoint']: result['queries'] for result in results})
+        self.assertEqual(counts[0], counts[1])
+
+
+class ExplainTests(BackendTestCase):
+
+    def scans(self, queryset):
+        with capture_statements() as statements:
+            list(queryset)
+        return [table for sql, params in statements.items() for table, _ in full_scans(sql, params)]
+
+    def test_order_lists_use_indexes(self):
+        placed = Order.objects.exclude(state='basket').order_by('-dt', '-id')
+        self.assertEqual(self.scans(placed.filter(user_id=1)[:21]), [])
+        self.assertEqual(self.scans(placed[:21]), [])
+        self.assertEqual(self.scans(Parameter.objects.filter(name__in=['cores'])), [])
+
+    def test_full_scans_of_subqueries_name_the_table(self):
+        queryset = Order.objects.filter(id__in=OrderItem.objects.filter(quantity=1).values('order_id'))
+        self.assertIn('backend_orderitem', self.scans(queryset))
+
+    def test_unsupported_database(self):
+        with mock.patch.object(connection, 'vendor', 'oracle'):
+            with self.assertRaisesMessage(ValueError, 'Планы запросов oracle не поддерживаются'):
+                full_scans('SELECT 1', ())
+            with self.assertRaisesMessage(CommandError, 'Query plans of oracle are not supported'):
+                call_command('explain_endpoints', products=10, stdout=io.StringIO())
+
+
+class MetricsTests(BackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def test_prometheus_endpoint(self):
+        url = reverse('backend:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        APIClient().get(reverse('backend:shops'))
+        self.partner.is_staff = True
+        self.partner.save()
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('http_requests_total{view="backend:shops",method="GET",status="200"} 1', body)
+        self.assertIn('db_queries_per_request_bucket{view="backend:shops",le="1"} 1', body)
+        self.assertIn('auth_token_cache_lookups_total{result="miss"} 2', body)
+
+        with override_settings(METRICS_TOKEN='scraper'):
+            self.assertEqual(APIClient().get(url, HTTP_AUTHORIZATION='Bearer scraper').status_code, 200)
+            self.assertEqual(APIClient().get(url, HTTP_AUTHORIZATION='Bearer other').status_code, 403)
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0, METRICS_SLOW_SAMPLE_RATE=1, METRICS_N_PLUS_ONE_THRESHOLD=3)
+    def test_duplicate_queries_and_slow_log(self):
+        def view(request):
+            for shop_id in range(3):
+                list(Shop.objects.filter(name=f'secret-{shop_id}'))
+            return HttpResponse()
+
+        with self.assertLogs('backend.metrics', 'WARNING') as logs:
+            InstrumentationMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('3 executions of SELECT', logs.output[0])
+        self.assertIn('Slow request GET unmatched', logs.output[1])
+        self.assertIn('FROM "backend_shop"', logs.output[1])
+        self.assertNotIn('secret', logs.output[1])
+        self.assertIn('db_duplicate_queries_total{view="unmatched"} 2', render_metrics())
+
+
+class SettingsCheckTests(TestCase):
+
+    @staticmethod
+    def run_check(eager, **caches):
+        with override_settings(CELERY_TASK_ALWAYS_EAGER=eager, CACHES={
+                alias: {'BACKEND': f'django.core.cache.backends.{backend}'} for alias, backend in caches.items()}):
+            return [error.id for error in check_worker_caches(None) + check_replica_cache(None)]
+
+    def test_worker_needs_shared_cache(self):
+        self.assertEqual(self.run_check(False, default='locmem.LocMemCache'), ['backend.E001'])
+        self.assertEqual(self.run_check(True, default='locmem.LocMemCache'), [])
+        self.assertEqual(self.run_check(False, default='redis.RedisCache'), [])
+        with override_settings(CATALOG_CACHE='catalog'):
+            self.assertEqual(self.run_check(False, default='redis.RedisCache', catalog='locmem.LocMemCache'),
+                             ['backend.E002'])
+
+    def test_replicas_need_shared_cache(self):
+        with override_settings(DATABASE_REPLICAS=['replica1']):
+            self.assertEqual(self.run_check(True, default='locmem.LocMemCache'), ['backend.E003'])
+            self.assertEqual(self.run_check(True, default='redis.RedisCache'), [])
+
+
+# replica1 в тестах - зеркало тестовой базы default (settings.DATABASES): данные на ней те же, поэтому
+# маршрутизация проверяется по запросам, ушедшим в ее соединение. Зеркало - отдельное соединение и видит
+# только зафиксированные данные, поэтому тесты идут без общей транзакции
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_SECONDS=60)
+class ReplicaRoutingTests(BackendTestMixin, TransactionTestCase):
+    databases = {'default', 'replica1'}
+
+    def replica_queries(self, request):
+        """Выполняет запрос и возвращает число SQL-запросов, ушедших на реплику"""
+        with CaptureQueriesContext(connections['replica1']) as queries:
+            response = request()
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_catalog_reads_replica_after_sticky_window(self):
+        import_price_list(self.partner.id, load_shop1())
+        self.assertEqual(self.replica_queries(lambda: APIClient().get(reverse('backend:products'))), 0)
+        self.assertEqual(self.replica_queries(lambda: APIClient().get(reverse('backend:shops'))), 0)
+
+        # окно после сброса кэшей прошло: ответы строятся заново по реплике
+        cache.clear()
+        self.assertGreater(self.replica_queries(lambda: APIClient().get(reverse('backend:products'))), 0)
+        self.assertGreater(self.replica_queries(lambda: APIClient().get(reverse('backend:shops'))), 0)
+
+    def test_orders_read_your_writes(self):
+        import_price_list(self.partner.id, load_shop1())
+        buyer = self.make_buyer()
+        product_info = ProductInfo.objects.first()
+        client = self.make_client(buyer)
+        self.assertGreater(self.replica_queries(lambda: client.get(reverse('backend:order'))), 0)
+
+        client.post(reverse('backend:basket'), {'items': json.dumps([{'product_info': product_info.id,
+                                                                       'quantity': 1}])})
+        self.assertEqual(self.replica_queries(lambda: client.get(reverse('backend:order'))), 0)
+
+
+@override_settings(ROOT_URLCONF='netology_pd_diplom.asgi_urls')
+class AsyncViewTests(BackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.buyer = self.make_buyer()
+        self.token = Token.objects.create(user=self.buyer).key
+
+    def get_both(self, url, data=None, token=None):
+        """Возвращает ответы синхронного и асинхронного представлений на один запрос с холодным кэшем"""
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        cache.clear()
+        sync_response = APIClient().get(url, data, headers=headers)
+        cache.clear()
+        async_response = async_to_sync(AsyncClient().get)(url, data, headers=headers)
+        self.assertEqual(async_response.resolver_match.namespace, 'backend-async')
+        return sync_response, async_response
+
+    def assertSameResponse(self, url, data=None, token=None):
+        sync_response, async_response = self.get_both(url, data, token)
+        self.assertEqual((async_response.status_code, async_response.content),
+                         (sync_response.status_code, sync_response.content))
+        # поколение кэша после очистки новое, поэтому совпадает только наличие ETag
+        self.assertEqual('ETag' in async_response, 'ETag' in sync_response)
+
+    def test_responses_match_sync_views(self):
+        import_price_list(self.partner.id, load_shop1())
+        product_infos = list(ProductInfo.objects.order_by('id'))
+        self.make_order(self.buyer, [(product_infos[0], 2), (product_infos[1], 1)])
+        self.make_order(self.buyer, [(product_infos[2], 1)], state='confirmed')
+
+        self.assertSameResponse(reverse('backend:products'), {'limit': 2})
+        self.assertSameResponse(reverse('backend:products'), {'category_id': 1, 'attr': 'cores:8..'})
+        self.assertSameResponse(reverse('backend:products'), {'attr': 'cores:много'})
+        self.assertSameResponse(reverse('backend:categories'), {'shop_id': Shop.objects.get().id})
+        self.assertSameResponse(reverse('backend:categories'), {'shop_id': 'x'})
+        self.assertSameResponse(reverse('backend:shops'))
+        self.assertSameResponse(reverse('backend:order'), token=self.token)
+        self.assertSameResponse(reverse('backend:order'))
+        self.assertSameResponse(reverse('backend:order'), token='invalid')
+
+    def test_errors_match_sync_views(self):
+        url = reverse('backend:products')
+        for headers in ({'Authorization': 'Token invalid'}, {'Authorization': 'Token'}):
+            sync_response = APIClient().get(url, headers=headers)
+            async_response = async_to_sync(AsyncClient().get)(url, headers=headers)
+            self.assertEqual(sync_response.status_code, 401)
+            self.assertEqual((async_response.status_code, async_response.content, async_response['WWW-Authenticate']),
+                             (sync_response.status_code, sync_response.content, sync_response['WWW-Authenticate']))
+
+        url, headers = reverse('backend:partner-update'), {'Authorization': 'Token invalid'}
+        sync_response = APIClient().post(url, {'url': 'x'}, headers=headers)
+        async_response = async_to_sync(AsyncClient().post)(url, {'url': 'x'}, headers=headers)
+        self.assertEqual((async_response.status_code, async_response.content),
+                         (sync_response.status_code, sync_response.content))
+
+    def test_other_methods_go_to_sync_views(self):
+        import_price_list(self.partner.id, load_shop1())
+        product_info = ProductInfo.objects.first()
+        headers = {'Authorization': f'Token {self.token}'}
+        async_to_sync(AsyncClient().post)(reverse('backend:basket'), {
+            'items': json.dumps([{'product_info': product_info.id, 'quantity': 1}])}, headers=headers)
+        contact = Contact.objects.create(user=self.buyer, city='Москва', street='Тверская', phone='+70000000000')
+        basket = Order.objects.get(user=self.buyer, state='basket')
+
+        response = async_to_sync(AsyncClient().post)(reverse('backend:order'), {
+            'id': basket.id, 'contact': contact.id}, headers=headers)
+        self.assertEqual(response.json()['Status'], True)
+        self.assertEqual(Order.objects.get(id=basket.id).state, 'new')
+
+    def test_partner_update(self):
+        headers = {'Authorization': f'Token {Token.objects.get(user=self.partner).key}'}
+        with open(SHOP1_YAML, 'rb') as file, PriceListServer({'/shop1.yaml': (file.read(), 'text/yaml')}) as server:
+            response = async_to_sync(AsyncClient().post)(reverse('backend:partner-update'),
+                                                         {'url': server.url('/shop1.yaml')}, headers=headers)
+        self.assertEqual(ImportJob.objects.get(id=response.json()['Job']).state, 'done')
+        self.assertEqual(ProductInfo.objects.count(), len(load_shop1()['goods']))
+        self.assertEqual(async_to_sync(AsyncClient().post)(reverse('backend:partner-update')).status_code, 403)
@@ -2,24 +2,33 @@ from django.urls import path
 from django_rest_passwordreset.views import reset_password_request_token, reset_password_confirm
 
 from backend.views import PartnerUpdate, RegisterAccount, LoginAccount, CategoryView, ShopView, ProductInfoView, \
-    BasketView, AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount
+    BasketView, AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount, \
+    PartnerUpdateStatus, PartnerOrderItems, BasketBatch, TokenCacheStats, \
+    ProductSearchView, MetricsView, PartnerOrderState
 
 app_name = 'backend'
 
 urlpatterns = [
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/update/<int:job_id>', PartnerUpdateStatus.as_view(), name='partner-update-status'),
     path('partner/state', PartnerState.as_view(), name='partner-state'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
+    path('partner/orders/items', PartnerOrderItems.as_view(), name='partner-order-items'),
+    path('partner/orders/state', PartnerOrderState.as_view(), name='partner-order-state'),
     path('user/register', RegisterAccount.as_view(), name='user-register'),
     path('user/register/confirm', ConfirmAccount.as_view(), name='user-register-confirm'),
     path('user/details', AccountDetails.as_view(), name='user-details'),
     path('user/contact', ContactView.as_view(), name='user-contact'),
     path('user/login', LoginAccount.as_view(), name='user-login'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('metrics/token-cache', TokenCacheStats.as_view(), name='token-cache-stats'),
     path('user/password_reset', reset_password_request_token, name='password-reset'),
     path('user/password_reset/confirm', reset_password_confirm, name='password-reset-confirm'),
     path('categories', CategoryView.as_view(), name='categories'),
     path('shops', ShopView.as_view(), name='shops'),
-    path('products', ProductInfoView.as_view(), name='shops'),
+    path('products', ProductInfoView.as_view(), name='products'),
+    path('products/search', ProductSearchView.as_view(), name='products-search'),
     path('basket', BasketView.as_view(), name='basket'),
+    path('basket/batch', BasketBatch.as_view(), name='basket-batch'),
     path('order', OrderView.as_view(), name='order'),
 ]
\ No newline at end of file
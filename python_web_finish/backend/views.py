@@ -1,25 +1,47 @@
+from datetime import datetime, time, timedelta
 from distutils.util import strtobool
 from rest_framework.request import Request
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
-from django.db import IntegrityError
-from django.db.models import Q, Sum, F
-from django.http import JsonResponse
-from requests import get
+from django.db import IntegrityError, transaction
+from django.db.models import Q, F
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
 from rest_framework.generics import ListAPIView
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from ujson import loads as load_json
-from yaml import load as load_yaml, Loader
 
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken
-from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductInfoSerializer, \
-    OrderItemSerializer, OrderSerializer, ContactSerializer
-from backend.signals import new_user_registered, new_order
+from backend.attributes import parse_attribute_filter
+from backend.authentication import token_cache
+from backend.basket import add_items, change_basket, clean_quantities, parse_items, update_items
+from backend.cache import catalog_cache, catalog_scope, not_modified
+from backend.catalog import fill_quantities, refresh_shop_state
+from backend.directory import directory_etag, get_directory
+from backend.fast_serializers import CATALOG_ENTRY_VALUES, ORDER_VALUES, ORDER_ITEM_VALUES, \
+    serialize_catalog_entries, serialize_orders, serialize_order_items
+from backend.importer import PriceListImporter
+from backend.metrics import render_metrics
+from backend.models import User, Shop, Order, OrderItem, Contact, ConfirmEmailToken, ImportJob, CatalogEntry, \
+    order_total_sum, STATE_CHOICES
+from backend.order_states import change_order_states, clean_order_ids
+from backend.pagination import KeysetPagination
+from backend.parsers import FORMATS
+from backend.renderers import UJSONRenderer
+from backend.routers import ReplicaReadMixin
+from backend.search import facets, search
+from backend.serializers import UserSerializer, ShopSerializer, \
+    ContactSerializer, ImportJobSerializer
+from backend.signals import new_user_registered, new_order, order_states_changed
+from backend.stock import InsufficientStock, place_order
+from backend.tasks import import_price_list_task
 
 
 class RegisterAccount(APIView):
@@ -118,7 +140,9 @@ class AccountDetails(APIView):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
 
-        serializer = UserSerializer(request.user)
+        # в request.user из кэша токенов только id, email, is_active и type
+        user = User.objects.prefetch_related('contacts').get(id=request.user.id)
+        serializer = UserSerializer(user)
         return Response(serializer.data)
 
     # Редактирование методом POST
@@ -134,6 +158,7 @@ class AccountDetails(APIView):
         """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        user = User.objects.get(id=request.user.id)
         # проверяем обязательные аргументы
 
         if 'password' in request.data:
@@ -148,10 +173,10 @@ class AccountDetails(APIView):
                     error_array.append(item)
                 return JsonResponse({'Status': False, 'Errors': {'password': error_array}})
             else:
-                request.user.set_password(request.data['password'])
+                user.set_password(request.data['password'])
 
         # проверяем остальные данные
-        user_serializer = UserSerializer(request.user, data=request.data, partial=True)
+        user_serializer = UserSerializer(user, data=request.data, partial=True)
         if user_serializer.is_valid():
             user_serializer.save()
             return JsonResponse({'Status': True})
@@ -187,57 +212,192 @@ class LoginAccount(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class CategoryView(ListAPIView):
-    """Класс для просмотра категорий"""
-    queryset = Category.objects.all()
-    serializer_class = CategorySerializer
+class DirectoryView(ReplicaReadMixin, ListAPIView):
+    """Базовый класс для справочников, которые отдаются из backend.directory
 
+    Attributes:
+    - directory: Имя справочника.
+    """
+    directory = None
+    replica_scope = 'directory'
+
+    def get_directory_params(self, request):
+        """Возвращает параметры справочника из запроса"""
+        return {}
+
+    def list(self, request, *args, **kwargs):
+        """
+        Retrieve a page of the precomputed directory.
+
+        A matching If-None-Match header gets 304 without reading the directory.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - Response: A page of the directory with its ETag.
+        """
+        params = self.get_directory_params(request)
+        etag = directory_etag(self.directory, page=request.query_params.get('page', ''), host=request.get_host(),
+                              **params)
+        if not_modified(request, etag):
+            return Response(status=304, headers={'ETag': etag})
 
-class ShopView(ListAPIView):
+        page = self.paginate_queryset(get_directory(self.directory, **params))
+        response = self.get_paginated_response(page)
+        response['ETag'] = etag
+        return response
+
+
+class CategoryView(DirectoryView):
+    """Класс для просмотра категорий, всех или одного магазина (параметр shop_id)"""
+    directory = 'categories'
+
+    def get_directory_params(self, request):
+        shop_id = request.query_params.get('shop_id', '')
+        if shop_id and not shop_id.isdigit():
+            raise ParseError('Неправильно указан магазин')
+        return {'shop_id': int(shop_id)} if shop_id else {}
+
+
+class ShopView(DirectoryView):
     """Класс для просмотра списка магазинов"""
-    queryset = Shop.objects.filter(state=True)
-    serializer_class = ShopSerializer
+    directory = 'shops'
 
 
-class ProductInfoView(APIView):
+class ProductInfoView(ReplicaReadMixin, APIView):
     """A class for searching products.
 
     Methods:
     - get: Retrieve the product information based on the specified filters.
 
     Attributes:
-    - None
+    - renderer_classes: The ujson renderer, the response has no floats.
+    - replica_scope: GET reads from a replica unless the catalog cache was reset recently.
     """
+    renderer_classes = (UJSONRenderer, BrowsableAPIRenderer)
+    replica_scope = 'catalog'
 
     def get(self, request: Request, *args, **kwargs):
         """
         Retrieve the product information based on the specified filters.
 
+        The data is read from the CatalogEntry projection maintained by backend.catalog and cached
+        in backend.cache.catalog_cache; a matching If-None-Match header gets 304 without touching the database.
+        The stock is not cached: a cached page gets the current quantities by one query.
+
         Args:
         - request (Request): The Django request object.
 
         Returns:
-        - Response: The response containing the product information.
+        - Response: A keyset-paginated page of the product information.
+        """
+        params = self.cache_params(request.query_params)
+        cache_key, etag = catalog_cache.key(catalog_scope(params.get('shop_id')),
+                                            dict(params, host=request.get_host()))
+        if not_modified(request, etag):
+            return Response(status=304, headers={'ETag': etag})
+
+        data = catalog_cache.get(cache_key)
+        if data is None:
+            try:
+                queryset = self.catalog_queryset(request.query_params)
+            except ValueError:
+                return JsonResponse({'Status': False, 'Errors': 'Неправильно указан фильтр attr'}, status=400)
+
+            paginator = KeysetPagination(ordering=('product_info_id',))
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            data = paginator.get_paginated_response(serialize_catalog_entries(page)).data
+            catalog_cache.set(cache_key, data)
+        else:
+            fill_quantities(data['results'])
+
+        return Response(data, headers={'ETag': etag})
+
+    @staticmethod
+    def cache_params(query_params):
+        """Возвращает нормализованные фильтры и курсор запроса, по которым кэшируется ответ"""
+        params = {name: query_params[name] for name in ('shop_id', 'category_id', 'cursor', 'limit')
+                  if query_params.get(name)}
+        attributes = sorted(query_params.getlist('attr'))
+        if attributes:
+            params['attr'] = '|'.join(attributes)
+        return params
+
+    @staticmethod
+    def catalog_queryset(query_params):
+        """
+        Build the catalog rows matching the filters of a request.
+
+        Args:
+        - query_params (QueryDict): The request parameters shop_id, category_id and attr.
+
+        Returns:
+        - QuerySet: The CatalogEntry .values() rows with CATALOG_ENTRY_VALUES.
+
+        Raises:
+        - ValueError: If an attr filter is invalid.
         """
-        query = Q(shop__state=True)
-        shop_id = request.query_params.get('shop_id')
-        category_id = request.query_params.get('category_id')
+        query = Q(shop_state=True)
+        if query_params.get('shop_id'):
+            query = query & Q(shop_id=query_params['shop_id'])
 
-        if shop_id:
-            query = query & Q(shop_id=shop_id)
+        if query_params.get('category_id'):
+            query = query & Q(category_id=query_params['category_id'])
 
-        if category_id:
-            query = query & Q(product__category_id=category_id)
+        # фильтры по числовым параметрам (attr=cores:8.., attr=frequency:3.5..4 GHz) идут по индексу
+        # (parameter, value_num)
+        for attribute in query_params.getlist('attr'):
+            query = query & parse_attribute_filter(attribute)
 
-        # фильтруем и отбрасываем дуликаты
-        queryset = ProductInfo.objects.filter(
-            query).select_related(
-            'shop', 'product__category').prefetch_related(
-            'product_parameters__parameter').distinct()
+        # читаем из денормализованного каталога, без join-ов
+        return CatalogEntry.objects.filter(query).values(*CATALOG_ENTRY_VALUES)
 
-        serializer = ProductInfoSerializer(queryset, many=True)
 
-        return Response(serializer.data)
+class ProductSearchView(APIView):
+    """A class for the full-text and faceted search of products.
+
+    Methods:
+    - get: Search the catalog and count the facets of the result.
+
+    Attributes:
+    - renderer_classes: The ujson renderer, the response has no floats.
+    """
+    renderer_classes = (UJSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request: Request, *args, **kwargs):
+        """
+        Search the catalog by words, category, shop, price range and parameters.
+
+        Query parameters:
+        - q: The words to search in names, models and parameter values.
+        - category_id, shop_id: The category and the shop.
+        - price_min, price_max: The price range, both inclusive.
+        - param: 'name:value' of a parameter, may be repeated.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - Response: A keyset-paginated page of the products with the category, parameter and price facets.
+        """
+        try:
+            numbers = {name: int(request.query_params[name])
+                       for name in ('category_id', 'shop_id', 'price_min', 'price_max')
+                       if request.query_params.get(name)}
+            parameters = [tuple(param.split(':', 1)) for param in request.query_params.getlist('param')]
+        except ValueError:
+            return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'}, status=400)
+        if any(len(param) != 2 for param in parameters):
+            return JsonResponse({'Status': False, 'Errors': 'Параметр указывается как name:value'}, status=400)
+
+        queryset = search(request.query_params.get('q', ''), parameters=parameters, **numbers)
+
+        paginator = KeysetPagination(ordering=('product_info_id',))
+        page = paginator.paginate_queryset(queryset.values(*CATALOG_ENTRY_VALUES), request, view=self)
+        response = paginator.get_paginated_response(serialize_catalog_entries(page))
+        response.data['facets'] = facets(queryset)
+        return response
 
 
 class BasketView(APIView):
@@ -250,8 +410,9 @@ class BasketView(APIView):
     - delete: Remove an item from the user's basket.
 
     Attributes:
-    - None
+    - renderer_classes: The ujson renderer, the response has no floats.
     """
+    renderer_classes = (UJSONRenderer, BrowsableAPIRenderer)
 
     # получить корзину
     def get(self, request, *args, **kwargs):
@@ -262,19 +423,16 @@ class BasketView(APIView):
         - request (Request): The Django request object.
 
         Returns:
-        - Response: The response containing the items in the user's basket.
+        - Response: A keyset-paginated page with the user's basket.
         """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
 
-        basket = Order.objects.filter(
-            user_id=request.user.id, state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        basket = Order.objects.filter(user_id=request.user.id, state='basket').annotate(total_sum=order_total_sum())
 
-        serializer = OrderSerializer(basket, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(ordering=('-id',))
+        page = paginator.paginate_queryset(basket.values(*ORDER_VALUES), request, view=self)
+        return paginator.get_paginated_response(serialize_orders(page))
 
     # редактировать корзину
     def post(self, request, *args, **kwargs):
@@ -293,25 +451,16 @@ class BasketView(APIView):
         items_sting = request.data.get('items')
         if items_sting:
             try:
-                items_dict = load_json(items_sting)
-            except ValueError:
-                return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+                quantities = clean_quantities(parse_items(items_sting), 'product_info')
+            except ValueError as error:
+                return JsonResponse({'Status': False, 'Errors': str(error)})
             else:
                 basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
-                objects_created = 0
-                for order_item in items_dict:
-                    order_item.update({'order': basket.id})
-                    serializer = OrderItemSerializer(data=order_item)
-                    if serializer.is_valid():
-                        try:
-                            serializer.save()
-                        except IntegrityError as error:
-                            return JsonResponse({'Status': False, 'Errors': str(error)})
-                        else:
-                            objects_created += 1
-
-                    else:
-                        return JsonResponse({'Status': False, 'Errors': serializer.errors})
+                try:
+                    with transaction.atomic():
+                        objects_created = add_items(basket.id, quantities)
+                except (ValueError, IntegrityError) as error:
+                    return JsonResponse({'Status': False, 'Errors': str(error)})
 
                 return JsonResponse({'Status': True, 'Создано объектов': objects_created})
 
@@ -365,22 +514,57 @@ class BasketView(APIView):
         items_sting = request.data.get('items')
         if items_sting:
             try:
-                items_dict = load_json(items_sting)
-            except ValueError:
-                return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+                # позиции должны быть словарями с целыми id и quantity
+                quantities = clean_quantities(parse_items(items_sting), 'id')
+            except ValueError as error:
+                return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
             else:
                 basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
-                objects_updated = 0
-                for order_item in items_dict:
-                    if type(order_item['id']) == int and type(order_item['quantity']) == int:
-                        objects_updated += OrderItem.objects.filter(order_id=basket.id, id=order_item['id']).update(
-                            quantity=order_item['quantity'])
+                objects_updated = update_items(basket.id, quantities)
 
                 return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated})
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
+class BasketBatch(APIView):
+    """Класс для пакетного изменения корзины
+
+    Methods:
+    - post: Upsert, update and delete many basket items at once.
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        Upsert, update and delete many basket items in one transaction.
+
+        The request has optional 'upsert' ([{'product_info': id, 'quantity': n}]), 'update'
+        ([{'id': id, 'quantity': n}]) and 'delete' ([id]) lists, as JSON or JSON strings of a form.
+        Nothing is written if any item is invalid.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - JsonResponse: The numbers of upserted, updated and deleted items or the errors.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if not {'upsert', 'update', 'delete'} & set(request.data):
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+        try:
+            changes = {name: parse_items(request.data[name]) for name in ('upsert', 'update', 'delete')
+                       if name in request.data}
+            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+            result = change_basket(basket.id, **changes)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+
+        return JsonResponse({'Status': True, **result})
+
+
 class PartnerUpdate(APIView):
     """A class for updating partner information.
 
@@ -393,7 +577,12 @@ class PartnerUpdate(APIView):
 
     def post(self, request, *args, **kwargs):
         """
-        Update the partner price list information.
+        Queue an import of the partner price list.
+
+        The import runs in a background task, its progress is available at partner/update/<job_id>.
+        The 'mode' argument selects 'sync' (default, writes only the differences) or 'replace'.
+        The optional 'format' argument is one of 'yaml', 'jsonl' and 'csv', by default it is detected from the URL.
+        In the sync mode a price list that has not changed since the last import is not imported again.
 
         Args:
         - request (Request): The Django request object.
@@ -401,45 +590,78 @@ class PartnerUpdate(APIView):
         Returns:
         - JsonResponse: The response indicating the status of the operation and any errors.
         """
+        job, error = self.check_request(request.user, request.data)
+        if error:
+            return error
+
+        job.save()
+        transaction.on_commit(lambda: import_price_list_task.delay(job.id))
+        return JsonResponse({'Status': True, 'Job': job.id})
+
+    @staticmethod
+    def check_request(user, data):
+        """
+        Validate an import request.
+
+        Args:
+        - user (User): The user of the request.
+        - data (dict): The request data with 'url', 'mode' and 'format'.
+
+        Returns:
+        - tuple: An unsaved ImportJob and None, or None and the error response.
+        """
+        if not user.is_authenticated:
+            return None, JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if user.type != 'shop':
+            return None, JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        url = data.get('url')
+        mode = data.get('mode', 'sync')
+        if mode not in PriceListImporter.MODES:
+            return None, JsonResponse({'Status': False, 'Errors': f'Неизвестный режим импорта: {mode}'})
+
+        price_list_format = data.get('format', '')
+        if price_list_format and price_list_format not in FORMATS:
+            return None, JsonResponse(
+                {'Status': False, 'Errors': f'Неизвестный формат прайс-листа: {price_list_format}'})
+
+        if not url:
+            return None, JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+        try:
+            URLValidator()(url)
+        except ValidationError as e:
+            return None, JsonResponse({'Status': False, 'Error': str(e)})
+        return ImportJob(user_id=user.id, url=url, mode=mode, format=price_list_format), None
+
+
+class PartnerUpdateStatus(APIView):
+    """Класс для получения статуса задачи импорта прайс-листа"""
+
+    def get(self, request, job_id, *args, **kwargs):
+        """
+        Retrieve the state, progress and statistics of an import job.
+
+        Args:
+        - request (Request): The Django request object.
+        - job_id (int): The ID of the import job.
+
+        Returns:
+        - Response: The response containing the import job.
+        """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
 
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
-        url = request.data.get('url')
-        if url:
-            validate_url = URLValidator()
-            try:
-                validate_url(url)
-            except ValidationError as e:
-                return JsonResponse({'Status': False, 'Error': str(e)})
-            else:
-                stream = get(url).content
-
-                data = load_yaml(stream, Loader=Loader)
-
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id)
-                for category in data['categories']:
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data['goods']:
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                    product_info = ProductInfo.objects.create(product_id=product.id, external_id=item['id'],
-                                                              model=item['model'], price=item['price'],
-                                                              price_rrc=item['price_rrc'], quantity=item['quantity'],
-                                                              shop_id=shop.id)
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id, value=value)
-
-                return JsonResponse({'Status': True})
+        job = ImportJob.objects.filter(id=job_id, user_id=request.user.id).first()
+        if not job:
+            return JsonResponse({'Status': False, 'Errors': 'Задача импорта не найдена'}, status=404)
 
-        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data)
 
 
 class PartnerState(APIView):
@@ -494,6 +716,7 @@ class PartnerState(APIView):
         if state:
             try:
                 Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                refresh_shop_state(request.user.id)
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -507,8 +730,9 @@ class PartnerOrders(APIView):
     - get: Retrieve the orders associated with the authenticated partner.
 
     Attributes:
-    - None
+    - renderer_classes: The ujson renderer, the response has no floats.
     """
+    renderer_classes = (UJSONRenderer, BrowsableAPIRenderer)
 
     def get(self, request, *args, **kwargs):
         """
@@ -518,7 +742,7 @@ class PartnerOrders(APIView):
         - request (Request): The Django request object.
 
         Returns:
-        - Response: The response containing the orders associated with the partner.
+        - Response: A keyset-paginated page of the orders associated with the partner.
         """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
@@ -526,14 +750,132 @@ class PartnerOrders(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
+        # заказы с позициями магазина выбираются подзапросом, а не join, поэтому строки не дублируются
         order = Order.objects.filter(
-            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+            id__in=OrderItem.objects.filter(product_info__shop__user_id=request.user.id).values('order_id')).exclude(
+            state='basket').annotate(total_sum=order_total_sum(shop_user_id=request.user.id))
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(ordering=('-dt', '-id'))
+        page = paginator.paginate_queryset(order.values(*ORDER_VALUES), request, view=self)
+        return paginator.get_paginated_response(serialize_orders(page))
+
+
+class PartnerOrderState(APIView):
+    """Класс для пакетной смены статуса заказов поставщиком
+
+    Methods:
+    - post: Move many orders to a new state.
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        Move the orders with items of the partner to a new state.
+
+        The request has 'orders' - a list of order IDs as JSON or a JSON string of a form - and 'state'.
+        The allowed transitions are new -> confirmed -> assembled -> sent -> delivered and cancelation before
+        sending; nothing is written if any order cannot move. Every buyer gets one notification.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - JsonResponse: The number of changed orders or the errors.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        if not {'orders', 'state'}.issubset(request.data):
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+        try:
+            order_ids = clean_order_ids(parse_items(request.data['orders']))
+            # письма попадают в outbox в одной транзакции со сменой статусов
+            with transaction.atomic():
+                changes = change_order_states(request.user.id, order_ids, request.data['state'])
+                order_states_changed.send(sender=self.__class__, changes=changes, state=request.data['state'])
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+
+        return JsonResponse({'Status': True, 'Updated': len(order_ids)})
+
+
+class PartnerOrderItems(APIView):
+    """Класс для получения позиций заказов поставщиком
+
+    Лента читает только позиции товаров магазина (индекс по product_info и order), поэтому ее
+    стоимость зависит от оборота самого магазина, а не всей площадки.
+
+    Methods:
+    - get: Retrieve the ordered items of the partner's shop.
+
+    Attributes:
+    - renderer_classes: The ujson renderer, the response has no floats.
+    """
+    renderer_classes = (UJSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, *args, **kwargs):
+        """
+        Retrieve the ordered items of the partner's shop, newest orders first.
+
+        Query parameters:
+        - state: Comma-separated order states, all but 'basket' by default.
+        - date_from, date_to: The period of the order date, ISO dates or datetimes, both inclusive.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - Response: A keyset-paginated page of the ordered items.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        states = {state for state, _ in STATE_CHOICES} - {'basket'}
+        state = request.query_params.get('state')
+        if state:
+            if not set(state.split(',')) <= states:
+                return JsonResponse({'Status': False, 'Errors': 'Неправильно указан статус'}, status=400)
+            states = set(state.split(','))
+
+        try:
+            period = self.period_filter(request.query_params.get('date_from'), request.query_params.get('date_to'))
+        except ValueError:
+            return JsonResponse({'Status': False, 'Errors': 'Неправильно указана дата'}, status=400)
+
+        items = OrderItem.objects.filter(
+            period, product_info__shop_id=Shop.objects.filter(user_id=request.user.id).values('id')[:1],
+            order__state__in=states).annotate(state=F('order__state'), dt=F('order__dt'))
+
+        paginator = KeysetPagination(ordering=('-dt', '-id'))
+        page = paginator.paginate_queryset(items.values(*ORDER_ITEM_VALUES), request, view=self)
+        return paginator.get_paginated_response(serialize_order_items(page))
+
+    @staticmethod
+    def period_filter(date_from, date_to):
+        """Строит условие на дату заказа; дата без времени в date_to включает весь день"""
+        condition = Q()
+        for value, lookup in ((date_from, 'gte'), (date_to, 'lte')):
+            if not value:
+                continue
+            day = parse_date(value)
+            if day is not None:
+                if lookup == 'lte':
+                    day, lookup = day + timedelta(days=1), 'lt'
+                moment = datetime.combine(day, time.min)
+            else:
+                moment = parse_datetime(value)
+                if moment is None:
+                    raise ValueError(value)
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            condition &= Q(**{f'order__dt__{lookup}': moment})
+        return condition
 
 
 class ContactView(APIView):
@@ -654,7 +996,7 @@ class ContactView(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class OrderView(APIView):
+class OrderView(ReplicaReadMixin, APIView):
     """Класс для получения и размещения заказов пользователями
     Methods:
     - get: Retrieve the details of a specific order.
@@ -663,8 +1005,9 @@ class OrderView(APIView):
     - delete: Delete a specific order.
 
     Attributes:
-    - None
+    - renderer_classes: The ujson renderer, the response has no floats.
     """
+    renderer_classes = (UJSONRenderer, BrowsableAPIRenderer)
 
     # получить мои заказы
     def get(self, request, *args, **kwargs):
@@ -675,24 +1018,22 @@ class OrderView(APIView):
         - request (Request): The Django request object.
 
         Returns:
-        - Response: The response containing the details of the order.
+        - Response: A keyset-paginated page of the user orders.
         """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
 
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        order = Order.objects.filter(user_id=request.user.id).exclude(state='basket').annotate(
+            total_sum=order_total_sum())
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(ordering=('-dt', '-id'))
+        page = paginator.paginate_queryset(order.values(*ORDER_VALUES), request, view=self)
+        return paginator.get_paginated_response(serialize_orders(page))
 
     # разместить заказ из корзины
     def post(self, request, *args, **kwargs):
         """
-        Put an order and send a notification.
+        Put an order, reserving the stock of all its items, and send a notification.
 
         Args:
         - request (Request): The Django request object.
@@ -706,16 +1047,57 @@ class OrderView(APIView):
         if {'id', 'contact'}.issubset(request.data):
             if request.data['id'].isdigit():
                 try:
-                    is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data['id']).update(
-                        contact_id=request.data['contact'],
-                        state='new')
+                    is_updated = place_order(request.user.id, request.data['id'], request.data['contact'])
                 except IntegrityError as error:
                     print(error)
                     return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
+                except InsufficientStock as error:
+                    return JsonResponse({'Status': False, 'Errors': str(error)}, status=409)
                 else:
                     if is_updated:
                         new_order.send(sender=self.__class__, user_id=request.user.id)
                         return JsonResponse({'Status': True})
 
-        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
\ No newline at end of file
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+
+class TokenCacheStats(APIView):
+    """Класс для получения метрик кэша токенов авторизации"""
+
+    def get(self, request, *args, **kwargs):
+        """
+        Retrieve the hit ratio and the counters of the token cache of this process.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - JsonResponse: The token cache counters.
+        """
+        if not request.user.is_authenticated or not request.user.is_staff:
+            return JsonResponse({'Status': False, 'Error': 'Только для администраторов'}, status=403)
+
+        return JsonResponse(token_cache.stats())
+
+
+class MetricsView(APIView):
+    """Класс для выгрузки метрик процесса в формате Prometheus"""
+
+    def get(self, request, *args, **kwargs):
+        """
+        Retrieve the request, database and token cache metrics of this process.
+
+        Available to staff users and to a scraper that sends settings.METRICS_TOKEN as a Bearer token.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - HttpResponse: The metrics in the Prometheus text format.
+        """
+        scraper_token = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+        if not (request.user.is_authenticated and request.user.is_staff) and not (
+                settings.METRICS_TOKEN and constant_time_compare(scraper_token, settings.METRICS_TOKEN)):
+            return JsonResponse({'Status': False, 'Error': 'Только для администраторов'}, status=403)
+
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
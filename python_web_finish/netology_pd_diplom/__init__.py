@@ -0,0 +1,3 @@
+from netology_pd_diplom.celery import app as celery_app
+
+__all__ = ('celery_app',)
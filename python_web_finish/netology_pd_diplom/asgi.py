@@ -0,0 +1,32 @@
+"""
+ASGI config for netology_pd_diplom project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+e.g. ``uvicorn netology_pd_diplom.asgi:application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+from django.core.handlers.asgi import ASGIHandler
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'netology_pd_diplom.settings')
+# под ASGI синхронный код каждого запроса выполняется в своем потоке, и постоянные соединения
+# таких потоков не переиспользуются, поэтому по умолчанию соединение закрывается после запроса
+os.environ.setdefault('CONN_MAX_AGE', '0')
+
+
+class ASGIApplication(ASGIHandler):
+    """ASGI-обработчик, который направляет запросы в netology_pd_diplom.asgi_urls"""
+    urlconf = 'netology_pd_diplom.asgi_urls'
+
+    async def get_response_async(self, request):
+        request.urlconf = self.urlconf
+        return await super().get_response_async(request)
+
+
+django.setup(set_prefix=False)
+application = ASGIApplication()
@@ -0,0 +1,12 @@
+"""URL configuration of the ASGI application.
+
+The async views of backend.async_urls take over their paths, the rest is routed as in
+netology_pd_diplom.urls, so reverse() gives the same URLs under WSGI and ASGI.
+"""
+from django.urls import include, path
+
+from netology_pd_diplom.urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('api/v1/', include('backend.async_urls', namespace='backend-async')),
+] + wsgi_urlpatterns
@@ -0,0 +1,15 @@
+"""
+Celery application for netology_pd_diplom project.
+
+Start a worker with ``celery -A netology_pd_diplom worker``.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'netology_pd_diplom.settings')
+
+app = Celery('netology_pd_diplom')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
+
 import dj_database_url
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -43,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.InstrumentationMiddleware',
+    'backend.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,19 +79,91 @@ WSGI_APPLICATION = 'netology_pd_diplom.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# соединения живут CONN_MAX_AGE секунд и переиспользуются запросами одного потока;
+# перед повторным использованием соединение проверяется (CONN_HEALTH_CHECKS)
+CONN_MAX_AGE = int(os.environ.get('CONN_MAX_AGE', 60))
+
 DATABASE_URL = os.environ.get('DATABASE_URL')
 if DATABASE_URL:
     DATABASES = {
-        'default': dj_database_url.parse(DATABASE_URL)
+        'default': dj_database_url.parse(DATABASE_URL, conn_max_age=CONN_MAX_AGE, conn_health_checks=True)
     }
 else:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
         }
     }
 
+# реплики для чтения через запятую; на них идут GET-запросы представлений с ReplicaReadMixin
+# (backend.routers), кроме пользователей, которые меняли данные в последние REPLICA_STICKY_SECONDS секунд
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{index}'] = dj_database_url.parse(url, conn_max_age=CONN_MAX_AGE, conn_health_checks=True)
+    DATABASES[f'replica{index}']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+# без заданных реплик тесты маршрутизации (backend.tests.ReplicaRoutingTests) читают через реплику-зеркало
+# default: тестовый раннер не создает для нее отдельной базы, а подключает к тестовой базе default
+if not DATABASE_REPLICAS and sys.argv[1:2] == ['test']:
+    DATABASES['replica1'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['backend.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# кэш общий для веб-процессов и воркеров Celery (в docker-compose - Redis): через него воркер сообщает прогресс
+# импорта; кэш в памяти процесса допустим только вместе с CELERY_TASK_ALWAYS_EAGER (backend.checks)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# кэш ответов каталога (/products), сбрасывается импортом прайс-листа и сменой статуса магазина;
+# как и default, должен быть общим с воркерами Celery
+CATALOG_CACHE = os.environ.get('CATALOG_CACHE', 'default')
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 3600))
+
+# поиск по каталогу (backend.search): 'auto' выбирает FTS5 на SQLite и tsvector на PostgreSQL,
+# 'python' - индекс в памяти процесса
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+
+# кэш токенов авторизации (backend.authentication): LRU в памяти процесса и, если задан алиас,
+# общий кэш; TIMEOUT ограничивает, сколько другие процессы видят отозванный токен
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT', 30))
+AUTH_TOKEN_SHARED_CACHE = os.environ.get('AUTH_TOKEN_SHARED_CACHE')
+AUTH_TOKEN_SHARED_CACHE_TIMEOUT = int(os.environ.get('AUTH_TOKEN_SHARED_CACHE_TIMEOUT', 300))
+
+# метрики запросов (backend.metrics, /api/v1/metrics): запросы дольше METRICS_SLOW_REQUEST_MS пишутся
+# в лог backend.metrics вместе с SQL, но только выбранная доля METRICS_SLOW_SAMPLE_RATE; повтор одного SQL
+# METRICS_N_PLUS_ONE_THRESHOLD раз за запрос считается N+1. METRICS_TOKEN - Bearer-токен для Prometheus
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_SLOW_REQUEST_MS = int(os.environ.get('METRICS_SLOW_REQUEST_MS', 500))
+METRICS_SLOW_SAMPLE_RATE = float(os.environ.get('METRICS_SLOW_SAMPLE_RATE', 0.1))
+METRICS_SLOW_SQL_LIMIT = 50
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', 10))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'backend': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -135,6 +211,33 @@ EMAIL_PORT = '465'
 EMAIL_USE_SSL = True
 SERVER_EMAIL = EMAIL_HOST_USER
 
+# очередь исходящих писем (backend.outbox): размер пачки, число попыток, начальная пауза между попытками
+# и время, на которое письмо забирается отправителем (в секундах)
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 60
+OUTBOX_LEASE = 300
+
+# загрузка прайс-листов (backend.fetcher): таймауты соединения и чтения, предельное время всей загрузки,
+# предельный размер после распаковки gzip/deflate и число соединений в пуле на хост (в секундах и байтах)
+PRICE_LIST_CONNECT_TIMEOUT = float(os.environ.get('PRICE_LIST_CONNECT_TIMEOUT', 5))
+PRICE_LIST_READ_TIMEOUT = float(os.environ.get('PRICE_LIST_READ_TIMEOUT', 30))
+PRICE_LIST_FETCH_DEADLINE = float(os.environ.get('PRICE_LIST_FETCH_DEADLINE', 300))
+PRICE_LIST_MAX_BYTES = int(os.environ.get('PRICE_LIST_MAX_BYTES', 100 * 1024 * 1024))
+PRICE_LIST_COMPRESSION = os.environ.get('PRICE_LIST_COMPRESSION', 'True') == 'True'
+PRICE_LIST_POOL_SIZE = 10
+
+# задачи выполняет воркер (celery -A netology_pd_diplom worker); CELERY_TASK_ALWAYS_EAGER=True выполняет их
+# прямо в процессе веб-сервера - только для разработки без воркера, тесты включают его сами (TEST_RUNNER)
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'memory://')
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+# письма, отложенные после ошибки, отправляются периодической задачей (celery worker -B или celery beat)
+CELERY_BEAT_SCHEDULE = {
+    'send-outbox': {'task': 'backend.tasks.send_outbox_task', 'schedule': OUTBOX_RETRY_DELAY},
+}
+
+TEST_RUNNER = 'netology_pd_diplom.test_runner.CeleryEagerTestRunner'
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 40,
@@ -145,7 +248,7 @@ REST_FRAMEWORK = {
     ),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'backend.authentication.CachedTokenAuthentication',
     ),
 }
 
@@ -0,0 +1,22 @@
+"""
+Test runner for netology_pd_diplom project.
+
+Tests run Celery tasks in the test process, like a worker sharing its database and caches.
+"""
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class CeleryEagerTestRunner(DiscoverRunner):
+    """DiscoverRunner, который выполняет задачи Celery сразу при вызове delay"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Celery читает настройки CELERY_* из django.conf.settings при каждом обращении
+        self.eager_settings = override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+        self.eager_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.eager_settings.disable()
+        super().teardown_test_environment(**kwargs)